@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from MDSGraphQLRequest import MDSGraphQLRequest
+
+
+class AsyncMDSGraphQLRequest:
+    __slots__ = [
+        "mds_http_graphql",
+        "concurrency",
+        "executor",
+    ]
+
+    def __init__(self, endpoint, http_auth_token, **kwargs):
+        """
+        Initializes an asyncio GraphQL client, with the same request contract as MDSGraphQLRequest.
+        The requests are made by a pooled MDSGraphQLRequest in a pool of threads, so up to
+        concurrency requests are in flight at once, each one on its own kept-alive connection.
+        :param str endpoint: The GraphQL endpoint
+        :param str http_auth_token: The Hasura admin secret
+        :param dict kwargs: (Optional) The concurrency (the maximum number of requests in flight,
+        usually ATD_MDS_MAX_THREADS), any other argument is passed to MDSGraphQLRequest.
+        """
+        logging.debug("AsyncMDSGraphQLRequest::__init__() Initializing async HTTP GraphQL Request")
+        self.concurrency = max(int(kwargs.pop("concurrency", None) or kwargs.get("pool_size", None) or 10), 1)
+        kwargs["pool_size"] = self.concurrency
+        self.mds_http_graphql = MDSGraphQLRequest(endpoint=endpoint, http_auth_token=http_auth_token, **kwargs)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="AsyncMDSGraphQLRequest"
+        )
+
+    def __del__(self):
+        """
+        Make sure the threads and connections are released whenever the class is destructed.
+        :return:
+        """
+        try:
+            self.close()
+        except:
+            pass
+
+    def close(self):
+        """
+        Stops the threads, and closes the connections.
+        :return:
+        """
+        if getattr(self, "executor", None) is not None:
+            self.executor.shutdown(wait=False)
+        if getattr(self, "mds_http_graphql", None) is not None:
+            self.mds_http_graphql.close()
+
+    def get_config(self) -> dict:
+        """
+        Returns a dictionary with the loaded settings for this class.
+        :return dict:
+        """
+        config = self.mds_http_graphql.get_config()
+        config["concurrency"] = self.concurrency
+        return config
+
+    async def request(self, query, variables=None) -> dict:
+        """
+        Makes a GraphQL HTTP request to an endpoint, returns a dictionary with the response.
+        :param str query: The GraphQL query
+        :param dict variables: (Optional) The values of the variables declared in the query
+        :return dict:
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self.mds_http_graphql.request, query, variables)
+        )
+
+    async def gather_requests(self, requests, concurrency=None, return_exceptions=False) -> list:
+        """
+        Makes many requests, with at most concurrency of them in flight at once.
+        Returns the responses in the same order as the requests.
+        :param list requests: Tuples of query and variables (or None)
+        :param int concurrency: (Optional) The maximum number of requests in flight, by default the one of the class
+        :param bool return_exceptions: (Optional) If True, a failed request returns its exception instead of raising it
+        :return list:
+        """
+        semaphore = asyncio.Semaphore(min(int(concurrency or self.concurrency), self.concurrency))
+
+        async def bounded_request(query, variables):
+            async with semaphore:
+                return await self.request(query, variables)
+
+        return await asyncio.gather(
+            *[bounded_request(query, variables) for query, variables in requests],
+            return_exceptions=return_exceptions,
+        )
+
+    def run_requests_sync(self, requests, concurrency=None, return_exceptions=False) -> list:
+        """
+        Runs gather_requests() from synchronous code, and returns the responses. It starts its own event loop,
+        so it can't be called while an event loop is running in this thread: use await gather_requests() there.
+        :param list requests: Tuples of query and variables (or None)
+        :param int concurrency: (Optional) The maximum number of requests in flight
+        :param bool return_exceptions: (Optional) If True, a failed request returns its exception instead of raising it
+        :return list:
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(
+                self.gather_requests(
+                    requests, concurrency=concurrency, return_exceptions=return_exceptions
+                )
+            )
+        raise Exception(
+            "AsyncMDSGraphQLRequest::run_requests_sync() An event loop is already running, await gather_requests() instead"
+        )
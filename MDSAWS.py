@@ -1,15 +1,60 @@
+import base64
+import codecs
 import json
 import logging
+import os
+import re
+import struct
+import zlib
 import boto3
 from cryptography.fernet import Fernet
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+try:
+    # The zstd compression, if installed
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class MDSAWS:
+    # The size of the chunks read from a streamed object
+    STREAM_CHUNK_SIZE = 1024 * 1024
+
+    # The encrypted files start with a header: the magic bytes, the version, the compression codec (since
+    # version 2) and a random nonce prefix. Then, the frames: the length of a chunk followed by the chunk
+    # encrypted with AES-GCM. The nonce of each chunk has its number and whether it is the last one, so the
+    # chunks can't be reordered or dropped. The document is compressed before it is encrypted.
+    ENCRYPTION_MAGIC = b"MDSAWS"
+    ENCRYPTION_VERSION = 2
+    ENCRYPTION_VERSIONS = [1, 2]
+    ENCRYPTION_PREFIX_SIZE = 7
+    ENCRYPTION_CHUNK_SIZE = 1024 * 1024
+
+    # The compression codecs of the encrypted files, and their id in the header
+    COMPRESSION_CODECS = {None: 0, "gzip": 1, "zstd": 2}
+    DEFAULT_COMPRESSION = "gzip"
+    GZIP_LEVEL = 5
+    ZSTD_LEVEL = 3
+
+    # The size of the parts of a multipart upload, S3 requires at least 5 MB
+    MULTIPART_SIZE = 8 * 1024 * 1024
+
+    # The whitespace between json tokens
+    JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    # The characters that can follow a json value
+    JSON_DELIMITERS = frozenset(",:]} \t\n\r")
+
     __slots__ = [
         "aws_default_region",
         "aws_access_key_id",
         "aws_secret_access_key",
         "cipher_suite",
+        "stream_cipher",
         "bucket_name",
         "client",
         "json_document",
@@ -43,6 +88,9 @@ class MDSAWS:
         self.cipher_suite = (
             Fernet(encryption_key.encode()) if encryption_key is not None else None
         )
+        self.stream_cipher = (
+            self.get_stream_cipher(encryption_key) if encryption_key is not None else None
+        )
         # Initialize Client and json document
         self.initialize_client()
 
@@ -96,12 +144,18 @@ class MDSAWS:
             json_document if self.is_json_valid(data=json_document) else None
         )
 
-    def save(self, file_path, json_document=None, encrypted=False) -> dict:
+    def save(
+        self, file_path, json_document=None, encrypted=False, compression=DEFAULT_COMPRESSION, stream_encrypted=True
+    ) -> dict:
         """
         The directory and file name (s3 key) to be saved on S3
         :param str file_path: The path and file name desired to store in s3
         :param str json_document: A shortcut in case you want to replace the current json_document
         :param bool encrypted: True if the json document needs to be encrypted before saving.
+        :param str compression: (Optional) The codec that compresses an encrypted document before it is
+        encrypted: 'gzip' (default), 'zstd' (requires the zstandard library) or None.
+        :param bool stream_encrypted: (Optional) Set to False to encrypt the document as a single fernet token
+        (not compressed), the format that the readers older than the chunked encryption can read.
         :return dict: The response from S3
         """
         if json_document:
@@ -110,8 +164,23 @@ class MDSAWS:
         if self.client is None:
             raise Exception("MDSAWS::save() Client is not initialized")
 
+        if encrypted and not stream_encrypted:
+            encrypted_document = self.encrypt(self.json_document)
+            if encrypted_document is None:
+                raise Exception("MDSAWS::save() Unable to encrypt the document")
+            return self.client.put_object(
+                Bucket=self.bucket_name,
+                Body=encrypted_document,
+                Key=file_path,
+            )
+
         if encrypted:
-            self.json_document = self.encrypt(self.json_document)
+            return self.upload_chunks(
+                file_path=file_path,
+                chunks=self.encrypt_stream(
+                    self.encode_chunks(self.json_document), compression=compression
+                ),
+            )
 
         return self.client.put_object(
             Bucket=self.bucket_name,
@@ -119,6 +188,62 @@ class MDSAWS:
             Key=file_path,
         )
 
+    def upload_chunks(self, file_path, chunks) -> dict:
+        """
+        Uploads a file provided in chunks of bytes, in parts of MULTIPART_SIZE bytes. A file smaller
+        than a part is uploaded in a single request. Returns the response from S3.
+        :param str file_path: The path and file name desired to store in s3
+        :param iterable chunks: The chunks of bytes of the file
+        :return dict:
+        """
+        part, upload_id, parts = bytearray(), None, []
+        try:
+            for chunk in chunks:
+                part += chunk
+                if len(part) < self.MULTIPART_SIZE:
+                    continue
+                if upload_id is None:
+                    upload_id = self.client.create_multipart_upload(
+                        Bucket=self.bucket_name, Key=file_path
+                    )["UploadId"]
+                parts.append(self.upload_part(file_path, upload_id, len(parts) + 1, bytes(part)))
+                part = bytearray()
+
+            if upload_id is None:
+                return self.client.put_object(Bucket=self.bucket_name, Body=bytes(part), Key=file_path)
+            if len(part) > 0:
+                parts.append(self.upload_part(file_path, upload_id, len(parts) + 1, bytes(part)))
+            return self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=file_path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket_name, Key=file_path, UploadId=upload_id
+                )
+            raise
+
+    def upload_part(self, file_path, upload_id, part_number, body) -> dict:
+        """
+        Uploads a part of a multipart upload, returns the part as expected by complete_multipart_upload.
+        :param str file_path: The path and file name desired to store in s3
+        :param str upload_id: The id of the multipart upload
+        :param int part_number: The number of the part, starting from 1
+        :param bytes body: The content of the part
+        :return dict:
+        """
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=file_path,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
     def load(self, file_path) -> dict:
         """
         Downloads a file from S3 based on bucket and key parameters. It requires credentials.
@@ -131,7 +256,12 @@ class MDSAWS:
             raise Exception("MDSAWS::load() Client is not initialized")
         try:
             data = self.client.get_object(Bucket=self.bucket_name, Key=file_path)
-            contents = data["Body"].read().decode()
+            chunks = self.read_byte_chunks(data["Body"])
+            first = next(chunks, b"")
+            if self.is_stream_encrypted(first):
+                return json.loads(b"".join(self.decrypt_stream(self.chain_chunks(first, chunks))))
+
+            contents = (first + b"".join(chunks)).decode()
 
             if self.is_encrypted(contents):
                 contents = self.decrypt(contents)
@@ -140,6 +270,181 @@ class MDSAWS:
         except:
             return {}
 
+    def load_items(self, file_path, path=("data", "trips")):
+        """
+        Downloads a json document from S3 and yields the items of one of its arrays as they are parsed, the
+        default is the trips of an MDS payload. Only the item being parsed is kept in memory, the encrypted
+        documents are decrypted as they are downloaded (the legacy ones are decrypted as a whole first).
+        Unlike load(), it raises an exception if the file can't be read, or the array is not found.
+        :param str file_path: The path to the file in the S3 bucket
+        :param tuple path: (Optional) The keys of the objects that lead to the array
+        :return:
+        """
+        if self.client is None:
+            raise Exception("MDSAWS::load_items() Client is not initialized")
+        data = self.client.get_object(Bucket=self.bucket_name, Key=file_path)
+        byte_chunks = self.read_byte_chunks(data["Body"])
+        first = next(byte_chunks, b"")
+        if self.is_stream_encrypted(first):
+            return self.stream_json_items(
+                self.decode_chunks(self.decrypt_stream(self.chain_chunks(first, byte_chunks))),
+                path=path,
+            )
+
+        chunks = self.decode_chunks(self.chain_chunks(first, byte_chunks))
+        first = next(chunks, "")
+        if self.is_encrypted(first):
+            contents = self.decrypt(first + "".join(chunks))
+            if contents is None:
+                raise Exception("MDSAWS::load_items() The file could not be decrypted")
+            chunks = (
+                contents[pos:pos + self.STREAM_CHUNK_SIZE]
+                for pos in range(0, len(contents), self.STREAM_CHUNK_SIZE)
+            )
+        else:
+            chunks = self.chain_chunks(first, chunks)
+        return self.stream_json_items(chunks, path=path)
+
+    @classmethod
+    def read_byte_chunks(cls, body, chunk_size=None):
+        """
+        Yields the bytes of a stream in chunks.
+        :param StreamingBody body: The body of an S3 object, or any file-like object
+        :param int chunk_size: (Optional) The number of bytes read at a time
+        :return:
+        """
+        while True:
+            chunk = body.read(chunk_size or cls.STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    @classmethod
+    def read_text_chunks(cls, body, chunk_size=None):
+        """
+        Yields the text of a stream of utf-8 bytes in chunks.
+        :param StreamingBody body: The body of an S3 object, or any file-like object
+        :param int chunk_size: (Optional) The number of bytes read at a time
+        :return:
+        """
+        return cls.decode_chunks(cls.read_byte_chunks(body, chunk_size=chunk_size))
+
+    @staticmethod
+    def decode_chunks(chunks):
+        """
+        Yields the text of chunks of utf-8 bytes, a character may be split across chunks.
+        :param iterable chunks: The chunks of bytes
+        :return:
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    @classmethod
+    def encode_chunks(cls, text):
+        """
+        Yields the utf-8 bytes of a string in chunks of about ENCRYPTION_CHUNK_SIZE.
+        :param str text: The string
+        :return:
+        """
+        for pos in range(0, len(text), cls.ENCRYPTION_CHUNK_SIZE):
+            yield text[pos:pos + cls.ENCRYPTION_CHUNK_SIZE].encode()
+
+    @staticmethod
+    def chain_chunks(first, chunks):
+        """
+        Yields a chunk, followed by the rest of the chunks.
+        :param str first: The first chunk
+        :param iterator chunks: The rest of the chunks
+        :return:
+        """
+        if first:
+            yield first
+        yield from chunks
+
+    @classmethod
+    def stream_json_items(cls, chunks, path=("data", "trips")):
+        """
+        Yields the items of an array in a json document provided in chunks of text, as soon as each one is
+        complete. The array is found by the keys of path, any other value on the way is parsed and skipped,
+        and the rest of the document after the array is not read.
+        :param iterable chunks: The chunks of text of the json document
+        :param tuple path: The keys of the objects that lead to the array
+        :return:
+        """
+        decoder = json.JSONDecoder()
+        chunks = iter(chunks)
+        # The text read so far, the position of the next character to parse, and whether all chunks were read
+        state = {"buffer": "", "pos": 0, "eof": False}
+
+        def read_more(size=0) -> bool:
+            # Reads at least size more characters, returns False if there is nothing else to read
+            parts, read = [state["buffer"][state["pos"]:]], 0
+            while not state["eof"] and (read == 0 or read < size):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    state["eof"] = True
+                else:
+                    parts.append(chunk)
+                    read += len(chunk)
+            state["buffer"], state["pos"] = "".join(parts), 0
+            return read > 0
+
+        def peek() -> str:
+            # Skips the whitespace and returns the next character, without consuming it
+            while True:
+                state["pos"] = cls.JSON_WHITESPACE.match(state["buffer"], state["pos"]).end()
+                if state["pos"] < len(state["buffer"]):
+                    return state["buffer"][state["pos"]]
+                if not read_more():
+                    raise Exception("MDSAWS::stream_json_items() Unexpected end of the document")
+
+        def consume(expected) -> str:
+            character = peek()
+            if character not in expected:
+                raise Exception(f"MDSAWS::stream_json_items() Expected one of '{expected}', found '{character}'")
+            state["pos"] += 1
+            return character
+
+        def parse_value():
+            # A value may continue in the next chunk (a number), it is complete if a delimiter follows it
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(state["buffer"], state["pos"])
+                    if state["eof"] or state["buffer"][end:end + 1] in cls.JSON_DELIMITERS:
+                        state["pos"] = end
+                        return value
+                except ValueError:
+                    if state["eof"]:
+                        raise
+                # Reading as much as the value so far keeps the number of attempts low on large values
+                read_more(len(state["buffer"]) - state["pos"])
+
+        for key in path:
+            consume("{")
+            if peek() == "}":
+                raise Exception(f"MDSAWS::stream_json_items() The key '{key}' was not found")
+            while parse_value() != key:
+                consume(":")
+                parse_value()
+                if consume(",}") == "}":
+                    raise Exception(f"MDSAWS::stream_json_items() The key '{key}' was not found")
+            consume(":")
+
+        consume("[")
+        if peek() == "]":
+            return
+        while True:
+            yield parse_value()
+            if consume(",]") == "]":
+                return
+
     def get_config(self) -> dict:
         """
         Returns a dictionary with the aws client settings
@@ -181,6 +486,200 @@ class MDSAWS:
         except:
             return False
 
+    @staticmethod
+    def get_stream_cipher(encryption_key) -> AESGCM:
+        """
+        Returns the AES-GCM cipher of the encrypted streams, its key is derived from the Fernet key.
+        :param str encryption_key: The Fernet key
+        :return AESGCM:
+        """
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"MDSAWS stream encryption",
+            backend=default_backend(),
+        ).derive(base64.urlsafe_b64decode(encryption_key.encode()))
+        return AESGCM(key)
+
+    @classmethod
+    def is_stream_encrypted(cls, input_bytes) -> bool:
+        """
+        Returns True if the bytes are the beginning of an encrypted stream, False otherwise.
+        :param bytes input_bytes: The bytes to be evaluated
+        :return bool:
+        """
+        try:
+            size = len(cls.ENCRYPTION_MAGIC)
+            return input_bytes[:size] == cls.ENCRYPTION_MAGIC \
+                and len(input_bytes) > size \
+                and input_bytes[size] in cls.ENCRYPTION_VERSIONS
+        except:
+            return False
+
+    @classmethod
+    def compress_chunks(cls, chunks, compression):
+        """
+        Yields the compressed chunks of bytes, the empty ones are skipped.
+        :param iterable chunks: The chunks of bytes
+        :param str compression: The codec, 'gzip', 'zstd' or None
+        :return:
+        """
+        if compression is None:
+            yield from chunks
+            return
+        if compression == "gzip":
+            compressor = zlib.compressobj(cls.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            compressor = zstandard.ZstdCompressor(level=cls.ZSTD_LEVEL).compressobj()
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    @classmethod
+    def decompress_chunks(cls, chunks, compression):
+        """
+        Yields the decompressed chunks of bytes, of up to ENCRYPTION_CHUNK_SIZE bytes for gzip.
+        :param iterable chunks: The compressed chunks of bytes
+        :param str compression: The codec, 'gzip', 'zstd' or None
+        :return:
+        """
+        if compression is None:
+            yield from chunks
+            return
+        if compression == "zstd":
+            if zstandard is None:
+                raise Exception("MDSAWS::decompress_chunks() The zstandard library is not installed")
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+            for chunk in chunks:
+                decompressed = decompressor.decompress(chunk)
+                if decompressed:
+                    yield decompressed
+            return
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            # The size of the output is limited, a small chunk can decompress into a large one
+            decompressed = decompressor.decompress(chunk, cls.ENCRYPTION_CHUNK_SIZE)
+            while decompressed:
+                yield decompressed
+                decompressed = decompressor.decompress(
+                    decompressor.unconsumed_tail, cls.ENCRYPTION_CHUNK_SIZE
+                )
+        decompressed = decompressor.flush()
+        if decompressed:
+            yield decompressed
+        if not decompressor.eof:
+            raise Exception("MDSAWS::decompress_chunks() The compressed stream is truncated")
+
+    @staticmethod
+    def get_nonce(prefix, counter, final) -> bytes:
+        """
+        Returns the nonce of a chunk of an encrypted stream.
+        :param bytes prefix: The random prefix of the stream
+        :param int counter: The number of the chunk, starting from 0
+        :param bool final: True if it is the last chunk
+        :return bytes:
+        """
+        return prefix + struct.pack(">IB", counter, 1 if final else 0)
+
+    def encrypt_stream(self, chunks, compression=None):
+        """
+        Yields the encrypted stream of chunks of bytes: the header, then one frame per (compressed) chunk.
+        :param iterable chunks: The chunks of bytes to be encrypted
+        :param str compression: (Optional) The codec, 'gzip', 'zstd' or None (default)
+        :return:
+        """
+        if self.stream_cipher is None:
+            raise Exception("MDSAWS::encrypt_stream() The encryption key is not provided")
+        if compression not in self.COMPRESSION_CODECS:
+            raise Exception(f"MDSAWS::encrypt_stream() Unknown compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise Exception("MDSAWS::encrypt_stream() The zstandard library is not installed")
+        prefix = os.urandom(self.ENCRYPTION_PREFIX_SIZE)
+        header = self.ENCRYPTION_MAGIC \
+            + bytes([self.ENCRYPTION_VERSION, self.COMPRESSION_CODECS[compression]]) \
+            + prefix
+        yield header
+
+        chunks = iter(self.compress_chunks(chunks, compression))
+        chunk, counter = next(chunks, b""), 0
+        while True:
+            # The last chunk needs to be known before it is encrypted
+            following = next(chunks, None)
+            encrypted = self.stream_cipher.encrypt(
+                self.get_nonce(prefix, counter, following is None), chunk, header
+            )
+            yield struct.pack(">I", len(encrypted)) + encrypted
+            if following is None:
+                return
+            chunk, counter = following, counter + 1
+
+    def decrypt_stream(self, chunks):
+        """
+        Yields the decrypted (and decompressed) chunks of an encrypted stream provided in chunks of bytes
+        of any size. Raises an exception if the stream was modified, reordered or truncated.
+        :param iterable chunks: The chunks of bytes of the encrypted stream
+        :return:
+        """
+        if self.stream_cipher is None:
+            raise Exception("MDSAWS::decrypt_stream() The encryption key is not provided")
+        chunks = iter(chunks)
+        buffer = bytearray()
+
+        def read(size) -> bytes:
+            # Returns the next size bytes, fewer only at the end of the stream
+            while len(buffer) < size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer.extend(chunk)
+            data = bytes(buffer[:size])
+            del buffer[:size]
+            return data
+
+        header = read(len(self.ENCRYPTION_MAGIC) + 1)
+        if not self.is_stream_encrypted(header):
+            raise Exception("MDSAWS::decrypt_stream() The stream is not encrypted")
+        # The version 1 has no compression
+        codec = 0
+        if header[-1] >= 2:
+            codec = read(1)
+            header += codec
+            codec = codec[0] if len(codec) == 1 else -1
+        codecs_by_id = {value: key for key, value in self.COMPRESSION_CODECS.items()}
+        if codec not in codecs_by_id:
+            raise Exception(f"MDSAWS::decrypt_stream() Unknown compression codec: {codec}")
+        header += read(self.ENCRYPTION_PREFIX_SIZE)
+
+        return self.decompress_chunks(
+            self.decrypt_frames(read, header), compression=codecs_by_id[codec]
+        )
+
+    def decrypt_frames(self, read, header):
+        """
+        Yields the decrypted frames of an encrypted stream, after its header.
+        :param function read: Returns the next bytes of the stream, given their number
+        :param bytes header: The header of the stream
+        :return:
+        """
+        prefix = header[-self.ENCRYPTION_PREFIX_SIZE:]
+
+        length, counter = read(4), 0
+        while True:
+            if len(length) < 4:
+                raise Exception("MDSAWS::decrypt_stream() The stream is truncated")
+            encrypted = read(struct.unpack(">I", length)[0])
+            # It is the last chunk if nothing follows it
+            length = read(4)
+            final = len(length) == 0
+            yield self.stream_cipher.decrypt(self.get_nonce(prefix, counter, final), encrypted, header)
+            if final:
+                return
+            counter += 1
+
     def encrypt(self, input_string) -> str:
         """
         Encrypts a string based on the provided key and input text.
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+
+class MDSCircuitBreaker:
+    __slots__ = [
+        "threshold",
+        "cooldown",
+        "failures",
+        "opened_at",
+        "trips",
+        "lock",
+    ]
+
+    def __init__(self, threshold=5, cooldown=30):
+        """
+        Counts the consecutive failed requests to a service. Once there are threshold of them, the circuit
+        opens, and the requests wait for cooldown seconds before trying again, so the pipeline pauses
+        instead of failing every request while the service is unhealthy. It can be shared across threads.
+        :param int threshold: (Optional) The number of consecutive failures that open the circuit
+        :param float cooldown: (Optional) The number of seconds the circuit stays open
+        """
+        if int(threshold) < 1:
+            raise Exception("MDSCircuitBreaker::__init__() threshold must be a positive integer")
+        self.threshold = int(threshold)
+        self.cooldown = float(cooldown)
+        self.failures = 0
+        self.opened_at = None
+        # The number of times the circuit opened
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """
+        Returns True if the circuit is open, and the cooldown did not finish yet.
+        :return bool:
+        """
+        return self.get_remaining() > 0
+
+    def get_remaining(self) -> float:
+        """
+        Returns the number of seconds until the circuit can be tried again, 0 if it is closed.
+        :return float:
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def wait(self) -> float:
+        """
+        Waits until the circuit can be tried again, returns the number of seconds waited.
+        :return float:
+        """
+        waited = 0.0
+        remaining = self.get_remaining()
+        while remaining > 0:
+            logging.debug(f"MDSCircuitBreaker::wait() The circuit is open, waiting {remaining:.1f} seconds")
+            time.sleep(remaining)
+            waited += remaining
+            remaining = self.get_remaining()
+        return waited
+
+    def record_success(self):
+        """
+        Closes the circuit.
+        :return:
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """
+        Counts a failure, and opens the circuit (again) once there are threshold consecutive failures.
+        :return:
+        """
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+                logging.debug(f"MDSCircuitBreaker::record_failure() Opening the circuit for {self.cooldown} seconds")
+
+    def get_stats(self) -> dict:
+        """
+        Returns a dictionary with the state of the circuit.
+        :return dict:
+        """
+        remaining = self.get_remaining()
+        return {
+            "open": remaining > 0,
+            "remaining": remaining,
+            "failures": self.failures,
+            "trips": self.trips,
+        }
@@ -21,6 +21,7 @@ class MDSConfig:
         "ATD_MDS_CENSUS_GEOJSON",
         "ATD_MDS_DISTRICTS_GEOJSON",
         "ATD_MDS_HEX_GEOJSON",
+        "ATD_MDS_PIP_CACHE",
         "_MDS_SETTINGS",
         "_MDS_PROVIDERS",
         "_MDS_AWS",
@@ -48,6 +49,8 @@ class MDSConfig:
             "ATD_MDS_DISTRICTS_GEOJSON", "data/council_districts_simplified.json"
         )
         self.ATD_MDS_HEX_GEOJSON = os.getenv("ATD_MDS_HEX_GEOJSON", "data/hex1000.json")
+        # Directory for the compiled point-in-polygon cache, disabled when not set
+        self.ATD_MDS_PIP_CACHE = os.getenv("ATD_MDS_PIP_CACHE", None)
         self._MDS_AWS = self._initialize_aws()
         # Internal
         self._MDS_PROVIDERS = self._load_json_file_s3(key=self.ATD_MDS_PROVIDERS)
@@ -68,6 +71,7 @@ class MDSConfig:
             "ATD_MDS_STAGE": self.ATD_MDS_STAGE,
             "ATD_MDS_PROVIDERS": self.ATD_MDS_PROVIDERS,
             "ATD_MDS_SETTINGS": self.ATD_MDS_SETTINGS,
+            "ATD_MDS_PIP_CACHE": self.ATD_MDS_PIP_CACHE,
             "_MDS_SETTINGS": self._MDS_SETTINGS,
             "_MDS_PROVIDERS": self._MDS_PROVIDERS,
         }
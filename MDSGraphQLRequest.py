@@ -1,16 +1,109 @@
 import requests
+import gzip
+import json
 import logging
+import random
+import time
+
+from requests.adapters import HTTPAdapter
+from MDSCircuitBreaker import MDSCircuitBreaker
+
+try:
+    # A faster json library, if installed
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class MDSGraphQLRequest:
-    __slots__ = ["endpoint", "http_params", "http_auth_token", "data", "response"]
+    __slots__ = [
+        "endpoint",
+        "http_params",
+        "http_auth_token",
+        "data",
+        "response",
+        "pool_size",
+        "timeout",
+        "session",
+        "retries",
+        "backoff",
+        "backoff_max",
+        "circuit_breaker",
+        "compress_threshold",
+    ]
+
+    # The default connect and read timeouts in seconds
+    DEFAULT_TIMEOUT = (10, 300)
+
+    # The http status codes of a transient error, the request is tried again
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
 
     def __init__(self, endpoint, http_auth_token, **kwargs):
+        """
+        Initializes the GraphQL client. The requests share a single session, so the connections
+        to the endpoint are kept alive and reused, and the session can be shared across threads.
+        :param str endpoint: The GraphQL endpoint
+        :param str http_auth_token: The Hasura admin secret
+        :param dict kwargs: (Optional) The http_params, the pool_size (the number of connections
+        kept open, usually ATD_MDS_MAX_THREADS), and the timeout (seconds, or a connect and read tuple).
+        The failed requests are tried again up to retries times (3), waiting a random time up to backoff
+        seconds (0.5) doubled on every attempt, but never more than backoff_max (30). After
+        breaker_threshold (5) failed requests in a row, every request waits breaker_cooldown seconds (30).
+        The request bodies larger than compress_threshold bytes are sent gzipped (disabled by default,
+        the endpoint or the proxy in front of it needs to accept gzipped bodies).
+        """
         logging.debug("MDSGraphQLRequest::__init__() Initializing HTTP GraphQL Request")
         self.endpoint = endpoint
         self.http_auth_token = http_auth_token
         self.http_params = kwargs.get("http_params", None)
+        self.pool_size = max(int(kwargs.get("pool_size", None) or 10), 1)
+        self.timeout = kwargs.get("timeout", None) or self.DEFAULT_TIMEOUT
+        self.retries = max(int(kwargs.get("retries", 3)), 0)
+        self.backoff = float(kwargs.get("backoff", 0.5))
+        self.backoff_max = float(kwargs.get("backoff_max", 30))
+        self.circuit_breaker = MDSCircuitBreaker(
+            threshold=kwargs.get("breaker_threshold", 5),
+            cooldown=kwargs.get("breaker_cooldown", 30),
+        )
+        self.compress_threshold = kwargs.get("compress_threshold", None)
         self.response = None
+        self.session = self.create_session()
+
+    def __del__(self):
+        """
+        Make sure the connections are closed whenever the class is destructed.
+        :return:
+        """
+        try:
+            self.close()
+        except:
+            pass
+
+    def create_session(self) -> requests.Session:
+        """
+        Returns a new session with a connection pool of pool_size connections, and the headers of every request.
+        :return requests.Session:
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
+            {
+                "Accept": "*/*",
+                "content-type": "application/json",
+                "x-hasura-admin-secret": f"{self.http_auth_token}",
+            }
+        )
+        return session
+
+    def close(self):
+        """
+        Closes the connections of the session.
+        :return:
+        """
+        if getattr(self, "session", None) is not None:
+            self.session.close()
 
     def get_config(self) -> dict:
         """
@@ -21,35 +114,109 @@ class MDSGraphQLRequest:
         return {
             "endpoint": self.endpoint,
             "http_params": self.http_params,
-            "http_auth_token": self.http_auth_token
+            "http_auth_token": self.http_auth_token,
+            "pool_size": self.pool_size,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "backoff": self.backoff,
+            "backoff_max": self.backoff_max,
+            "compress_threshold": self.compress_threshold,
         }
 
-    def request(self, query) -> dict:
+    @staticmethod
+    def dumps(data) -> bytes:
+        """
+        Returns the json encoded data, with orjson if it is installed.
+        :param dict data: The data to be encoded
+        :return bytes:
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(data)
+            except TypeError:
+                pass
+        return json.dumps(data).encode("utf-8")
+
+    @staticmethod
+    def loads(content):
+        """
+        Returns the decoded json content, with orjson if it is installed.
+        :param bytes content: The json document
+        :return:
+        """
+        if orjson is not None:
+            return orjson.loads(content)
+        return json.loads(content)
+
+    def get_body(self, payload) -> (bytes, dict):
+        """
+        Returns the encoded request body, and the headers it needs.
+        :param dict payload: The query and its variables
+        :return (bytes, dict):
+        """
+        body = self.dumps(payload)
+        if self.compress_threshold is not None and len(body) > int(self.compress_threshold):
+            return gzip.compress(body, compresslevel=5), {"Content-Encoding": "gzip"}
+        return body, None
+
+    def get_backoff(self, attempt) -> float:
+        """
+        Returns the number of seconds to wait before trying a request again, a random
+        time up to the backoff doubled on every attempt (full jitter).
+        :param int attempt: The number of the failed attempt, starting from 0
+        :return float:
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def request(self, query, variables=None) -> dict:
         """
         Makes a GraphQL HTTP request to an endpoint, returns a dictionary with the response.
+        The connection errors, timeouts and transient http errors are tried again, the queries
+        and mutations are upserts or updates, so sending one more than once does not change the result.
         :param str query: The GraphQL query
+        :param dict variables: (Optional) The values of the variables declared in the query
         :return dict:
         """
         logging.debug("MDSGraphQLRequest::request() Making request")
-        headers = {
-            "Accept": "*/*",
-            "content-type": "application/json",
-            "x-hasura-admin-secret": f"{self.http_auth_token}"
-        }
-        self.response = requests.post(
-            self.endpoint,
-            params=self.http_params,
-            headers=headers,
-            json={
-                "query": query
-            }
-        )
-        self.response.encoding = "utf-8"
-        return self.response.json()
+        payload = {"query": query}
+        if variables is not None:
+            payload["variables"] = variables
+        body, headers = self.get_body(payload)
+
+        attempt = 0
+        while True:
+            self.circuit_breaker.wait()
+            try:
+                response = self.session.post(
+                    self.endpoint,
+                    params=self.http_params,
+                    data=body,
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+                if response.status_code in self.RETRY_STATUS_CODES:
+                    raise Exception(f"HTTP status {response.status_code}")
+                response.encoding = "utf-8"
+                data = self.loads(response.content)
+            except Exception as e:
+                if attempt >= self.retries:
+                    self.circuit_breaker.record_failure()
+                    raise Exception(
+                        f"MDSGraphQLRequest::request() The request failed after {attempt + 1} attempts: {e}"
+                    )
+                delay = self.get_backoff(attempt)
+                logging.debug(f"MDSGraphQLRequest::request() Attempt {attempt + 1} failed ({e}), retrying in {delay:.2f} seconds")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.circuit_breaker.record_success()
+            self.response = response
+            return data
 
     def get_last_response(self) -> dict:
         """
         Returns the last response from the endpoint.
         :return dict:
         """
-        return self.response.json()
+        return self.loads(self.response.content)
@@ -0,0 +1,239 @@
+import logging
+import math
+
+import numpy as np
+
+
+class MDSHexGrid:
+    __slots__ = [
+        "ids",
+        "flat_top",
+        "origin_x",
+        "origin_y",
+        "scale_x",
+        "scale_y",
+        "edge_tolerance",
+        "q_min",
+        "r_min",
+        "cells",
+    ]
+
+    # Values returned instead of a feature position
+    OUTSIDE = -1
+    NEAR_EDGE = -2
+
+    # The maximum distance (as a fraction of the cell size) a feature center can be off the grid
+    GRID_TOLERANCE = 0.01
+
+    def __init__(self, polygons, label="id", edge_tolerance=0.01):
+        """
+        Learns the origin, orientation and cell size of a regular hexagonal grid
+        from a geojson object. It raises an exception if the polygons are not a regular grid.
+        :param dict polygons: The dictionary containing a GeoJson object
+        :param str label: The property dictionary key (aka label) of the cell id
+        :param float edge_tolerance: (Optional) Points closer than this (as a fraction of the cell size) to an edge are marked as NEAR_EDGE.
+        """
+        logging.debug("MDSHexGrid::__init__() Initializing hexagonal grid")
+        self.edge_tolerance = edge_tolerance
+        features = polygons["features"]
+        if len(features) == 0:
+            raise Exception("MDSHexGrid::__init__() There are no features in the grid")
+
+        vertices = []
+        for feature in features:
+            geometry = feature.get("geometry", {})
+            ring = geometry.get("coordinates", [[]])[0]
+            if geometry.get("type") != "Polygon" or len(ring) != 7:
+                raise Exception(
+                    "MDSHexGrid::__init__() Every feature must be a polygon with six vertices"
+                )
+            vertices.append(ring[:6])
+        vertices = np.asarray(vertices, dtype=np.float64)
+
+        # The cell size is the half width and half height of the hexagons
+        half_width = np.median(
+            (vertices[:, :, 0].max(axis=1) - vertices[:, :, 0].min(axis=1)) / 2
+        )
+        half_height = np.median(
+            (vertices[:, :, 1].max(axis=1) - vertices[:, :, 1].min(axis=1)) / 2
+        )
+        centers = vertices.mean(axis=1)
+
+        # A flat-top hexagon has its left-most vertex at the height of its center
+        first = vertices[0]
+        left_vertex = first[first[:, 0].argmin()]
+        self.flat_top = bool(abs(left_vertex[1] - centers[0][1]) < half_height / 2)
+
+        # Scale the coordinates so the hexagons become regular with a circumradius of 1
+        if self.flat_top:
+            self.scale_x = float(1 / half_width)
+            self.scale_y = float(math.sqrt(3) / 2 / half_height)
+        else:
+            self.scale_x = float(math.sqrt(3) / 2 / half_width)
+            self.scale_y = float(1 / half_height)
+        self.origin_x, self.origin_y = centers[0].tolist()
+
+        fractional_q, fractional_r = self.get_axial_coordinates(centers[:, 0], centers[:, 1])
+        q = np.round(fractional_q).astype(np.int64)
+        r = np.round(fractional_r).astype(np.int64)
+        if (
+            np.abs(fractional_q - q).max() > self.GRID_TOLERANCE
+            or np.abs(fractional_r - r).max() > self.GRID_TOLERANCE
+        ):
+            raise Exception("MDSHexGrid::__init__() The polygons are not a regular hexagonal grid")
+
+        # Lookup table of feature positions, indexed by the axial coordinates
+        self.q_min = int(q.min())
+        self.r_min = int(r.min())
+        self.cells = np.full(
+            (int(q.max()) - self.q_min + 1, int(r.max()) - self.r_min + 1),
+            self.OUTSIDE,
+            dtype=np.int64,
+        )
+        if np.any(self.cells[q - self.q_min, r - self.r_min] != self.OUTSIDE) or len(
+            set(zip(q.tolist(), r.tolist()))
+        ) != len(features):
+            raise Exception("MDSHexGrid::__init__() The grid contains overlapping cells")
+        self.cells[q - self.q_min, r - self.r_min] = np.arange(len(features))
+
+        self.ids = np.array(
+            [feature.get("properties", {}).get(label, None) for feature in features],
+            dtype=object,
+        )
+
+    def get_state(self) -> dict:
+        """
+        Returns the learned grid parameters as a json-serializable dictionary (without the ids).
+        :return dict:
+        """
+        return {
+            "flat_top": self.flat_top,
+            "origin_x": self.origin_x,
+            "origin_y": self.origin_y,
+            "scale_x": self.scale_x,
+            "scale_y": self.scale_y,
+            "edge_tolerance": self.edge_tolerance,
+            "q_min": self.q_min,
+            "r_min": self.r_min,
+            "cells": self.cells.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state, ids):
+        """
+        Restores a grid from the values returned by get_state, without reading the polygons again.
+        :param dict state: The grid parameters
+        :param list ids: The cell ids, in the same order as the features
+        :return MDSHexGrid:
+        """
+        hex_grid = cls.__new__(cls)
+        hex_grid.flat_top = bool(state["flat_top"])
+        hex_grid.origin_x = float(state["origin_x"])
+        hex_grid.origin_y = float(state["origin_y"])
+        hex_grid.scale_x = float(state["scale_x"])
+        hex_grid.scale_y = float(state["scale_y"])
+        hex_grid.edge_tolerance = float(state["edge_tolerance"])
+        hex_grid.q_min = int(state["q_min"])
+        hex_grid.r_min = int(state["r_min"])
+        hex_grid.cells = np.asarray(state["cells"], dtype=np.int64)
+        hex_grid.ids = np.array(ids, dtype=object)
+        return hex_grid
+
+    def get_axial_coordinates(self, longitudes, latitudes) -> (np.ndarray, np.ndarray):
+        """
+        Returns the fractional axial coordinates (q, r) of the points.
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return (np.ndarray, np.ndarray):
+        """
+        x = (np.asarray(longitudes, dtype=np.float64) - self.origin_x) * self.scale_x
+        y = (np.asarray(latitudes, dtype=np.float64) - self.origin_y) * self.scale_y
+        if self.flat_top:
+            return x * 2 / 3, y * math.sqrt(3) / 3 - x / 3
+        return x * math.sqrt(3) / 3 - y / 3, y * 2 / 3
+
+    def get_positions(self, longitudes, latitudes) -> np.ndarray:
+        """
+        Returns the feature position of the cell containing each point. Points outside the grid
+        are marked as OUTSIDE, and points too close to an edge to be certain are marked as NEAR_EDGE.
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return np.ndarray:
+        """
+        fractional_q, fractional_r = self.get_axial_coordinates(longitudes, latitudes)
+        fractional_s = -fractional_q - fractional_r
+
+        # Cube rounding, the component with the largest error is recomputed from the others
+        q = np.round(fractional_q)
+        r = np.round(fractional_r)
+        s = np.round(fractional_s)
+        dq = np.abs(q - fractional_q)
+        dr = np.abs(r - fractional_r)
+        ds = np.abs(s - fractional_s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        q = np.where(fix_q, -r - s, q)
+        r = np.where(fix_r, -q - s, r)
+
+        # The cell is the region where all pairwise cube differences are within 1
+        offset_q = fractional_q - q
+        offset_r = fractional_r - r
+        offset_s = fractional_s + q + r
+        margin = 1 - np.maximum.reduce(
+            [
+                np.abs(offset_q - offset_r),
+                np.abs(offset_r - offset_s),
+                np.abs(offset_s - offset_q),
+            ]
+        )
+
+        column = q.astype(np.int64) - self.q_min
+        row = r.astype(np.int64) - self.r_min
+        in_table = (
+            (column >= 0)
+            & (column < self.cells.shape[0])
+            & (row >= 0)
+            & (row < self.cells.shape[1])
+        )
+        positions = np.full(column.shape, self.OUTSIDE, dtype=np.int64)
+        positions[in_table] = self.cells[column[in_table], row[in_table]]
+        positions[margin < self.edge_tolerance] = self.NEAR_EDGE
+        return positions
+
+    def get_position(self, longitude_x, latitude_y) -> int:
+        """
+        Returns the feature position of the cell containing a single point,
+        or one of OUTSIDE or NEAR_EDGE. Same as get_positions, without the array overhead.
+        :param float longitude_x: Longitude value
+        :param float latitude_y: Latitude value
+        :return int:
+        """
+        x = (float(longitude_x) - self.origin_x) * self.scale_x
+        y = (float(latitude_y) - self.origin_y) * self.scale_y
+        if self.flat_top:
+            fractional_q, fractional_r = x * 2 / 3, y * math.sqrt(3) / 3 - x / 3
+        else:
+            fractional_q, fractional_r = x * math.sqrt(3) / 3 - y / 3, y * 2 / 3
+        fractional_s = -fractional_q - fractional_r
+
+        q, r, s = round(fractional_q), round(fractional_r), round(fractional_s)
+        dq, dr, ds = abs(q - fractional_q), abs(r - fractional_r), abs(s - fractional_s)
+        if dq > dr and dq > ds:
+            q = -r - s
+        elif dr > ds:
+            r = -q - s
+
+        offset_q = fractional_q - q
+        offset_r = fractional_r - r
+        offset_s = fractional_s + q + r
+        margin = 1 - max(
+            abs(offset_q - offset_r), abs(offset_r - offset_s), abs(offset_s - offset_q)
+        )
+        if margin < self.edge_tolerance:
+            return self.NEAR_EDGE
+
+        column = q - self.q_min
+        row = r - self.r_min
+        if 0 <= column < self.cells.shape[0] and 0 <= row < self.cells.shape[1]:
+            return int(self.cells[column, row])
+        return self.OUTSIDE
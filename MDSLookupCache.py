@@ -0,0 +1,137 @@
+import math
+import threading
+
+from collections import OrderedDict
+from shapely.geometry import box
+
+
+class MDSLookupCache:
+    __slots__ = [
+        "max_size",
+        "precision",
+        "entries",
+        "lock",
+        "hits",
+        "misses",
+        "boundary_hits",
+    ]
+
+    # Returned by get() when the cell has never been seen
+    MISSING = object()
+    # Stored for cells that straddle a polygon boundary, these are never answered from the cache
+    BOUNDARY = object()
+    # Stored for cells seen once, a cell is only checked and cached the second time it is seen
+    SEEN = object()
+
+    def __init__(self, max_size=100000, precision=1e-5):
+        """
+        Initializes a bounded LRU cache of polygon ids, keyed by the layer name and the
+        coordinates quantized to square cells of the given precision (in degrees).
+        :param int max_size: The maximum number of cells kept in memory
+        :param float precision: The size of the cells, in degrees
+        """
+        if not max_size or max_size <= 0:
+            raise Exception("MDSLookupCache::__init__() max_size must be a positive integer")
+        if not precision or precision <= 0:
+            raise Exception("MDSLookupCache::__init__() precision must be a positive number")
+        self.max_size = int(max_size)
+        self.precision = float(precision)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.boundary_hits = 0
+
+    def get_key(self, layer_name, longitude_x, latitude_y) -> tuple:
+        """
+        Returns the cache key of the cell that contains the point.
+        :param str layer_name: The name of the polygon layer
+        :param float longitude_x: Longitude value
+        :param float latitude_y: Latitude value
+        :return tuple:
+        """
+        return (
+            layer_name,
+            math.floor(longitude_x / self.precision),
+            math.floor(latitude_y / self.precision),
+        )
+
+    def get_cell_box(self, key):
+        """
+        Returns the cell of a key as a shapely polygon, grown by a tiny margin
+        so that it also covers points rounded into the cell.
+        :param tuple key: The cache key
+        :return Polygon:
+        """
+        _, column, row = key
+        margin = self.precision * 1e-3
+        return box(
+            column * self.precision - margin,
+            row * self.precision - margin,
+            (column + 1) * self.precision + margin,
+            (row + 1) * self.precision + margin,
+        )
+
+    def get(self, key):
+        """
+        Returns the cached value of a cell, BOUNDARY for cells that cannot be cached,
+        SEEN for cells seen only once, or MISSING if the cell is not in the cache.
+        :param tuple key: The cache key
+        :return:
+        """
+        with self.lock:
+            value = self.entries.get(key, self.MISSING)
+            if value is self.MISSING:
+                self.misses += 1
+                return value
+            self.entries.move_to_end(key)
+            if value is self.SEEN:
+                self.misses += 1
+                return value
+            if value is self.BOUNDARY:
+                self.boundary_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores the value of a cell, evicting the least recently used cells if the cache is full.
+        :param tuple key: The cache key
+        :param value: The polygon id, None if outside every polygon, BOUNDARY or SEEN
+        :return:
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every cell from the cache and resets the counters.
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.boundary_hits = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit and miss counters, useful to tune the size and precision of the cache.
+        Boundary hits are cells found in the cache that still needed the exact lookup.
+        :return dict:
+        """
+        with self.lock:
+            lookups = self.hits + self.misses + self.boundary_hits
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "boundary_hits": self.boundary_hits,
+                "hit_ratio": (self.hits / lookups) if lookups > 0 else 0.0,
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "precision": self.precision,
+            }
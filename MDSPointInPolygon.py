@@ -1,23 +1,60 @@
 import logging
 import json
+import threading
 
+import numpy as np
 from rtree import index
 from shapely.geometry import shape, point
+from shapely.prepared import prep
+
+try:
+    # Shapely 2.x provides a vectorized containment test for coordinate arrays
+    from shapely import contains_xy
+except ImportError:
+    contains_xy = None
+    from shapely import vectorized
 
 from MDSConfig import MDSConfig
+from MDSHexGrid import MDSHexGrid
+from MDSLookupCache import MDSLookupCache
+from MDSPolygonCache import MDSPolygonCache
+from MDSRaster import MDSRaster
 
 
 class MDSPointInPolygon:
     __slots__ = [
         "mds_config",
-        "CENSUS_TRACTS_GEOJSON",
-        "CENSUS_TRACTS_INDEX",
-        "DISTRICTS_GEOJSON",
-        "DISTRICTS_INDEX",
-        "HEX_GEOJSON",
-        "HEX_INDEX",
+        "autoload",
+        "layers",
+        "lock",
+        "POLYGON_CACHE",
+        "LOOKUP_CACHE",
+        "RASTER",
+        "raster_cell_size",
+        "NESTING",
+    ]
+
+    # The layers available by default, the file paths are read from the configuration class
+    DEFAULT_LAYERS = [
+        {"name": "census_tracts", "setting": "ATD_MDS_CENSUS_GEOJSON", "label": "GEOID10"},
+        {"name": "districts", "setting": "ATD_MDS_DISTRICTS_GEOJSON", "label": "district_n"},
+        {"name": "hexagons", "setting": "ATD_MDS_HEX_GEOJSON", "label": "id", "hex_grid": True},
     ]
 
+    # The keys returned by lookup_batch and resolve, and the layer of each
+    RESOLVE_LAYERS = {
+        "census_tract_id": "census_tracts",
+        "district_id": "districts",
+        "hex_id": "hexagons",
+    }
+
+    # resolve() finds the hexagon first, then only tests the polygons of these layers that touch it
+    NESTING_LAYER = "hexagons"
+    NESTED_LAYERS = ["census_tracts", "districts"]
+
+    # The layers included in the raster lookup table, when it is enabled
+    RASTER_LAYERS = ["census_tracts", "districts", "hexagons"]
+
     @staticmethod
     def get_polygon_property(poly, label) -> str:
         """
@@ -29,20 +66,42 @@ class MDSPointInPolygon:
         return poly.get("properties", {}).get(label, None)
 
     @staticmethod
-    def initialize_index(polygons) -> index:
+    def initialize_geometries(polygons) -> list:
+        """
+        Builds the shapely geometry of every feature, in the same order as the features.
+        :param dict polygons: The dictionary containing a GeoJson object
+        :return list:
+        """
+        return [shape(feature["geometry"]) for feature in polygons["features"]]
+
+    @staticmethod
+    def initialize_index(polygons, geometries=None) -> index:
         """
         Creates grid cell index of polygon *bounding boxes*
         :param dict polygons: The dictionary containing a GeoJson object
+        :param list geometries: (Optional) The shapely geometries already built for the features
         :return shape:
         """
+        if geometries is None:
+            geometries = MDSPointInPolygon.initialize_geometries(polygons)
+
         mds_index = index.Index()
-        for pos, feature in enumerate(polygons["features"]):
-            mds_index.insert(pos, shape(feature["geometry"]).bounds)
+        for pos, geometry in enumerate(geometries):
+            mds_index.insert(pos, geometry.bounds)
 
         return mds_index
 
     @staticmethod
-    def point_in_poly(pt, idx, polys, geom_key) -> dict:
+    def initialize_prepared(geometries) -> list:
+        """
+        Returns a list of prepared geometries, positions match the rtree index positions.
+        :param list geometries: The shapely geometries
+        :return list:
+        """
+        return [prep(geometry) for geometry in geometries]
+
+    @staticmethod
+    def point_in_poly(pt, idx, polys, geom_key, prepared=None, coordinates=None) -> dict:
         """
         Returns the first geojson polygon that contains a point.
         Returns empty dictionary if not found.
@@ -50,17 +109,119 @@ class MDSPointInPolygon:
         :param index idx: An rtree index object
         :param dict polys: The geojson polygons
         :param str geom_key: The geometry dictionary key
+        :param list prepared: (Optional) The prepared geometries for each index position
+        :param tuple coordinates: (Optional) The (x, y) coordinates of the point, if already extracted
         :return dict:
         """
         # iterate through polygon *bounding boxes* that intersect with point
-        for intersect_pos in idx.intersection(pt.coords[0]):
-            # Load the polygon from current index position
-            poly = shape(polys["features"][intersect_pos][geom_key])
+        for intersect_pos in idx.intersection(coordinates or pt.coords[0]):
+            if prepared is not None:
+                # Reuse the geometry prepared at load time
+                poly = prepared[intersect_pos]
+            else:
+                # Load the polygon from current index position
+                poly = shape(polys["features"][intersect_pos][geom_key])
             # check if point intersects actual polygon
-            if pt.intersects(poly):
+            if poly.intersects(pt):
                 return polys["features"][intersect_pos]
         return {}
 
+    @staticmethod
+    def contains_points(prepared_poly, longitudes, latitudes) -> np.ndarray:
+        """
+        Returns a boolean mask of the points (strictly) contained by a prepared polygon.
+        :param PreparedGeometry prepared_poly: The prepared shapely polygon
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return np.ndarray:
+        """
+        if contains_xy is not None:
+            return contains_xy(prepared_poly.context, longitudes, latitudes)
+        return vectorized.contains(prepared_poly, longitudes, latitudes)
+
+    @staticmethod
+    def index_candidates(idx, longitudes, latitudes) -> (np.ndarray, np.ndarray):
+        """
+        Queries the rtree index with every point at once, and returns two arrays
+        of the same length: the point positions and the candidate polygon positions.
+        :param index idx: An rtree index object
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return (np.ndarray, np.ndarray):
+        """
+        coordinates = np.column_stack((longitudes, latitudes))
+        # Newer versions of rtree can run the whole query in a single call
+        if hasattr(idx, "intersection_v"):
+            poly_positions, counts = idx.intersection_v(coordinates, coordinates)
+            point_positions = np.repeat(
+                np.arange(len(coordinates)), np.asarray(counts, dtype=np.int64)
+            )
+            return point_positions, np.asarray(poly_positions, dtype=np.int64)
+
+        point_positions = []
+        poly_positions = []
+        for pos, coordinate in enumerate(coordinates.tolist()):
+            for intersect_pos in idx.intersection(coordinate):
+                point_positions.append(pos)
+                poly_positions.append(intersect_pos)
+        return (
+            np.asarray(point_positions, dtype=np.int64),
+            np.asarray(poly_positions, dtype=np.int64),
+        )
+
+    @staticmethod
+    def point_in_poly_batch(longitudes, latitudes, idx, polys, prepared, label) -> np.ndarray:
+        """
+        Returns an array with the property of the first polygon that contains each point,
+        or None for the points that are not found in any polygon.
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :param index idx: An rtree index object
+        :param dict polys: The geojson polygons
+        :param list prepared: The prepared geometries for each index position
+        :param str label: The property dictionary key (aka label)
+        :return np.ndarray:
+        """
+        results = np.full(len(longitudes), None, dtype=object)
+        resolved = np.zeros(len(longitudes), dtype=bool)
+        point_positions, poly_positions = MDSPointInPolygon.index_candidates(
+            idx, longitudes, latitudes
+        )
+        if len(point_positions) == 0:
+            return results
+
+        # Group the candidate points by polygon, and test each group with a single call
+        order = np.argsort(poly_positions, kind="stable")
+        point_positions = point_positions[order]
+        poly_positions = poly_positions[order]
+        groups, starts = np.unique(poly_positions, return_index=True)
+        for poly_pos, candidates in zip(groups.tolist(), np.split(point_positions, starts[1:])):
+            candidates = candidates[~resolved[candidates]]
+            if len(candidates) == 0:
+                continue
+            inside = candidates[
+                MDSPointInPolygon.contains_points(
+                    prepared[poly_pos], longitudes[candidates], latitudes[candidates]
+                )
+            ]
+            results[inside] = MDSPointInPolygon.get_polygon_property(
+                poly=polys["features"][poly_pos], label=label
+            )
+            resolved[inside] = True
+
+        # Points lying exactly on a boundary are not contained, check those one at a time
+        for pos in np.unique(point_positions[~resolved[point_positions]]).tolist():
+            poly = MDSPointInPolygon.point_in_poly(
+                pt=MDSPointInPolygon.create_point(longitudes[pos], latitudes[pos]),
+                idx=idx,
+                polys=polys,
+                geom_key="geometry",
+                prepared=prepared,
+            )
+            results[pos] = MDSPointInPolygon.get_polygon_property(poly=poly, label=label)
+
+        return results
+
     @staticmethod
     def create_point(longitude_x, latitude_y) -> point:
         """
@@ -71,64 +232,537 @@ class MDSPointInPolygon:
         """
         return point.Point(float(longitude_x), float(latitude_y))
 
-    def __init__(self, mds_config, autoload=True):
+    def __init__(
+        self,
+        mds_config,
+        autoload=True,
+        lookup_cache_size=None,
+        lookup_cache_precision=None,
+        raster_cell_size=None,
+    ):
         """
         Initializes the PointInPolygon helper methods. Requires a configuration class instance.
+        Additional layers can be registered with the PIP_LAYERS setting, for example:
+            "PIP_LAYERS": {"parks": {"file": "data/parks.json", "label": "park_id"}}
         :param MDSConfig mds_config: The configuration class instance
-        :param bool autoload: Set to True (default) if you want to automatically load polygons and indexes.
+        :param bool autoload: Set to True (default) if you want each layer to be loaded and indexed on first use.
+        :param int lookup_cache_size: (Optional) The number of cells kept in the lookup cache, it is disabled by default.
+        :param float lookup_cache_precision: (Optional) The size in degrees of the lookup cache cells, 1e-5 by default.
+        :param float raster_cell_size: (Optional) The size in meters of the raster lookup table cells, it is disabled by default.
         """
         self.mds_config = mds_config
-        # Establish initial value for geojson polygons
-        self.CENSUS_TRACTS_GEOJSON = None
-        self.DISTRICTS_GEOJSON = None
-        self.HEX_GEOJSON = None
-        # Establish initial value for indexes
-        self.CENSUS_TRACTS_INDEX = None
-        self.DISTRICTS_INDEX = None
-        self.HEX_INDEX = None
-        # Go ahead and initialize geojson polygons & indexes
-        if autoload:
-            self.initialize_geojson_polygons()
-            self.initialize_indexes()
+        self.autoload = autoload
+        self.lock = threading.RLock()
+        # The compiled cache on disk, only if a directory is configured
+        self.POLYGON_CACHE = (
+            MDSPolygonCache(cache_dir=self.mds_config.ATD_MDS_PIP_CACHE)
+            if self.mds_config.ATD_MDS_PIP_CACHE
+            else None
+        )
+        # The lookup cache of single points, the settings are used if no values are provided
+        if lookup_cache_size is None:
+            lookup_cache_size = self.mds_config.get_setting("PIP_LOOKUP_CACHE_SIZE", 0)
+        if lookup_cache_precision is None:
+            lookup_cache_precision = self.mds_config.get_setting("PIP_LOOKUP_CACHE_PRECISION", 1e-5)
+        self.LOOKUP_CACHE = (
+            MDSLookupCache(max_size=lookup_cache_size, precision=lookup_cache_precision)
+            if lookup_cache_size
+            else None
+        )
+        # The raster lookup table is built (or loaded from the cache) on first use
+        self.RASTER = None
+        self.raster_cell_size = (
+            raster_cell_size
+            if raster_cell_size is not None
+            else self.mds_config.get_setting("PIP_RASTER_CELL_SIZE", None)
+        )
+        # The polygons touching each hexagon, built on the first call to resolve()
+        self.NESTING = None
+        # Register the layers, nothing is loaded until a layer is used
+        self.layers = {}
+        for layer in self.DEFAULT_LAYERS:
+            self.register_layer(
+                name=layer["name"],
+                file_path=getattr(self.mds_config, layer["setting"]),
+                label=layer["label"],
+                hex_grid=layer.get("hex_grid", False),
+            )
+        for name, layer in (self.mds_config.get_setting("PIP_LAYERS", None) or {}).items():
+            self.register_layer(
+                name=name,
+                file_path=layer["file"],
+                label=layer["label"],
+                hex_grid=layer.get("hex_grid", False),
+            )
+
+    # Shortcuts to the default layers, these load the layer on access if autoload is enabled
+    CENSUS_TRACTS_GEOJSON = property(lambda self: self.get_layer_value("census_tracts", "geojson"))
+    CENSUS_TRACTS_INDEX = property(lambda self: self.get_layer_value("census_tracts", "index"))
+    CENSUS_TRACTS_PREPARED = property(lambda self: self.get_layer_value("census_tracts", "prepared"))
+    DISTRICTS_GEOJSON = property(lambda self: self.get_layer_value("districts", "geojson"))
+    DISTRICTS_INDEX = property(lambda self: self.get_layer_value("districts", "index"))
+    DISTRICTS_PREPARED = property(lambda self: self.get_layer_value("districts", "prepared"))
+    HEX_GEOJSON = property(lambda self: self.get_layer_value("hexagons", "geojson"))
+    HEX_INDEX = property(lambda self: self.get_layer_value("hexagons", "index"))
+    HEX_PREPARED = property(lambda self: self.get_layer_value("hexagons", "prepared"))
+    HEX_GRID = property(lambda self: self.get_layer_value("hexagons", "hex_grid"))
+
+    def register_layer(self, name, file_path, label, hex_grid=False):
+        """
+        Adds a polygon layer to the registry, the layer is not loaded until it is used.
+        :param str name: The name of the layer
+        :param str file_path: The path to the geojson file
+        :param str label: The property dictionary key (aka label) returned for the polygons
+        :param bool hex_grid: (Optional) Set to True if the polygons are a regular hexagonal grid.
+        :return:
+        """
+        if not name or not file_path or not label:
+            raise Exception(
+                f"MDSPointInPolygon::register_layer() The name, file path and label are required for layer: '{name}'"
+            )
+        self.layers[name] = {
+            "name": name,
+            "file_path": file_path,
+            "label": label,
+            "use_hex_grid": hex_grid,
+            "geojson": None,
+            # The geojson loaded from the compiled cache has no geometries
+            "geojson_complete": False,
+            "index": None,
+            "prepared": None,
+            "hex_grid": None,
+            "ids": None,
+            "ready": False,
+        }
+
+    def get_layer_names(self) -> list:
+        """
+        Returns the names of the registered layers.
+        :return list:
+        """
+        return list(self.layers.keys())
+
+    def is_layer_ready(self, name) -> bool:
+        """
+        Returns True if the layer has been loaded and indexed.
+        :param str name: The name of the layer
+        :return bool:
+        """
+        return name in self.layers and self.layers[name]["ready"]
+
+    def get_layer(self, name) -> dict:
+        """
+        Returns the layer dictionary, loading it first if needed and autoload is enabled.
+        :param str name: The name of the layer
+        :return dict:
+        """
+        layer = self.layers.get(name, None)
+        if layer is None:
+            raise Exception(f"MDSPointInPolygon::get_layer() Unknown layer: '{name}'")
+        if not layer["ready"]:
+            if not self.autoload:
+                raise Exception(
+                    f"MDSPointInPolygon::get_layer() Layer not loaded: '{name}'"
+                )
+            self.load_layer(name)
+        return layer
+
+    def get_layer_value(self, name, key):
+        """
+        Returns a value from the layer dictionary (i.e. geojson, index, prepared or hex_grid).
+        If autoload is disabled, it returns the current value without loading the layer.
+        :param str name: The name of the layer
+        :param str key: The key in the layer dictionary
+        :return:
+        """
+        if key == "geojson":
+            return self.get_layer_geojson(name)
+        if self.autoload:
+            return self.get_layer(name)[key]
+        return self.layers[name][key]
+
+    def get_layer_geojson(self, name) -> dict:
+        """
+        Returns the geojson polygons of the layer, with their geometries. If the layer was loaded
+        from the compiled cache, the source geojson file is read the first time it is requested.
+        :param str name: The name of the layer
+        :return dict:
+        """
+        layer = self.get_layer(name) if self.autoload else self.layers[name]
+        if layer["geojson"] is None or layer["geojson_complete"]:
+            return layer["geojson"]
+        with self.lock:
+            if not layer["geojson_complete"]:
+                # Same file (the cache is keyed by its hash), so the features are in the same order
+                layer["geojson"] = self.mds_config.read_json(file_path=layer["file_path"])
+                layer["geojson_complete"] = True
+        return layer["geojson"]
+
+    def load_layer(self, name) -> dict:
+        """
+        Loads a layer from the compiled cache, or from its geojson file. Then it builds the rtree index,
+        the prepared geometries and, for hexagonal grids, the arithmetic lookup.
+        :param str name: The name of the layer
+        :return dict:
+        """
+        with self.lock:
+            layer = self.layers[name]
+            if layer["ready"]:
+                return layer
+
+            logging.debug(f"MDSPointInPolygon::load_layer() Loading layer: '{name}'")
+            cached = (
+                self.POLYGON_CACHE.load(name=name, file_path=layer["file_path"])
+                if self.POLYGON_CACHE is not None
+                else None
+            )
+            if cached is not None:
+                layer["geojson"] = cached["geojson"]
+                layer["geojson_complete"] = False
+                layer["index"] = cached["index"]
+                layer["prepared"] = self.initialize_prepared(cached["geometries"])
+                layer["ids"] = self.initialize_ids(layer["geojson"], label=layer["label"])
+                hex_grid_state = cached["metadata"].get("hex_grid", None)
+                layer["hex_grid"] = (
+                    MDSHexGrid.from_state(state=hex_grid_state, ids=layer["ids"])
+                    if hex_grid_state
+                    else None
+                )
+                layer["ready"] = True
+            else:
+                if layer["geojson"] is None:
+                    layer["geojson"] = self.mds_config.read_json(file_path=layer["file_path"])
+                layer["geojson_complete"] = True
+                self.initialize_layer_index(name)
+                self.save_layer_to_cache(name)
+            return layer
+
+    def load_layers(self):
+        """
+        Loads every registered layer and the raster (if enabled) right away, instead of on first use.
+        For example, before forking worker processes that should share them.
+        :return:
+        """
+        for name in self.layers:
+            self.load_layer(name)
+        self.get_raster()
+
+    def initialize_layer_index(self, name):
+        """
+        Builds the rtree index, the prepared geometries and the hexagonal grid (if enabled)
+        from the layer's geojson polygons. Each polygon is only built once.
+        :param str name: The name of the layer
+        :return:
+        """
+        layer = self.layers[name]
+        if not layer["geojson"]:
+            raise Exception(
+                f"MDSPointInPolygon::initialize_indexes() GeoJson Polygons not loaded for layer: '{name}'"
+            )
+        geometries = self.initialize_geometries(layer["geojson"])
+        layer["index"] = self.initialize_index(layer["geojson"], geometries=geometries)
+        layer["prepared"] = self.initialize_prepared(geometries)
+        layer["ids"] = self.initialize_ids(layer["geojson"], label=layer["label"])
+        layer["hex_grid"] = (
+            self.initialize_hex_grid(layer["geojson"], label=layer["label"])
+            if layer["use_hex_grid"]
+            else None
+        )
+        layer["ready"] = True
+
+    def save_layer_to_cache(self, name):
+        """
+        Compiles the layer into the cache, if the cache is enabled.
+        A failure to write the cache is logged, but it does not stop the process.
+        :param str name: The name of the layer
+        :return:
+        """
+        if self.POLYGON_CACHE is None:
+            return
+
+        layer = self.layers[name]
+        try:
+            self.POLYGON_CACHE.save(
+                name=name,
+                file_path=layer["file_path"],
+                polygons=layer["geojson"],
+                geometries=[prepared_poly.context for prepared_poly in layer["prepared"]],
+                metadata={
+                    "hex_grid": layer["hex_grid"].get_state() if layer["hex_grid"] else None
+                },
+            )
+        except Exception as e:
+            logging.debug(f"MDSPointInPolygon::save_layer_to_cache() Unable to save the cache: {e}")
 
     def initialize_geojson_polygons(self):
         """
-        Initializes the geojson polygons from json files.
+        Initializes the geojson polygons of every registered layer from json files.
+        :return:
+        """
+        for layer in self.layers.values():
+            layer["geojson"] = self.mds_config.read_json(file_path=layer["file_path"])
+            layer["geojson_complete"] = True
+
+    def initialize_indexes(self):
+        """
+        Initializes the internal rtree index classes and the prepared geometries
+        using the geojson polygons of every registered layer.
         :return:
         """
-        self.CENSUS_TRACTS_GEOJSON = self.mds_config.read_json(
-            file_path=self.mds_config.ATD_MDS_CENSUS_GEOJSON
+        for name in self.layers:
+            self.initialize_layer_index(name)
+
+    @staticmethod
+    def initialize_ids(polygons, label) -> np.ndarray:
+        """
+        Returns an array with the id (label property) of every feature, in the same order as the features.
+        :param dict polygons: The dictionary containing a GeoJson object
+        :param str label: The property dictionary key (aka label)
+        :return np.ndarray:
+        """
+        return np.array(
+            [
+                MDSPointInPolygon.get_polygon_property(poly=feature, label=label)
+                for feature in polygons["features"]
+            ],
+            dtype=object,
+        )
+
+    def get_raster(self) -> MDSRaster:
+        """
+        Returns the raster lookup table, loading it first if needed. Returns None if the raster is disabled.
+        :return MDSRaster:
+        """
+        if not self.raster_cell_size:
+            return None
+        if self.RASTER is None:
+            self.load_raster()
+        return self.RASTER
+
+    def load_raster(self) -> MDSRaster:
+        """
+        Loads the raster lookup table of the RASTER_LAYERS from the compiled cache, or builds it.
+        The raster is saved in the cache directory (if enabled) and memory mapped from there,
+        so all the worker processes share the same pages.
+        :return MDSRaster:
+        """
+        with self.lock:
+            if self.RASTER is not None:
+                return self.RASTER
+
+            layers = [self.get_layer(name) for name in self.RASTER_LAYERS]
+            base_path = (
+                self.POLYGON_CACHE.get_raster_base_path(
+                    file_paths=[layer["file_path"] for layer in layers],
+                    cell_size=self.raster_cell_size,
+                )
+                if self.POLYGON_CACHE is not None
+                else None
+            )
+            raster = MDSRaster.load(base_path) if base_path else None
+            if raster is None:
+                raster = MDSRaster.build(
+                    layers={
+                        layer["name"]: [prepared_poly.context for prepared_poly in layer["prepared"]]
+                        for layer in layers
+                    },
+                    cell_size=self.raster_cell_size,
+                )
+                if base_path:
+                    try:
+                        raster.save(base_path)
+                        raster = MDSRaster.load(base_path) or raster
+                    except Exception as e:
+                        logging.debug(f"MDSPointInPolygon::load_raster() Unable to save the raster: {e}")
+            self.RASTER = raster
+            return self.RASTER
+
+    @staticmethod
+    def initialize_hex_grid(polygons, label="id"):
+        """
+        Returns a hexagonal grid engine for the polygons, or None if they are not a regular hexagonal grid.
+        :param dict polygons: The dictionary containing a GeoJson object
+        :param str label: The property dictionary key (aka label) of the cell id
+        :return MDSHexGrid:
+        """
+        try:
+            return MDSHexGrid(polygons, label=label)
+        except Exception as e:
+            logging.debug(f"MDSPointInPolygon::initialize_hex_grid() Using rtree lookups instead: {e}")
+            return None
+
+    def get_layer_id(self, name, mds_point) -> str:
+        """
+        Returns the id (label property) of the layer polygon that contains the point, or None.
+        :param str name: The name of the layer
+        :param point mds_point: The shapely point object containing the coordinates
+        :return str:
+        """
+        longitude_x, latitude_y = mds_point.x, mds_point.y
+        # The other layers are not in the raster, they should not load it (or the default layers)
+        raster = self.get_raster() if name in self.RASTER_LAYERS else None
+        band = raster.get_band(name) if raster is not None else None
+        return self.find_layer_id(
+            layer=self.get_layer(name),
+            mds_point=mds_point,
+            longitude_x=longitude_x,
+            latitude_y=latitude_y,
+            raster_position=(
+                raster.get_position(band, longitude_x, latitude_y) if band is not None else None
+            ),
         )
-        self.DISTRICTS_GEOJSON = self.mds_config.read_json(
-            file_path=self.mds_config.ATD_MDS_DISTRICTS_GEOJSON
+
+    def find_layer_id(self, layer, mds_point, longitude_x, latitude_y, raster_position=None) -> str:
+        """
+        Returns the id (label property) of the layer polygon that contains the point, or None.
+        The coordinates are extracted from the point by the caller, so they are shared across layers.
+        :param dict layer: The layer dictionary
+        :param point mds_point: The shapely point object containing the coordinates
+        :param float longitude_x: The longitude of the point
+        :param float latitude_y: The latitude of the point
+        :param int raster_position: (Optional) The value read from the raster for this layer
+        :return str:
+        """
+        if raster_position is not None:
+            if raster_position == MDSRaster.OUTSIDE:
+                return None
+            if raster_position != MDSRaster.BOUNDARY:
+                return layer["ids"][raster_position]
+        # Without a raster, or on a boundary cell
+        if layer["hex_grid"] is not None:
+            position = layer["hex_grid"].get_position(longitude_x, latitude_y)
+            if position == MDSHexGrid.OUTSIDE:
+                return None
+            if position != MDSHexGrid.NEAR_EDGE:
+                return layer["hex_grid"].ids[position]
+        elif self.LOOKUP_CACHE is not None:
+            return self.get_layer_id_cached(layer, mds_point, longitude_x, latitude_y)
+        # Without a grid, or too close to an edge: test the actual polygons
+        poly = self.point_in_poly(
+            pt=mds_point,
+            idx=layer["index"],
+            polys=layer["geojson"],
+            geom_key="geometry",
+            prepared=layer["prepared"],
+            coordinates=(longitude_x, latitude_y),
         )
-        self.HEX_GEOJSON = self.mds_config.read_json(
-            file_path=self.mds_config.ATD_MDS_HEX_GEOJSON
+        return self.get_polygon_property(poly=poly, label=layer["label"])
+
+    def get_layer_id_cached(self, layer, mds_point, longitude_x, latitude_y) -> str:
+        """
+        Same as get_layer_id, but the answer is served from the lookup cache when the cell
+        around the point is known to be inside a single polygon, or outside all of them.
+        :param dict layer: The layer dictionary
+        :param point mds_point: The shapely point object containing the coordinates
+        :param float longitude_x: The longitude of the point
+        :param float latitude_y: The latitude of the point
+        :return str:
+        """
+        key = self.LOOKUP_CACHE.get_key(layer["name"], longitude_x, latitude_y)
+        value = self.LOOKUP_CACHE.get(key)
+        if (
+            value is not MDSLookupCache.MISSING
+            and value is not MDSLookupCache.BOUNDARY
+            and value is not MDSLookupCache.SEEN
+        ):
+            return value
+
+        poly = self.point_in_poly(
+            pt=mds_point,
+            idx=layer["index"],
+            polys=layer["geojson"],
+            geom_key="geometry",
+            prepared=layer["prepared"],
+            coordinates=(longitude_x, latitude_y),
         )
+        # Checking a cell costs more than a lookup, so only cells seen twice are checked
+        if value is MDSLookupCache.MISSING:
+            self.LOOKUP_CACHE.put(key, MDSLookupCache.SEEN)
+        elif value is MDSLookupCache.SEEN:
+            self.LOOKUP_CACHE.put(key, self.get_cell_id(layer, self.LOOKUP_CACHE.get_cell_box(key)))
+        return self.get_polygon_property(poly=poly, label=layer["label"])
 
-    def initialize_indexes(self):
+    def get_cell_id(self, layer, cell):
         """
-        Initializes the internal rtree index classes using the geojson polygons.
+        Returns the id of the only layer polygon that covers the whole cell, None if the cell
+        does not touch any polygon, or MDSLookupCache.BOUNDARY if the cell crosses a boundary.
+        :param dict layer: The layer dictionary
+        :param Polygon cell: The shapely polygon of the cell
         :return:
         """
-        if self.CENSUS_TRACTS_GEOJSON:
-            self.CENSUS_TRACTS_INDEX = self.initialize_index(self.CENSUS_TRACTS_GEOJSON)
-        else:
-            raise Exception(
-                "MDSPointInPolygon::initialize_indexes() GeoJson Polygons not loaded for Census tract"
+        touching = [
+            pos
+            for pos in layer["index"].intersection(cell.bounds)
+            if layer["prepared"][pos].intersects(cell)
+        ]
+        if len(touching) == 0:
+            return None
+        if len(touching) == 1 and layer["prepared"][touching[0]].contains(cell):
+            return self.get_polygon_property(
+                poly=layer["geojson"]["features"][touching[0]], label=layer["label"]
             )
-        if self.DISTRICTS_GEOJSON:
-            self.DISTRICTS_INDEX = self.initialize_index(self.DISTRICTS_GEOJSON)
-        else:
-            raise Exception(
-                "MDSPointInPolygon::initialize_indexes() GeoJson Polygons not loaded for Districts"
+        return MDSLookupCache.BOUNDARY
+
+    def get_lookup_cache_stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the lookup cache, or None if the cache is disabled.
+        :return dict:
+        """
+        return self.LOOKUP_CACHE.get_stats() if self.LOOKUP_CACHE is not None else None
+
+    def get_layer_ids_batch(self, name, longitudes, latitudes, use_raster=True) -> np.ndarray:
+        """
+        Returns an array with the id (label property) of the layer polygon containing each point, or None if not found.
+        :param str name: The name of the layer
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :param bool use_raster: (Optional) Set to False to skip the raster lookup table.
+        :return np.ndarray:
+        """
+        raster = self.get_raster() if use_raster and name in self.RASTER_LAYERS else None
+        layer = self.get_layer(name)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        band = raster.get_band(name) if raster is not None else None
+        if band is not None:
+            positions = raster.get_positions(band, longitudes, latitudes)
+            results = np.full(len(positions), None, dtype=object)
+            found = positions >= 0
+            results[found] = layer["ids"][positions[found]]
+            # Only the points in a boundary cell need the polygon test
+            boundary = positions == MDSRaster.BOUNDARY
+            if np.any(boundary):
+                results[boundary] = self.get_layer_ids_batch(
+                    name, longitudes[boundary], latitudes[boundary], use_raster=False
+                )
+            return results
+
+        if layer["hex_grid"] is None:
+            return self.point_in_poly_batch(
+                longitudes=longitudes,
+                latitudes=latitudes,
+                idx=layer["index"],
+                polys=layer["geojson"],
+                prepared=layer["prepared"],
+                label=layer["label"],
             )
-        if self.HEX_GEOJSON:
-            self.HEX_INDEX = self.initialize_index(self.HEX_GEOJSON)
-        else:
-            raise Exception(
-                "MDSPointInPolygon::initialize_indexes() GeoJson Polygons not loaded for Hexagons"
+
+        positions = layer["hex_grid"].get_positions(longitudes, latitudes)
+        results = np.full(len(positions), None, dtype=object)
+        found = positions >= 0
+        results[found] = layer["hex_grid"].ids[positions[found]]
+        # Only the points close to an edge need the polygon test
+        near_edge = positions == MDSHexGrid.NEAR_EDGE
+        if np.any(near_edge):
+            results[near_edge] = self.point_in_poly_batch(
+                longitudes=longitudes[near_edge],
+                latitudes=latitudes[near_edge],
+                idx=layer["index"],
+                polys=layer["geojson"],
+                prepared=layer["prepared"],
+                label=layer["label"],
             )
+        return results
 
     def get_census_tract_id(self, mds_point) -> str:
         """
@@ -136,15 +770,7 @@ class MDSPointInPolygon:
         :param point mds_point: The shapely point object containing the coordinates
         :return str:
         """
-        poly = self.point_in_poly(
-            pt=mds_point,
-            idx=self.CENSUS_TRACTS_INDEX,
-            polys=self.CENSUS_TRACTS_GEOJSON,
-            geom_key="geometry"
-        )
-        return self.get_polygon_property(
-            poly=poly, label="GEOID10"
-        )
+        return self.get_layer_id(name="census_tracts", mds_point=mds_point)
 
     def get_district_id(self, mds_point) -> str:
         """
@@ -152,15 +778,7 @@ class MDSPointInPolygon:
         :param point mds_point: The shapely point object containing the coordinates
         :return str:
         """
-        poly = self.point_in_poly(
-            pt=mds_point,
-            idx=self.DISTRICTS_INDEX,
-            polys=self.DISTRICTS_GEOJSON,
-            geom_key="geometry"
-        )
-        return self.get_polygon_property(
-            poly=poly, label="district_n"
-        )
+        return self.get_layer_id(name="districts", mds_point=mds_point)
 
     def get_hex_id(self, mds_point) -> str:
         """
@@ -168,15 +786,154 @@ class MDSPointInPolygon:
         :param point mds_point: The shapely point object containing the coordinates
         :return str:
         """
-        poly = self.point_in_poly(
-            pt=mds_point,
-            idx=self.HEX_INDEX,
-            polys=self.HEX_GEOJSON,
-            geom_key="geometry"
-        )
-        return self.get_polygon_property(
-            poly=poly, label="id"
-        )
+        return self.get_layer_id(name="hexagons", mds_point=mds_point)
+
+    def lookup_batch(self, longitudes, latitudes) -> dict:
+        """
+        Returns the census tract, council district and hexagon ids for many points in a single call.
+        Each value in the dictionary is an array aligned with the provided coordinates,
+        points that are not found in a polygon have a value of None.
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return dict:
+        """
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        if longitudes.shape != latitudes.shape:
+            raise Exception(
+                "MDSPointInPolygon::lookup_batch() longitudes and latitudes must have the same shape"
+            )
+
+        return {
+            key: self.get_layer_ids_batch(name, longitudes, latitudes)
+            for key, name in self.RESOLVE_LAYERS.items()
+        }
+
+    def get_nesting(self) -> dict:
+        """
+        Returns, for each of the NESTED_LAYERS, a list indexed by the position of the hexagons (NESTING_LAYER).
+        Each item is a tuple with the id of the only polygon that covers the whole hexagon (or None if no polygon
+        touches it) and an empty tuple, or None and the positions of the polygons that touch the hexagon.
+        Returns None if the hexagons are not a regular grid.
+        :return dict:
+        """
+        if self.NESTING is not None:
+            return self.NESTING or None
+
+        with self.lock:
+            if self.NESTING is not None:
+                return self.NESTING or None
+            parent = self.get_layer(self.NESTING_LAYER)
+            if parent["hex_grid"] is None:
+                self.NESTING = {}
+                return None
+
+            logging.debug("MDSPointInPolygon::get_nesting() Finding the polygons touching each hexagon")
+            nesting = {}
+            for name in self.NESTED_LAYERS:
+                layer = self.get_layer(name)
+                entries = []
+                for parent_poly in parent["prepared"]:
+                    cell = parent_poly.context
+                    touching = tuple(
+                        pos
+                        for pos in layer["index"].intersection(cell.bounds)
+                        if layer["prepared"][pos].intersects(cell)
+                    )
+                    if len(touching) == 0:
+                        entries.append((None, ()))
+                    elif len(touching) == 1 and layer["prepared"][touching[0]].contains(cell):
+                        entries.append((layer["ids"][touching[0]], ()))
+                    else:
+                        entries.append((None, touching))
+                nesting[name] = entries
+            self.NESTING = nesting
+            return self.NESTING
+
+    def find_nested_layer_id(self, name, parent_position, mds_point, longitude_x, latitude_y) -> str:
+        """
+        Returns the id of the layer polygon that contains a point, knowing the hexagon that contains it.
+        Only the polygons touching the hexagon are tested, and none if a single polygon covers it.
+        :param str name: The name of the layer
+        :param int parent_position: The position of the hexagon that contains the point
+        :param point mds_point: The shapely point object containing the coordinates
+        :param float longitude_x: The longitude of the point
+        :param float latitude_y: The latitude of the point
+        :return str:
+        """
+        layer = self.layers[name]
+        value, candidates = self.NESTING[name][parent_position]
+        if not candidates:
+            return value
+        found = [pos for pos in candidates if layer["prepared"][pos].intersects(mds_point)]
+        if len(found) == 1:
+            return layer["ids"][found[0]]
+        if len(found) == 0:
+            return None
+        # On a shared edge, keep the answer of the rtree search
+        return self.find_layer_id(layer, mds_point, longitude_x, latitude_y)
+
+    def resolve(self, mds_point) -> dict:
+        """
+        Returns the census tract, council district and hexagon ids of a point in a single call.
+        The coordinates are extracted once and the raster (if enabled) is read once for all the layers.
+        The hexagon is found first, then only the tracts and districts touching it are tested.
+        :param point mds_point: The shapely point object containing the coordinates
+        :return dict:
+        """
+        longitude_x, latitude_y = mds_point.x, mds_point.y
+        raster = self.get_raster()
+        cell = raster.get_cell_positions(longitude_x, latitude_y) if raster is not None else None
+        nesting = self.get_nesting()
+
+        # The position of the hexagon containing the point, if it is certain
+        parent_position = MDSHexGrid.NEAR_EDGE
+        if nesting is not None:
+            band = raster.get_band(self.NESTING_LAYER) if cell is not None else None
+            if band is not None and cell[band] >= 0:
+                parent_position = cell[band]
+            else:
+                parent_position = self.layers[self.NESTING_LAYER]["hex_grid"].get_position(
+                    longitude_x, latitude_y
+                )
+
+        results = {}
+        for key, name in self.RESOLVE_LAYERS.items():
+            band = raster.get_band(name) if cell is not None else None
+            raster_position = cell[band] if band is not None else None
+            if raster_position is not None and raster_position != MDSRaster.BOUNDARY:
+                results[key] = (
+                    self.layers[name]["ids"][raster_position] if raster_position >= 0 else None
+                )
+            elif parent_position >= 0 and name in self.NESTED_LAYERS:
+                results[key] = self.find_nested_layer_id(
+                    name, parent_position, mds_point, longitude_x, latitude_y
+                )
+            else:
+                results[key] = self.find_layer_id(
+                    layer=self.get_layer(name),
+                    mds_point=mds_point,
+                    longitude_x=longitude_x,
+                    latitude_y=latitude_y,
+                )
+        return results
+
+    def resolve_many(self, points) -> list:
+        """
+        Returns the census tract, council district and hexagon ids of many points,
+        as a list of dictionaries aligned with the points. It uses a single batch lookup per layer.
+        :param list points: The shapely point objects
+        :return list:
+        """
+        coordinates = np.asarray([point.coords[0][:2] for point in points], dtype=np.float64)
+        if len(coordinates) == 0:
+            return []
+        results = self.lookup_batch(longitudes=coordinates[:, 0], latitudes=coordinates[:, 1])
+        keys = list(results.keys())
+        return [
+            dict(zip(keys, values))
+            for values in zip(*[results[key].tolist() for key in keys])
+        ]
 
     def get_census_tracts_geojson(self) -> dict:
         """
@@ -0,0 +1,193 @@
+import os
+import json
+import mmap
+import hashlib
+import logging
+
+import numpy as np
+from rtree import index
+from shapely import wkb
+
+try:
+    # Shapely 2.x decodes an array of WKB values in a single call
+    from shapely import from_wkb
+except ImportError:
+    from_wkb = None
+
+
+class MDSPolygonCache:
+    __slots__ = [
+        "cache_dir",
+    ]
+
+    # Bump whenever the layout of the cache files changes
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir):
+        """
+        Initializes a compiled cache of polygon layers on disk. Each layer is stored as a disk-backed
+        rtree index, the WKB encoded geometries and the property columns, keyed by a hash of the source file.
+        :param str cache_dir: The directory where the cache files are stored
+        """
+        logging.debug(f"MDSPolygonCache::__init__() Initializing cache in '{cache_dir}'")
+        if not cache_dir:
+            raise Exception("MDSPolygonCache::__init__() A cache directory is required")
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_file_hash(file_path) -> str:
+        """
+        Returns the sha256 hash of a file's contents.
+        :param str file_path: The path to the file
+        :return str:
+        """
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as fin:
+            for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def get_base_path(self, name, file_path) -> str:
+        """
+        Returns the path (without extension) of the cache files for a layer.
+        :param str name: The name of the layer
+        :param str file_path: The path to the source geojson file
+        :return str:
+        """
+        key = self.get_file_hash(file_path)[:24]
+        return os.path.join(self.cache_dir, f"{name}-v{self.CACHE_VERSION}-{key}")
+
+    def get_raster_base_path(self, file_paths, cell_size) -> str:
+        """
+        Returns the path (without extension) of the raster built from several layers.
+        :param list file_paths: The paths to the source geojson files, in the order of the raster layers
+        :param float cell_size: The size of the raster cells in meters
+        :return str:
+        """
+        sha256 = hashlib.sha256(f"{cell_size}".encode())
+        for file_path in file_paths:
+            sha256.update(self.get_file_hash(file_path).encode())
+        return os.path.join(self.cache_dir, f"raster-v{self.CACHE_VERSION}-{sha256.hexdigest()[:24]}")
+
+    @staticmethod
+    def get_property_columns(polygons) -> dict:
+        """
+        Returns the feature properties as columns, a dictionary of lists aligned with the features.
+        :param dict polygons: The dictionary containing a GeoJson object
+        :return dict:
+        """
+        features = polygons["features"]
+        columns = {}
+        for pos, feature in enumerate(features):
+            for label, value in (feature.get("properties") or {}).items():
+                if label not in columns:
+                    columns[label] = [None] * len(features)
+                columns[label][pos] = value
+        return columns
+
+    @staticmethod
+    def get_features(columns, total) -> list:
+        """
+        Rebuilds geojson features (properties only) from the property columns.
+        :param dict columns: The property columns
+        :param int total: The number of features
+        :return list:
+        """
+        return [
+            {
+                "type": "Feature",
+                "properties": {label: values[pos] for label, values in columns.items()},
+                "geometry": None,
+            }
+            for pos in range(total)
+        ]
+
+    def save(self, name, file_path, polygons, geometries, metadata=None) -> str:
+        """
+        Compiles a layer into the cache, returns the base path of the cache files.
+        :param str name: The name of the layer
+        :param str file_path: The path to the source geojson file
+        :param dict polygons: The dictionary containing a GeoJson object
+        :param list geometries: The shapely geometries of the features
+        :param dict metadata: (Optional) Any additional json-serializable values to store with the layer
+        :return str:
+        """
+        base_path = self.get_base_path(name=name, file_path=file_path)
+        # Each process writes to its own temporary files, then moves them into place
+        tmp_path = f"{base_path}.{os.getpid()}.tmp"
+        logging.debug(f"MDSPolygonCache::save() Compiling layer '{name}' into '{base_path}'")
+
+        disk_index = index.Index(tmp_path)
+        for pos, geometry in enumerate(geometries):
+            disk_index.insert(pos, geometry.bounds)
+        disk_index.close()
+
+        encoded = [wkb.dumps(geometry) for geometry in geometries]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(geometry) for geometry in encoded])
+        with open(f"{tmp_path}.wkb", "wb") as fout:
+            fout.write(b"".join(encoded))
+        with open(f"{tmp_path}.offsets.npy", "wb") as fout:
+            np.save(fout, offsets)
+        with open(f"{tmp_path}.json", "w") as fout:
+            json.dump(
+                {
+                    "version": self.CACHE_VERSION,
+                    "total": len(geometries),
+                    "properties": self.get_property_columns(polygons),
+                    "metadata": metadata or {},
+                },
+                fout,
+            )
+
+        # The json file goes last, it marks the layer as complete
+        for extension in [".idx", ".dat", ".wkb", ".offsets.npy", ".json"]:
+            os.replace(f"{tmp_path}{extension}", f"{base_path}{extension}")
+        return base_path
+
+    def load(self, name, file_path) -> dict:
+        """
+        Loads a compiled layer from the cache. Returns None if the layer is not in the cache
+        or the source file has changed. Otherwise, it returns a dictionary with the geojson
+        features (properties only), the rtree index, the shapely geometries and the metadata.
+        :param str name: The name of the layer
+        :param str file_path: The path to the source geojson file
+        :return dict:
+        """
+        base_path = self.get_base_path(name=name, file_path=file_path)
+        if not os.path.exists(f"{base_path}.json"):
+            logging.debug(f"MDSPolygonCache::load() Layer '{name}' not found in cache")
+            return None
+
+        try:
+            with open(f"{base_path}.json", "r") as fin:
+                layer = json.loads(fin.read())
+            offsets = np.load(f"{base_path}.offsets.npy", mmap_mode="r")
+            with open(f"{base_path}.wkb", "rb") as fin:
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as encoded:
+                    chunks = [
+                        encoded[start:end]
+                        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+                    ]
+            if from_wkb is not None:
+                geometries = list(from_wkb(np.array(chunks, dtype=object)))
+            else:
+                geometries = [wkb.loads(chunk) for chunk in chunks]
+            disk_index = index.Index(base_path)
+        except Exception as e:
+            logging.debug(f"MDSPolygonCache::load() Could not load layer '{name}': {e}")
+            return None
+
+        if layer.get("version") != self.CACHE_VERSION or len(geometries) != layer.get("total"):
+            return None
+
+        return {
+            "geojson": {
+                "type": "FeatureCollection",
+                "features": self.get_features(layer["properties"], layer["total"]),
+            },
+            "index": disk_index,
+            "geometries": geometries,
+            "metadata": layer.get("metadata", {}),
+        }
@@ -0,0 +1,297 @@
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+try:
+    # Shapely 2.x provides a vectorized containment test for coordinate arrays
+    from shapely import contains_xy
+except ImportError:
+    contains_xy = None
+    from shapely import vectorized
+
+
+class MDSRaster:
+    __slots__ = [
+        "layers",
+        "origin_x",
+        "origin_y",
+        "cell_x",
+        "cell_y",
+        "values",
+    ]
+
+    # Values stored instead of a feature position
+    OUTSIDE = -1
+    BOUNDARY = -2
+
+    # Approximate length in meters of one degree of latitude
+    METERS_PER_DEGREE = 111320.0
+
+    def __init__(self, layers, origin_x, origin_y, cell_x, cell_y, values):
+        """
+        Initializes a raster lookup table. Each cell stores, for every layer, the position of the only feature
+        that covers the whole cell, OUTSIDE if no feature touches the cell, or BOUNDARY otherwise.
+        :param list layers: The names of the layers, in the same order as the last axis of the values
+        :param float origin_x: The longitude of the left edge of the raster
+        :param float origin_y: The latitude of the bottom edge of the raster
+        :param float cell_x: The width of the cells in degrees
+        :param float cell_y: The height of the cells in degrees
+        :param np.ndarray values: The feature positions, with shape (rows, columns, layers)
+        """
+        if values.ndim != 3 or values.shape[2] != len(layers):
+            raise Exception("MDSRaster::__init__() The values do not match the layers")
+        self.layers = list(layers)
+        self.origin_x = float(origin_x)
+        self.origin_y = float(origin_y)
+        self.cell_x = float(cell_x)
+        self.cell_y = float(cell_y)
+        self.values = values
+
+    @staticmethod
+    def get_rings(geometry) -> list:
+        """
+        Returns the coordinates of every exterior and interior ring of a polygon or multipolygon.
+        :param Polygon geometry: The shapely geometry
+        :return list:
+        """
+        polygons = geometry.geoms if hasattr(geometry, "geoms") else [geometry]
+        rings = []
+        for polygon in polygons:
+            rings.append(np.asarray(polygon.exterior.coords, dtype=np.float64))
+            for interior in polygon.interiors:
+                rings.append(np.asarray(interior.coords, dtype=np.float64))
+        return rings
+
+    @classmethod
+    def build(cls, layers, cell_size=20):
+        """
+        Builds the raster over the union extent of the layers.
+        :param dict layers: The shapely geometries of each layer, keyed by the layer name
+        :param float cell_size: The approximate size of the cells in meters
+        :return MDSRaster:
+        """
+        logging.debug(f"MDSRaster::build() Building a {cell_size} m raster for: {list(layers)}")
+        bounds = np.array(
+            [geometry.bounds for geometries in layers.values() for geometry in geometries],
+            dtype=np.float64,
+        )
+        if len(bounds) == 0:
+            raise Exception("MDSRaster::build() There are no geometries to rasterize")
+
+        min_x, min_y = bounds[:, 0].min(), bounds[:, 1].min()
+        max_x, max_y = bounds[:, 2].max(), bounds[:, 3].max()
+        cell_y = cell_size / cls.METERS_PER_DEGREE
+        cell_x = cell_y / math.cos(math.radians((min_y + max_y) / 2))
+        # Keep one empty cell around the extent
+        origin_x, origin_y = min_x - cell_x, min_y - cell_y
+        shape = (
+            int(math.ceil((max_y - origin_y) / cell_y)) + 1,
+            int(math.ceil((max_x - origin_x) / cell_x)) + 1,
+        )
+
+        total = max(len(geometries) for geometries in layers.values())
+        dtype = np.int16 if total < np.iinfo(np.int16).max else np.int32
+        values = np.empty(shape + (len(layers),), dtype=dtype)
+        raster = cls(
+            layers=list(layers.keys()),
+            origin_x=origin_x,
+            origin_y=origin_y,
+            cell_x=cell_x,
+            cell_y=cell_y,
+            values=values,
+        )
+        for band, geometries in enumerate(layers.values()):
+            values[:, :, band] = raster.rasterize(geometries, shape)
+        return raster
+
+    def rasterize(self, geometries, shape) -> np.ndarray:
+        """
+        Returns the feature positions of a single layer, with the boundary cells marked.
+        :param list geometries: The shapely geometries of the layer
+        :param tuple shape: The number of rows and columns of the raster
+        :return np.ndarray:
+        """
+        positions = np.full(shape, self.OUTSIDE, dtype=np.int32)
+        counts = np.zeros(shape, dtype=np.uint8)
+
+        # The cell centers decide which feature covers the cells without a boundary
+        for pos, geometry in enumerate(geometries):
+            min_x, min_y, max_x, max_y = geometry.bounds
+            column_start, row_start = self.get_cell(min_x, min_y)
+            column_end, row_end = self.get_cell(max_x, max_y)
+            columns = np.arange(column_start, column_end + 1)
+            rows = np.arange(row_start, row_end + 1)
+            center_x, center_y = np.meshgrid(
+                self.origin_x + (columns + 0.5) * self.cell_x,
+                self.origin_y + (rows + 0.5) * self.cell_y,
+            )
+            if contains_xy is not None:
+                inside = contains_xy(geometry, center_x, center_y)
+            else:
+                inside = vectorized.contains(geometry, center_x, center_y)
+            window = (slice(row_start, row_end + 1), slice(column_start, column_end + 1))
+            positions[window][inside] = pos
+            counts[window] += inside.astype(np.uint8)
+
+        # Overlapping features and the cells crossed by a ring can't be answered by the raster
+        positions[counts > 1] = self.BOUNDARY
+        positions[self.get_boundary_mask(geometries, shape)] = self.BOUNDARY
+        return positions
+
+    def get_boundary_mask(self, geometries, shape) -> np.ndarray:
+        """
+        Returns a boolean mask of the cells crossed by the rings of the geometries. The rings are sampled
+        every half cell, and the mask is grown by one cell in every direction, so no crossed cell is missed.
+        :param list geometries: The shapely geometries of the layer
+        :param tuple shape: The number of rows and columns of the raster
+        :return np.ndarray:
+        """
+        mask = np.zeros(shape, dtype=bool)
+        rings = [ring for geometry in geometries for ring in self.get_rings(geometry)]
+        if len(rings) == 0:
+            return mask
+        start = np.concatenate([ring[:-1] for ring in rings])
+        end = np.concatenate([ring[1:] for ring in rings])
+
+        # Number of samples of each segment, so consecutive samples are at most half a cell apart
+        steps = np.ceil(
+            2 * np.maximum(
+                np.abs(end[:, 0] - start[:, 0]) / self.cell_x,
+                np.abs(end[:, 1] - start[:, 1]) / self.cell_y,
+            )
+        ).astype(np.int64) + 1
+        segment = np.repeat(np.arange(len(steps)), steps)
+        offset = np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)
+        fraction = (offset / np.maximum(steps - 1, 1)[segment])[:, None]
+        samples = start[segment] + (end[segment] - start[segment]) * fraction
+
+        columns = np.floor((samples[:, 0] - self.origin_x) / self.cell_x).astype(np.int64)
+        rows = np.floor((samples[:, 1] - self.origin_y) / self.cell_y).astype(np.int64)
+        mask[rows.clip(0, shape[0] - 1), columns.clip(0, shape[1] - 1)] = True
+
+        grown = mask.copy()
+        grown[1:, :] |= mask[:-1, :]
+        grown[:-1, :] |= mask[1:, :]
+        rows_grown = grown.copy()
+        grown[:, 1:] |= rows_grown[:, :-1]
+        grown[:, :-1] |= rows_grown[:, 1:]
+        return grown
+
+    def get_cell(self, longitude_x, latitude_y) -> (int, int):
+        """
+        Returns the column and row of the cell containing a point, limited to the raster.
+        :param float longitude_x: Longitude value
+        :param float latitude_y: Latitude value
+        :return (int, int):
+        """
+        column = math.floor((longitude_x - self.origin_x) / self.cell_x)
+        row = math.floor((latitude_y - self.origin_y) / self.cell_y)
+        return (
+            min(max(column, 0), self.values.shape[1] - 1),
+            min(max(row, 0), self.values.shape[0] - 1),
+        )
+
+    def get_band(self, name) -> int:
+        """
+        Returns the position of a layer in the last axis of the values, or None if the layer is not in the raster.
+        :param str name: The name of the layer
+        :return int:
+        """
+        return self.layers.index(name) if name in self.layers else None
+
+    def get_position(self, band, longitude_x, latitude_y) -> int:
+        """
+        Returns the feature position stored for a single point, or one of OUTSIDE or BOUNDARY.
+        :param int band: The position of the layer
+        :param float longitude_x: Longitude value
+        :param float latitude_y: Latitude value
+        :return int:
+        """
+        column = (longitude_x - self.origin_x) / self.cell_x
+        row = (latitude_y - self.origin_y) / self.cell_y
+        if column < 0 or row < 0 or column >= self.values.shape[1] or row >= self.values.shape[0]:
+            return self.OUTSIDE
+        return int(self.values[int(row), int(column), band])
+
+    def get_cell_positions(self, longitude_x, latitude_y) -> list:
+        """
+        Returns the values of every layer stored for a single point, with OUTSIDE for every layer if the point is not in the raster.
+        :param float longitude_x: Longitude value
+        :param float latitude_y: Latitude value
+        :return list:
+        """
+        column = (longitude_x - self.origin_x) / self.cell_x
+        row = (latitude_y - self.origin_y) / self.cell_y
+        if column < 0 or row < 0 or column >= self.values.shape[1] or row >= self.values.shape[0]:
+            return [self.OUTSIDE] * len(self.layers)
+        return self.values[int(row), int(column)].tolist()
+
+    def get_positions(self, band, longitudes, latitudes) -> np.ndarray:
+        """
+        Returns the feature positions stored for many points, or one of OUTSIDE or BOUNDARY.
+        :param int band: The position of the layer
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :return np.ndarray:
+        """
+        columns = np.floor((np.asarray(longitudes, dtype=np.float64) - self.origin_x) / self.cell_x)
+        rows = np.floor((np.asarray(latitudes, dtype=np.float64) - self.origin_y) / self.cell_y)
+        in_raster = (
+            (columns >= 0)
+            & (rows >= 0)
+            & (columns < self.values.shape[1])
+            & (rows < self.values.shape[0])
+        )
+        positions = np.full(columns.shape, self.OUTSIDE, dtype=np.int64)
+        positions[in_raster] = self.values[
+            rows[in_raster].astype(np.int64), columns[in_raster].astype(np.int64), band
+        ]
+        return positions
+
+    def save(self, base_path):
+        """
+        Saves the raster as a NumPy .npy file, so it can be memory mapped, and its parameters as a json file.
+        :param str base_path: The path of the files, without the extension
+        :return:
+        """
+        logging.debug(f"MDSRaster::save() Saving raster to '{base_path}'")
+        tmp_path = f"{base_path}.{os.getpid()}.tmp"
+        with open(f"{tmp_path}.npy", "wb") as fout:
+            np.save(fout, self.values)
+        with open(f"{tmp_path}.json", "w") as fout:
+            json.dump(
+                {
+                    "layers": self.layers,
+                    "origin_x": self.origin_x,
+                    "origin_y": self.origin_y,
+                    "cell_x": self.cell_x,
+                    "cell_y": self.cell_y,
+                },
+                fout,
+            )
+        # The json file goes last, it marks the raster as complete
+        for extension in [".npy", ".json"]:
+            os.replace(f"{tmp_path}{extension}", f"{base_path}{extension}")
+
+    @classmethod
+    def load(cls, base_path, mmap=True):
+        """
+        Loads a raster saved with save(), or returns None if it does not exist.
+        The values are memory mapped by default, so the pages are shared between processes.
+        :param str base_path: The path of the files, without the extension
+        :param bool mmap: (Optional) Set to False to read the whole raster in memory
+        :return MDSRaster:
+        """
+        if not os.path.exists(f"{base_path}.json"):
+            return None
+        try:
+            with open(f"{base_path}.json", "r") as fin:
+                parameters = json.loads(fin.read())
+            values = np.load(f"{base_path}.npy", mmap_mode="r" if mmap else None)
+            return cls(values=values, **parameters)
+        except Exception as e:
+            logging.debug(f"MDSRaster::load() Could not load the raster '{base_path}': {e}")
+            return None
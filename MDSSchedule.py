@@ -1,6 +1,6 @@
+import json
 import logging
 from datetime import datetime
-from string import Template
 
 from MDSConfig import MDSConfig
 
@@ -9,7 +9,7 @@ class MDSSchedule:
     __slots__ = [
         "mds_config",
         "mds_http_graphql",
-        "query",
+        "variables",
         "provider_name",
         "status_id",
         "time_min",
@@ -18,6 +18,49 @@ class MDSSchedule:
         "status_operator",
     ]
 
+    # The queries are constant documents, the values are sent as variables
+    graphql_query = """
+        query fetchPendingSchedules($where: api_schedule_bool_exp!) {
+            api_schedule(where: $where, order_by: {date: asc}) {
+                provider_id
+                schedule_id
+                year
+                month
+                day
+                hour
+                status_id
+                socrata_status
+            }
+        }
+    """
+
+    graphql_update_status = """
+        mutation mutationUpdateScheduleStatus($where: api_schedule_bool_exp!, $values: api_schedule_set_input!) {
+            update_api_schedule(where: $where, _set: $values) {
+                affected_rows
+            }
+        }
+    """
+
+    graphql_schedule_by_id = """
+        query getScheduleById($where: api_schedule_bool_exp!) {
+            api_schedule(where: $where) {
+                schedule_id
+                status_id
+                year
+                month
+                day
+                hour
+                payload
+                message
+                provider {
+                    id
+                    provider_name
+                }
+            }
+        }
+    """
+
     def __init__(
         self,
         mds_config,
@@ -56,7 +99,8 @@ class MDSSchedule:
 
     def _initialize_query(self):
         """
-        Generates a GraphQL query using the standard Template library, and populates into class variable.
+        Generates the variables of the GraphQL query, and populates into class variable.
+        The query itself is the same document for every schedule.
         :return:
         """
         logging.debug("MDSSchedule::_initialize_query() Initializing Query")
@@ -74,50 +118,24 @@ class MDSSchedule:
             self.time_min = self.time_max
 
         logging.debug(f"MDSSchedule::_initialize_query() Generating query... status_check: {self.status_check}")
-        self.query = Template(
-            """
-                    query fetchPendingSchedules {
-                        api_schedule(
-                            where: {
-                                provider: {provider_name: {_eq: "$provider_name"}},
-                                %STATUS_CHECK%
-                                
-                                date:{_gt:"$min_year-$min_month-$min_day $min_hour:00:00"}
-                                
-                                _and: {
-                                    date:{_lte:"$max_year-$max_month-$max_day $max_hour:00:00"}
-                                }
-                            }, order_by: {date: asc}
-                        ) {
-                            provider_id
-                            schedule_id
-                            year
-                            month
-                            day
-                            hour
-                            status_id
-                        }
-                    }
-                """.replace(
-                "%STATUS_CHECK%",
-                ("", "status_id: {$status_operator: $status_id},")[self.status_check],
-            )
-        ).substitute(
-            {
-                "provider_name": self.provider_name,
-                "status_id": self.status_id,
-                "status_operator": self.status_operator,
-                "min_year": self.time_min.year,
-                "min_month": self.time_min.month,
-                "min_day": self.time_min.day,
-                "min_hour": f"{self.time_min.hour:02d}",
-                "max_year": self.time_max.year,
-                "max_month": self.time_max.month,
-                "max_day": self.time_max.day,
-                "max_hour": f"{self.time_max.hour:02d}",
-            }
-        )
-        logging.debug(f"Query: {self.query}")
+        where = {
+            "provider": {"provider_name": {"_eq": self.provider_name}},
+            "date": {"_gt": self.get_schedule_date(self.time_min)},
+            "_and": {"date": {"_lte": self.get_schedule_date(self.time_max)}},
+        }
+        if self.status_check:
+            where["status_id"] = {self.status_operator: self.status_id}
+        self.variables = {"where": where}
+        logging.debug(f"Variables: {self.variables}")
+
+    @staticmethod
+    def get_schedule_date(value) -> str:
+        """
+        Returns the date and hour of a datetime as a string the date column can be compared to.
+        :param datetime value: The datetime object
+        :return str:
+        """
+        return f"{value.year}-{value.month}-{value.day} {value.hour:02d}:00:00"
 
     @staticmethod
     def is_quotable_value(value) -> bool:
@@ -149,47 +167,38 @@ class MDSSchedule:
 
     def get_schedule_update_status_query(self, schedule_id, status_id, **kwargs) -> str:
         """
-        Generates the graphql query to run against the api.
+        Returns the graphql mutation to run against the api, the document is the same for every update.
+        The values are provided by get_schedule_update_status_variables().
         :param int schedule_id: The schedule id to be updated
         :param int status_id:  The status_id to be set to.
         :param dict kwargs:  Any additional arguments to be set to.
-        :return:
+        :return str:
         """
+        return self.graphql_update_status
 
-        additional_args = ""
-        for k, v in kwargs.items():
-            if self.is_quotable_value(v) and self.is_quoted(v) is False:
-                value = self.escape_quotes(v)
-                value = f'"{value}"'
-            else:
-                if str(v) == "True" or str(v) == "False":
-                    value = str(v).lower()
-                else:
-                    value = v
-            # value = value.replace('\\\\\\"None\\\\\\"', 'null')
-            additional_args += f"\n                    {k}: {value},"
-
-        return Template(
-            """
-            mutation mutationUpdateScheduleStatus {
-                update_api_schedule(
-                where: {
-                    schedule_id: {_eq: $schedule_id}
-                }, 
-                _set: {
-                    status_id: $status_id,
-                    $additional_args
-                }
-                ){ affected_rows }
-            }
+    def get_schedule_update_status_variables(self, schedule_id, status_id, **kwargs) -> dict:
         """
-        ).substitute(
-            {
-                "schedule_id": str(schedule_id),
-                "status_id": str(status_id),
-                "additional_args": additional_args,
-            }
-        )
+        Returns the variables of the update mutation.
+        :param int schedule_id: The schedule id to be updated
+        :param int status_id:  The status_id to be set to.
+        :param dict kwargs:  Any additional arguments to be set to.
+        :return dict:
+        """
+        values = {"status_id": status_id}
+        for k, v in kwargs.items():
+            value = str(v) if self.is_quotable_value(v) else v
+            # A value already quoted (as it would be written in the query) is sent decoded
+            if isinstance(value, str) and self.is_quoted(value):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    value = value[1:-1]
+            values[k] = value
+
+        return {
+            "where": {"schedule_id": {"_eq": schedule_id}},
+            "values": values,
+        }
 
     def set_schedule_status(self, schedule_id, status_id, **kwargs) -> str:
         """
@@ -203,7 +212,10 @@ class MDSSchedule:
         query = self.get_schedule_update_status_query(
             schedule_id=schedule_id, status_id=status_id, **kwargs,
         )
-        response = self.mds_http_graphql.request(query)
+        variables = self.get_schedule_update_status_variables(
+            schedule_id=schedule_id, status_id=status_id, **kwargs,
+        )
+        response = self.mds_http_graphql.request(query, variables=variables)
         return response["data"]["update_api_schedule"]["affected_rows"]
 
     def get_query(self) -> str:
@@ -211,41 +223,30 @@ class MDSSchedule:
         Retrieves the query from memory
         :return str:
         """
-        return self.query
+        return self.graphql_query
+
+    def get_variables(self) -> dict:
+        """
+        Retrieves the variables of the query from memory
+        :return dict:
+        """
+        return self.variables
 
     def get_schedule(self) -> dict:
         """
         Returns a dictionary with the response from the API endpoint
         :return dict:
         """
-        return self.mds_http_graphql.request(self.get_query())["data"]["api_schedule"]
+        return self.mds_http_graphql.request(
+            self.get_query(), variables=self.get_variables()
+        )["data"]["api_schedule"]
 
     def get_schedule_by_id(self, schedule_id) -> dict:
         """
         Returns a dictionary with the response from the API endpoint
         :return dict:
         """
-        query = Template(
-            """
-            query getScheduleById {
-              api_schedule(
-                where: {
-                    schedule_id: {_eq: $schedule_id}
-                }) {
-                    schedule_id
-                    status_id
-                    year
-                    month
-                    day
-                    hour
-                    payload
-                    message
-                    provider {
-                      id
-                      provider_name
-                    }
-                }
-            }
-        """
-        ).substitute({"schedule_id": str(schedule_id)})
-        return self.mds_http_graphql.request(query)["data"]["api_schedule"]
+        return self.mds_http_graphql.request(
+            self.graphql_schedule_by_id,
+            variables={"where": {"schedule_id": {"_eq": schedule_id}}},
+        )["data"]["api_schedule"]
@@ -1,5 +1,12 @@
+import json
+import logging
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from dateutil import parser, tz
-from string import Template
 
 from sodapy import Socrata
 from MDSConfig import MDSConfig
@@ -12,10 +19,85 @@ class MDSSocrata:
         "mds_http_graphql",
         "mds_socrata_dataset",
         "provider_name",
-        "query",
         "client",
+        "chunk_size",
+        "max_workers",
+        "attempts",
+        "thread_local",
+        "thread_clients",
+        "lock",
+    ]
+
+    # The time zone of the *_us_central fields, loaded once
+    US_CENTRAL = tz.gettz("US/Central")
+
+    # The format of the socrata timestamps
+    DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+    # The fields where a missing value is saved as 0
+    GEOS_FIELDS = [
+        "council_district_start",
+        "council_district_end",
+        "census_geoid_start",
+        "census_geoid_end",
     ]
 
+    # The values are sent as variables, so the query is a constant document
+    graphql_query = """
+        query getTrips($providerName: String!, $timeMin: timestamptz!, $timeMax: timestamptz!) {
+          api_trips(
+                where: {
+                provider: { provider_name: { _eq: $providerName }}
+                end_time: { _gte: $timeMin },
+                _and: { end_time: { _lt: $timeMax }}
+              }
+          ) {
+            trip_id: id
+            device_id: device { id }
+            vehicle_type
+            trip_duration
+            trip_distance
+            start_time
+            end_time
+            modified_date
+            council_district_start
+            council_district_end
+            census_geoid_start
+            census_geoid_end
+          }
+        }
+    """
+
+    # The same query for an incremental sync, only the trips modified after a date
+    graphql_query_modified_since = """
+        query getTripsModifiedSince($providerName: String!, $timeMin: timestamptz!, $timeMax: timestamptz!, $modifiedSince: timestamptz!) {
+          api_trips(
+                where: {
+                provider: { provider_name: { _eq: $providerName }}
+                end_time: { _gte: $timeMin },
+                _and: { end_time: { _lt: $timeMax }}
+                modified_date: { _gt: $modifiedSince }
+              }
+          ) {
+            trip_id: id
+            device_id: device { id }
+            vehicle_type
+            trip_duration
+            trip_distance
+            start_time
+            end_time
+            modified_date
+            council_district_start
+            council_district_end
+            census_geoid_start
+            census_geoid_end
+          }
+        }
+    """
+
+    # The key of the schedule socrata_status where the watermark is kept
+    WATERMARK_KEY = "modified_date_max"
+
     def __del__(self):
         """
         Make sure the client is closed whenever the class is destructed.
@@ -59,46 +141,70 @@ class MDSSocrata:
         self.mds_config = mds_config
         self.mds_http_graphql = mds_gql
         self.mds_socrata_dataset = self.mds_config.get_setting("SOCRATA_DATASET", None)
-        self.client = Socrata(
+        self.chunk_size = max(int(self.mds_config.get_setting("SOCRATA_CHUNK_SIZE", 5000)), 1)
+        self.max_workers = max(int(self.mds_config.get_setting("SOCRATA_MAX_WORKERS", 4)), 1)
+        self.attempts = max(int(self.mds_config.get_setting("SOCRATA_UPSERT_ATTEMPTS", 3)), 1)
+        self.thread_local = threading.local()
+        self.thread_clients = []
+        self.lock = threading.Lock()
+        self.client = self.create_client()
+
+    def create_client(self) -> Socrata:
+        """
+        Returns a new Socrata client.
+        :return Socrata:
+        """
+        return Socrata(
             self.mds_config.get_setting("SOCRATA_DATA_ENDPOINT", None),
             self.mds_config.get_setting("SOCRATA_APP_TOKEN", None),
             username=self.mds_config.get_setting("SOCRATA_KEY_ID", None),
             password=self.mds_config.get_setting("SOCRATA_KEY_SECRET", None),
-            timeout=20,
+            timeout=int(self.mds_config.get_setting("SOCRATA_TIMEOUT", 120)),
         )
-        self.query = Template(
-            """
-        query getTrips {
-          api_trips(
-                where: {
-                provider: { provider_name: { _eq: "$provider_name" }}
-                end_time: { _gte: "$time_min" },
-                _and: { end_time: { _lt: "$time_max" }}
-              }
-          ) {
-            trip_id: id
-            device_id: device { id }
-            vehicle_type
-            trip_duration
-            trip_distance
-            start_time
-            end_time
-            modified_date
-            council_district_start
-            council_district_end
-            census_geoid_start
-            census_geoid_end
-          }
-        }
+
+    def get_thread_client(self) -> Socrata:
         """
-        )
+        Returns the Socrata client of the current thread, each thread has its own connection.
+        :return Socrata:
+        """
+        client = getattr(self.thread_local, "client", None)
+        if client is None:
+            client = self.create_client()
+            self.thread_local.client = client
+            with self.lock:
+                self.thread_clients.append(client)
+        return client
+
+    def close_thread_clients(self):
+        """
+        Closes the Socrata clients of the worker threads.
+        :return:
+        """
+        with self.lock:
+            clients, self.thread_clients = self.thread_clients, []
+        for client in clients:
+            try:
+                client.close()
+            except:
+                pass
+
+    def get_query(self, modified_since=None) -> str:
+        """
+        Returns the GraphQL query, the document is the same for every request.
+        :param str modified_since: (Optional) If provided, the query of the trips modified after it
+        :return str:
+        """
+        if modified_since is not None:
+            return self.graphql_query_modified_since
+        return self.graphql_query
 
-    def get_query(self, time_min, time_max) -> str:
+    def get_variables(self, time_min, time_max, modified_since=None) -> dict:
         """
-        Returns a string with the new query based on limit and offset.
+        Returns a dictionary with the variables of the query.
         :param str time_min: The minimum time the trip ended
         :param str time_max: The maximum time the trip ended
-        :return str:
+        :param str modified_since: (Optional) The time after which the trips were modified
+        :return dict:
         """
         if isinstance(self.provider_name, str) is False:
             raise Exception("provider_name must be a string")
@@ -106,19 +212,84 @@ class MDSSocrata:
             raise Exception("time_min must be a sql datetime string")
         if isinstance(time_max, str) is False:
             raise Exception("time_max must be a sql datetime string")
-        return self.query.substitute(
-            provider_name=self.provider_name, time_min=time_min, time_max=time_max
-        )
+        variables = {
+            "providerName": self.provider_name,
+            "timeMin": time_min,
+            "timeMax": time_max,
+        }
+        if modified_since is not None:
+            if isinstance(modified_since, str) is False:
+                raise Exception("modified_since must be a sql datetime string")
+            variables["modifiedSince"] = modified_since
+        return variables
 
-    def get_data(self, time_min, time_max) -> dict:
+    def get_data(self, time_min, time_max, modified_since=None) -> dict:
         """
         Gathers data from the API endpoint
         :param str time_min:
         :param str time_max:
+        :param str modified_since: (Optional) Only the trips modified after this time
         :return dict:
         """
-        query = self.get_query(time_min=time_min, time_max=time_max)
-        return self.mds_http_graphql.request(query)
+        variables = self.get_variables(
+            time_min=time_min, time_max=time_max, modified_since=modified_since
+        )
+        return self.mds_http_graphql.request(
+            self.get_query(modified_since=modified_since), variables=variables
+        )
+
+    @classmethod
+    def get_watermark(cls, socrata_status) -> str:
+        """
+        Returns the latest modified_date saved by the last successful sync of a schedule block,
+        or None if there is none (the block was never synced, or the status is not readable).
+        :param str|dict socrata_status: The socrata_status of the schedule block
+        :return str:
+        """
+        try:
+            status = socrata_status
+            # The status may be double encoded
+            while isinstance(status, str):
+                status = json.loads(status)
+            watermark = status.get(cls.WATERMARK_KEY, None)
+            return watermark if isinstance(watermark, str) else None
+        except:
+            return None
+
+    def get_max_modified_date(self, data) -> str:
+        """
+        Returns the latest modified_date of the trips as it was received, or None if there are no trips.
+        It needs to be called before the trips are transformed.
+        :param list data: The trips from the API endpoint
+        :return str:
+        """
+        watermark, latest = None, None
+        for trip in data:
+            modified_date = self.parse_datetime(trip["modified_date"])
+            if latest is None or modified_date > latest:
+                watermark, latest = trip["modified_date"], modified_date
+        return watermark
+
+    @classmethod
+    def get_next_watermark(cls, watermark, max_modified_date, success) -> str:
+        """
+        Returns the watermark to save after a sync. It only moves forward after a successful upsert,
+        a failed sync or one that published nothing keeps the watermark of the last successful sync.
+        :param str watermark: The watermark of the last successful sync, or None
+        :param str max_modified_date: The latest modified_date published by this sync, or None
+        :param bool success: True if every row was upserted without errors
+        :return str:
+        """
+        if not success or max_modified_date is None:
+            return watermark
+        if watermark is None:
+            return max_modified_date
+        try:
+            if cls.parse_datetime(watermark) > cls.parse_datetime(max_modified_date):
+                return watermark
+        except:
+            pass
+        return max_modified_date
 
     def get_config(self) -> dict:
         """
@@ -129,20 +300,90 @@ class MDSSocrata:
 
     def save(self, data) -> dict:
         """
-        Upserts the data into Socrata
+        Upserts the data into Socrata, in chunks of chunk_size rows sent by up to max_workers threads.
+        Returns the counters of every chunk added together, the rows of a chunk that failed after
+        all of its attempts are counted as errors.
         :param dict data: The data to be saved unto socrata.
         :return dict:
         """
-        data = list(map(self.clean_trip_device_id, data))
-        data = list(map(self.parse_datetimes, data))
-        data = list(map(self.check_geos_data, data))
-        if self.client is not None:
-            return self.client.upsert(self.mds_socrata_dataset, data)
-        else:
+        data = list(self.transform(data))
+        if len(data) == 0:
+            # Nothing changed, there is no need to spend a request
+            return {"Errors": 0, "Rows Created": 0, "Rows Updated": 0, "Rows Deleted": 0}
+        if self.client is None:
             raise Exception(
                 "The socrata client is not initialized correctly, check your API credentials."
             )
 
+        chunks = [data[pos:pos + self.chunk_size] for pos in range(0, len(data), self.chunk_size)]
+        if len(chunks) <= 1:
+            return self.upsert_chunk(data, client=self.client)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                results = list(executor.map(self.upsert_chunk, chunks))
+        finally:
+            self.close_thread_clients()
+        return self.merge_results(results)
+
+    def upsert_chunk(self, chunk, client=None) -> dict:
+        """
+        Upserts a chunk of rows, trying again after a random pause that doubles on every attempt.
+        If every attempt fails, returns a result where all the rows are counted as errors.
+        :param list chunk: The rows to be upserted
+        :param Socrata client: (Optional) The client, by default the one of the current thread
+        :return dict:
+        """
+        client = client or self.get_thread_client()
+        for attempt in range(self.attempts):
+            try:
+                return client.upsert(self.mds_socrata_dataset, chunk)
+            except Exception as e:
+                logging.debug(f"MDSSocrata::upsert_chunk() Attempt {attempt + 1} failed: {e}")
+                if attempt + 1 < self.attempts:
+                    time.sleep(random.uniform(0, 2 ** attempt))
+                else:
+                    print(f"MDSSocrata::upsert_chunk() The upsert of {len(chunk)} rows failed: {e}")
+        return {"Errors": len(chunk), "Rows Created": 0, "Rows Updated": 0, "Rows Deleted": 0}
+
+    @staticmethod
+    def merge_results(results) -> dict:
+        """
+        Returns the results of many upserts as a single result, with the counters added together.
+        :param list results: The responses of Socrata
+        :return dict:
+        """
+        merged = {}
+        for result in results:
+            for key, value in (result or {}).items():
+                if isinstance(value, int) and not isinstance(value, bool):
+                    merged[key] = merged.get(key, 0) + value
+                elif key not in merged:
+                    merged[key] = value
+        return merged
+
+    def transform(self, data):
+        """
+        Yields the trips ready to be inserted into socrata, all of the transformations are done in a single pass.
+        :param list data: The trips from the API endpoint
+        :return:
+        """
+        for trip in data:
+            yield self.check_geos_data(self.parse_datetimes(self.clean_trip_device_id(trip)))
+
+    @staticmethod
+    def parse_datetime(value) -> datetime:
+        """
+        Returns a datetime from a PostgreSQL timestamp. The ISO format returned by the
+        API endpoint is parsed natively, any other format is left to dateutil.
+        :param str value: The timestamp
+        :return datetime:
+        """
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return parser.parse(value)
+
     def parse_datetimes(self, data) -> dict:
         """
         Parses the PostgreSQL datetime with timezone into an insertable
@@ -151,11 +392,11 @@ class MDSSocrata:
         :param data:
         :return:
         """
-        fmt = "%Y-%m-%dT%H:%M:%S"
+        fmt = self.DATETIME_FORMAT
         # create datetime objects
-        end_time = parser.parse(data["end_time"])
-        start_time = parser.parse(data["start_time"])
-        modified_date = parser.parse(data["modified_date"])
+        end_time = self.parse_datetime(data["end_time"])
+        start_time = self.parse_datetime(data["start_time"])
+        modified_date = self.parse_datetime(data["modified_date"])
         # format datestrings
         data["start_time"] = start_time.strftime(fmt)
         data["end_time"] = end_time.strftime(fmt)
@@ -169,32 +410,21 @@ class MDSSocrata:
         data["day_of_week"] = end_time.weekday()
         return data
 
-    @staticmethod
-    def check_geos_data(data) -> dict:
+    @classmethod
+    def check_geos_data(cls, data) -> dict:
         """
-        Parses the PostgreSQL datetime with timezone into an insertable
-        socrata timestamp in CST time. It also adds necessary fields,
-        such as year, month, hour and day of the week.
+        Replaces the missing values of the geographic fields with 0.
         :param data:
         :return:
         """
-        geos_fields = [
-            "council_district_start",
-            "council_district_end",
-            "census_geoid_start",
-            "census_geoid_end",
-        ]
-
-        for field in geos_fields:
+        for field in cls.GEOS_FIELDS:
             if data[field] is None or data[field] == "None":
                 data[field] = 0
-            else:
-                data[field] = data.get(field, 0)
         return data
 
-    @staticmethod
-    def datetime_to_us_central(dt):
-        return dt.astimezone(tz.gettz("US/Central"))
+    @classmethod
+    def datetime_to_us_central(cls, dt):
+        return dt.astimezone(cls.US_CENTRAL)
 
     @staticmethod
     def clean_trip_device_id(trip) -> dict:
@@ -1,8 +1,11 @@
 import logging
 import json
+import threading
 import uuid
 import re
 
+import numpy as np
+
 from datetime import datetime
 from string import Template
 from pytz import reference
@@ -18,7 +21,8 @@ class MDSTrip:
         "mds_http_graphql",
         "mds_graphql_query",
         "trip_data",
-        "validator",
+        "valid",
+        "validation_errors",
         "query",
         "response",
     ]
@@ -59,36 +63,54 @@ class MDSTrip:
         "end": {"nullable": True, "required": False, "type": "string"},
     }
 
-    graphql_template_insert = """
-        mutation insertTrip {
+    # The python types accepted for each cerberus type of the schema, and the ones excluded
+    validation_types = {
+        "string": ((str,), ()),
+        "number": ((int, float), (bool,)),
+        "list": ((list, tuple), (str,)),
+        "dict": ((dict,), ()),
+    }
+
+    # The schema compiled by compile_validation_schema, and the cerberus validators of each thread
+    compiled_validation_schema = None
+    validators = threading.local()
+
+    # The columns of the insert mutation, the quoted ones are sent as strings
+    insert_quoted_fields = [
+        "trip_id",
+        "accuracy",
+        "device_id",
+        "vehicle_id",
+        "end_time",
+        "propulsion_type",
+        "provider_id",
+        "provider_name",
+        "start_time",
+        "trip_distance",
+        "trip_duration",
+        "vehicle_type",
+        "publication_time",
+        "council_district_start",
+        "council_district_end",
+        "orig_cell_id",
+        "dest_cell_id",
+        "census_geoid_start",
+        "census_geoid_end",
+    ]
+    insert_number_fields = [
+        "standard_cost",
+        "actual_cost",
+        "start_latitude",
+        "start_longitude",
+        "end_latitude",
+        "end_longitude",
+    ]
+
+    # Inserts one or many trips in one request, the trips are provided in the $objects variable
+    graphql_insert_batch = """
+        mutation insertTrips($objects: [api_trips_insert_input!]!) {
           insert_api_trips(
-            objects: {
-                trip_id: "$trip_id",
-                accuracy: "$accuracy",
-                device_id: "$device_id",
-                vehicle_id: "$vehicle_id",
-                end_time: "$end_time",
-                propulsion_type: "$propulsion_type",
-                provider_id: "$provider_id",
-                provider_name: "$provider_name",
-                start_time: "$start_time",
-                trip_distance: "$trip_distance",
-                trip_duration: "$trip_duration",
-                vehicle_type: "$vehicle_type",
-                publication_time: "$publication_time",
-                standard_cost: $standard_cost,
-                actual_cost: $actual_cost,
-                start_latitude: $start_latitude,
-                start_longitude: $start_longitude,
-                end_latitude: $end_latitude,
-                end_longitude: $end_longitude,
-                council_district_start: "$council_district_start",
-                council_district_end: "$council_district_end",
-                orig_cell_id: "$orig_cell_id",
-                dest_cell_id: "$dest_cell_id",
-                census_geoid_start: "$census_geoid_start",
-                census_geoid_end: "$census_geoid_end",
-            },
+            objects: $objects,
             on_conflict: {
                 constraint: trips_trip_id_pk,
                 update_columns: [
@@ -121,6 +143,20 @@ class MDSTrip:
         }
     """
 
+    # The fields set by initialize_points_batch
+    enriched_fields = [
+        "start_latitude",
+        "start_longitude",
+        "end_latitude",
+        "end_longitude",
+        "census_geoid_start",
+        "census_geoid_end",
+        "council_district_start",
+        "council_district_end",
+        "orig_cell_id",
+        "dest_cell_id",
+    ]
+
     graphql_template_search = """
         query getTrip {
           api_trips(where: {trip_id: {_eq: "$trip_id"}}) {
@@ -129,38 +165,113 @@ class MDSTrip:
         }
     """
 
-    def __init__(self, mds_config, mds_pip, mds_gql, trip_data):
+    def __init__(self, mds_config, mds_pip, mds_gql, trip_data, enrich_points=True):
+        """
+        Constructor for the trip class.
+        :param MDSConfig mds_config: The configuration class
+        :param MDSPointInPolygon mds_pip: The point-in-polygon class
+        :param MDSGraphQLRequest mds_gql: The http graphql class we need to make requests
+        :param dict trip_data: The trip dictionary
+        :param bool enrich_points: (Optional) Set to False if the trip was already enriched with initialize_points_batch.
+        """
         # Initialize our configuration
         self.mds_config = mds_config
         self.mds_pip = mds_pip
         # Initialize our HTTP GraphQL Class
         self.mds_http_graphql = mds_gql
-        # Initializes the cerberus validator
-        self.validator = Validator(self.validation_schema, require_all=True)
+        # The trip is validated once, when it is needed
+        self.valid = None
+        self.validation_errors = {}
         # HTTP Query and Response
         self.query = {}
         self.response = {}
         # Then initialize our trip data
         self.trip_data = trip_data
-        self.initialize_points()
+        if enrich_points:
+            self.initialize_points()
         self.mds_graphql_query = None
 
+    @classmethod
+    def compile_validation_schema(cls) -> dict:
+        """
+        Returns the validation schema as a dictionary of field: (types, excluded types, nullable, required),
+        or None if the schema has a rule or type that the fast validation does not know.
+        :return dict:
+        """
+        compiled = {}
+        for field, rules in cls.validation_schema.items():
+            if set(rules) - {"type", "nullable", "required"} or rules.get("type", None) not in cls.validation_types:
+                return None
+            types, excluded = cls.validation_types[rules["type"]]
+            compiled[field] = (types, excluded, rules.get("nullable", False), rules.get("required", True))
+        return compiled
+
+    @classmethod
+    def is_valid_fast(cls, trip_data) -> bool:
+        """
+        Returns True if the trip data is surely valid according to the validation schema, the same as cerberus
+        with all the fields required and no unknown fields, without its overhead. Returns False otherwise,
+        in which case cerberus has the last word.
+        :param dict trip_data: The trip dictionary
+        :return bool:
+        """
+        if cls.compiled_validation_schema is None:
+            cls.compiled_validation_schema = cls.compile_validation_schema() or {}
+        schema = cls.compiled_validation_schema
+        if len(schema) == 0 or not isinstance(trip_data, dict):
+            return False
+        for field in trip_data:
+            if field not in schema:
+                return False
+        for field, (types, excluded, nullable, required) in schema.items():
+            if field not in trip_data:
+                if required:
+                    return False
+                continue
+            value = trip_data[field]
+            if value is None:
+                if not nullable:
+                    return False
+            elif not isinstance(value, types) or isinstance(value, excluded):
+                return False
+        return True
+
+    @classmethod
+    def get_validator(cls) -> Validator:
+        """
+        Returns the cerberus validator of the current thread, the schema is compiled once per thread.
+        :return Validator:
+        """
+        validator = getattr(cls.validators, "validator", None)
+        if validator is None:
+            validator = Validator(cls.validation_schema, require_all=True)
+            cls.validators.validator = validator
+        return validator
+
     def is_valid(self) -> bool:
         """
         Returns True if the trip data is valid, false otherwise.
+        The result is kept until the trip data is changed with set_trip_value.
         :return bool:
         """
-        try:
-            return self.validator.validate(self.trip_data)
-        except:
-            return False
+        if self.valid is None:
+            if self.is_valid_fast(self.trip_data):
+                self.valid, self.validation_errors = True, {}
+            else:
+                try:
+                    validator = self.get_validator()
+                    self.valid = validator.validate(self.trip_data)
+                    self.validation_errors = validator.errors
+                except:
+                    self.valid, self.validation_errors = False, {}
+        return self.valid
 
     def get_validation_errors(self) -> dict:
         """
         Returns a dictionary with all the validation errors.
         :return:
         """
-        return self.validator.errors
+        return self.validation_errors
 
     def int_to_uuid(self, integer_number):
         """
@@ -202,7 +313,9 @@ class MDSTrip:
 
         if self.is_valid():
             self.query = self.generate_gql_insert()
-            self.response = self.mds_http_graphql.request(self.query)
+            self.response = self.mds_http_graphql.request(
+                self.query, variables=self.generate_gql_insert_variables()
+            )
             logging.debug(
                 "MDSTrip::save() Request finished, response: %s" % str(self.response)
             )
@@ -214,7 +327,7 @@ class MDSTrip:
             self.query = self.generate_gql_insert()
             self.response = self.get_validation_errors()
             print(f"MDSTrip::save() trip marked as invalid: {self.trip_data['trip_id']}")
-            print(self.query)
+            print(json.dumps(self.generate_gql_insert_variables()))
             print("Errors: ")
             print(self.response)
             return False
@@ -231,12 +344,46 @@ class MDSTrip:
 
     def generate_gql_insert(self) -> str:
         """
-        Generates a string with a GraphQL query
+        Returns the GraphQL insert mutation, the document is the same for every trip.
         :return str:
         """
+        return self.graphql_insert_batch
+
+    def generate_gql_insert_variables(self) -> dict:
+        """
+        Returns the variables of the insert mutation for this trip.
+        :return dict:
+        """
+        return {"objects": [self.get_insert_object()]}
+
+    @staticmethod
+    def to_number(value):
+        """
+        Returns a number from a string (as it would be written in a GraphQL query), other values are returned as is.
+        :param * value: The value to be converted
+        :return:
+        """
+        if isinstance(value, str):
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+        return value
+
+    def get_insert_object(self) -> dict:
+        """
+        Returns the trip as an object of the insert mutation, the quoted fields as strings
+        and the number fields as numbers.
+        :return dict:
+        """
         self.initialize_timestamps()
         self.initialize_optional_fields()
-        return Template(self.graphql_template_insert).substitute(self.trip_data)
+        insert_object = {
+            field: str(self.trip_data.get(field, None)) for field in self.insert_quoted_fields
+        }
+        for field in self.insert_number_fields:
+            insert_object[field] = self.to_number(self.trip_data.get(field, None))
+        return insert_object
 
     def generate_gql_search(self, trip_id) -> str:
         """
@@ -267,6 +414,8 @@ class MDSTrip:
         :param str trip_value: The value assigned to that key
         """
         self.trip_data[trip_key] = trip_value
+        # The trip needs to be validated again
+        self.valid = None
 
     def get_trip_value(self, trip_key):
         """
@@ -344,35 +493,65 @@ class MDSTrip:
                 end_point = self.mds_pip.create_point(
                     longitude_x=end_long, latitude_y=end_lat
                 )
-                # Retrieve the Census Tract
-                self.set_trip_value(
-                    "census_geoid_start",
-                    self.mds_pip.get_census_tract_id(mds_point=start_point),
-                )
-                self.set_trip_value(
-                    "census_geoid_end",
-                    self.mds_pip.get_census_tract_id(mds_point=end_point),
-                )
-
-                # Retrieve the council district
-                self.set_trip_value(
-                    "council_district_start",
-                    self.mds_pip.get_district_id(mds_point=start_point),
-                )
-                self.set_trip_value(
-                    "council_district_end",
-                    self.mds_pip.get_district_id(mds_point=end_point),
-                )
+                # Retrieve the Census Tract, council district and Hexagon ID of each point at once
+                start = self.mds_pip.resolve(mds_point=start_point)
+                end = self.mds_pip.resolve(mds_point=end_point)
+                self.set_trip_value("census_geoid_start", start["census_tract_id"])
+                self.set_trip_value("census_geoid_end", end["census_tract_id"])
+                self.set_trip_value("council_district_start", start["district_id"])
+                self.set_trip_value("council_district_end", end["district_id"])
+                self.set_trip_value("orig_cell_id", start["hex_id"])
+                self.set_trip_value("dest_cell_id", end["hex_id"])
+            except:
+                pass
 
-                # Retrieve the Hexagon ID
-                self.set_trip_value(
-                    "orig_cell_id", self.mds_pip.get_hex_id(mds_point=start_point)
-                )
-                self.set_trip_value(
-                    "dest_cell_id", self.mds_pip.get_hex_id(mds_point=end_point)
+    @staticmethod
+    def initialize_points_batch(mds_pip, trips) -> int:
+        """
+        Sets the coordinates, census tracts, council districts and hexagon ids for a list of
+        trip dictionaries, resolving all start and end points with a single batch lookup.
+        Trips without a valid route are left untouched. Returns the number of trips enriched.
+        :param MDSPointInPolygon mds_pip: The point-in-polygon class
+        :param list trips: The list of trip dictionaries
+        :return int:
+        """
+        enriched = []
+        coordinates = []
+        for trip in trips:
+            try:
+                features = trip["route"]["features"]
+                start_long, start_lat = features[0]["geometry"]["coordinates"][:2]
+                end_long, end_lat = features[-1]["geometry"]["coordinates"][:2]
+                coordinates.append(
+                    (float(start_long), float(start_lat), float(end_long), float(end_lat))
                 )
             except:
-                pass
+                continue
+            trip["start_latitude"] = start_lat
+            trip["start_longitude"] = start_long
+            trip["end_latitude"] = end_lat
+            trip["end_longitude"] = end_long
+            enriched.append(trip)
+
+        if len(enriched) == 0:
+            return 0
+
+        # Start points first, then end points, all in one lookup
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        results = mds_pip.lookup_batch(
+            longitudes=np.concatenate((coordinates[:, 0], coordinates[:, 2])),
+            latitudes=np.concatenate((coordinates[:, 1], coordinates[:, 3])),
+        )
+        total = len(enriched)
+        for pos, trip in enumerate(enriched):
+            trip["census_geoid_start"] = results["census_tract_id"][pos]
+            trip["census_geoid_end"] = results["census_tract_id"][total + pos]
+            trip["council_district_start"] = results["district_id"][pos]
+            trip["council_district_end"] = results["district_id"][total + pos]
+            trip["orig_cell_id"] = results["hex_id"][pos]
+            trip["dest_cell_id"] = results["hex_id"][total + pos]
+
+        return total
 
     @staticmethod
     def get_trip_by_id(mds_gql, trip_id):
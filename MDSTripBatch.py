@@ -0,0 +1,218 @@
+import json
+import logging
+
+from MDSTrip import MDSTrip
+
+
+class MDSTripBatch:
+    __slots__ = [
+        "mds_http_graphql",
+        "mds_async_graphql",
+        "batch_size",
+        "pending",
+        "ready",
+        "pending_trip_ids",
+        "saved_trip_ids",
+        "errors",
+        "requests",
+    ]
+
+    def __init__(self, mds_gql, batch_size=100, mds_async_gql=None):
+        """
+        Collects valid trips and inserts them with a single insert_api_trips mutation per batch.
+        If a batch fails, it is split in halves until the trips that fail are found, one at a time.
+        :param MDSGraphQLRequest mds_gql: The http graphql class we need to make requests
+        :param int batch_size: (Optional) The maximum number of trips per request
+        :param AsyncMDSGraphQLRequest mds_async_gql: (Optional) If provided, full batches are sent together, as many at once as its concurrency
+        """
+        logging.debug("MDSTripBatch::__init__() Initializing MDSTripBatch")
+        if not batch_size or int(batch_size) < 1:
+            raise Exception("MDSTripBatch::__init__() batch_size must be a positive integer")
+        self.mds_http_graphql = mds_gql
+        self.mds_async_graphql = mds_async_gql
+        self.batch_size = int(batch_size)
+        # Tuples of trip_id and insert object, waiting to be sent
+        self.pending = []
+        # Full batches waiting to be sent together
+        self.ready = []
+        # The trip ids of the pending and ready batches
+        self.pending_trip_ids = set()
+        self.saved_trip_ids = []
+        self.errors = []
+        self.requests = 0
+
+    def add(self, mds_trip) -> bool:
+        """
+        Adds a trip to the batch, and sends the batch if it is full, or if it already has a trip with the same id.
+        Returns False if the trip is not valid, in which case it is recorded as an error right away.
+        :param MDSTrip mds_trip: The trip class instance
+        :return bool:
+        """
+        trip_id = mds_trip.get_trip_value("trip_id")
+        if not mds_trip.is_valid():
+            try:
+                graphql = json.dumps(mds_trip.get_insert_object())
+            except:
+                graphql = None
+            self.errors.append(
+                {
+                    "trip_id": trip_id,
+                    "description": f"Error Processing trip: {trip_id}",
+                    "graphql": graphql,
+                    "response": mds_trip.get_validation_errors(),
+                }
+            )
+            return False
+
+        # An upsert can't change the same row twice, and batches in flight run in any order,
+        # so a repeated trip waits until the trips before it are sent
+        if trip_id in self.pending_trip_ids:
+            self.flush()
+        self.pending.append((trip_id, mds_trip.get_insert_object()))
+        self.pending_trip_ids.add(trip_id)
+        if len(self.pending) >= self.batch_size:
+            self.ready.append(self.pending)
+            self.pending = []
+            if len(self.ready) >= self.get_concurrency():
+                self.send_ready()
+        return True
+
+    def get_concurrency(self) -> int:
+        """
+        Returns the number of batches sent at once.
+        :return int:
+        """
+        return 1 if self.mds_async_graphql is None else self.mds_async_graphql.concurrency
+
+    def flush(self) -> int:
+        """
+        Sends the pending trips, returns the number of trips saved.
+        :return int:
+        """
+        if len(self.pending) > 0:
+            self.ready.append(self.pending)
+            self.pending = []
+        saved_before = len(self.saved_trip_ids)
+        self.send_ready()
+        return len(self.saved_trip_ids) - saved_before
+
+    def send_ready(self):
+        """
+        Sends the full batches, at once if there is an async client.
+        :return:
+        """
+        batches, self.ready = self.ready, []
+        self.pending_trip_ids = set(trip_id for trip_id, _ in self.pending)
+        if len(batches) == 0:
+            return
+        if self.mds_async_graphql is None or len(batches) == 1:
+            responses = [self.request(entries) for entries in batches]
+        else:
+            self.requests += len(batches)
+            responses = [
+                self.get_transport_error(response) if isinstance(response, Exception) else response
+                for response in self.mds_async_graphql.run_requests_sync(
+                    [(MDSTrip.graphql_insert_batch, self.get_variables(entries)) for entries in batches],
+                    return_exceptions=True,
+                )
+            ]
+        for entries, response in zip(batches, responses):
+            self.process(entries, response)
+
+    def request(self, entries) -> dict:
+        """
+        Sends one insert mutation with the objects of the entries, returns the response.
+        :param list entries: The tuples of trip_id and insert object
+        :return dict:
+        """
+        self.requests += 1
+        try:
+            return self.mds_http_graphql.request(
+                MDSTrip.graphql_insert_batch, variables=self.get_variables(entries)
+            )
+        except Exception as e:
+            return self.get_transport_error(e)
+
+    @staticmethod
+    def get_transport_error(exception) -> dict:
+        """
+        Returns a response for a request that failed before reaching the database, after its retries.
+        :param Exception exception: The exception raised by the request
+        :return dict:
+        """
+        return {"errors": [{"message": str(exception), "extensions": {"code": "transport-error"}}]}
+
+    @staticmethod
+    def is_transport_error(response) -> bool:
+        """
+        Returns True if the response is from get_transport_error().
+        :param dict response: The response of the insert mutation
+        :return bool:
+        """
+        try:
+            return response["errors"][0]["extensions"]["code"] == "transport-error"
+        except:
+            return False
+
+    @staticmethod
+    def get_variables(entries) -> dict:
+        """
+        Returns the variables of the insert mutation for the entries.
+        :param list entries: The tuples of trip_id and insert object
+        :return dict:
+        """
+        return {"objects": [insert_object for _, insert_object in entries]}
+
+    def insert(self, entries):
+        """
+        Inserts the entries, bisecting the batch on failure until each failing trip is isolated.
+        :param list entries: The tuples of trip_id and insert object
+        :return:
+        """
+        self.process(entries, self.request(entries))
+
+    def process(self, entries, response):
+        """
+        Records the entries as saved if the response is successful, or bisects the batch otherwise.
+        :param list entries: The tuples of trip_id and insert object
+        :param dict response: The response of the insert mutation for the entries
+        :return:
+        """
+        if "errors" not in response and MDSTrip.get_affected_rows(
+            gql_key="insert_api_trips", response=response
+        ) != 0:
+            self.saved_trip_ids.extend([trip_id for trip_id, _ in entries])
+            return
+
+        # Splitting the batch can't help if the database could not be reached
+        if len(entries) == 1 or self.is_transport_error(response):
+            for trip_id, insert_object in entries:
+                logging.debug(f"MDSTripBatch::process() Error inserting trip: {trip_id}")
+                self.errors.append(
+                    {
+                        "trip_id": trip_id,
+                        "description": f"Error Processing trip: {trip_id}",
+                        "graphql": json.dumps(insert_object),
+                        "response": response,
+                    }
+                )
+            return
+
+        logging.debug(f"MDSTripBatch::process() Batch of {len(entries)} failed, splitting it")
+        middle = len(entries) // 2
+        self.insert(entries[:middle])
+        self.insert(entries[middle:])
+
+    def get_saved_trip_ids(self) -> list:
+        """
+        Returns the trip ids saved so far.
+        :return list:
+        """
+        return self.saved_trip_ids
+
+    def get_errors(self) -> list:
+        """
+        Returns a list of dictionaries with the trip_id, description, graphql and response of each failed trip.
+        :return list:
+        """
+        return self.errors
@@ -0,0 +1,404 @@
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+from array import array
+from MDSTrip import MDSTrip
+
+
+class MDSTripColumns:
+    __slots__ = [
+        "size",
+        "numbers",
+        "kinds",
+        "codes",
+        "categories",
+        "index",
+        "has_route",
+        "raw",
+    ]
+
+    # The kinds of the values of a number column
+    ABSENT = 0
+    NULL = 1
+    INTEGER = 2
+    FLOAT = 3
+
+    # The codes of a missing value in a value column
+    CODE_ABSENT = -2
+    CODE_NULL = -1
+
+    # The integers above this are not exact as a float, the trip is kept as it is
+    MAX_EXACT_INTEGER = 2 ** 53
+
+    # The first and last coordinates of the route, the only part of the route that is kept
+    route_fields = [
+        "route_start_longitude",
+        "route_start_latitude",
+        "route_end_longitude",
+        "route_end_latitude",
+    ]
+
+    # The number fields are kept in typed arrays, the other fields are interned
+    number_fields = [
+        field for field, rules in MDSTrip.validation_schema.items() if rules["type"] == "number"
+    ] + route_fields
+    value_fields = [
+        field for field, rules in MDSTrip.validation_schema.items() if rules["type"] in ("string", "list")
+    ]
+    list_fields = [
+        field for field, rules in MDSTrip.validation_schema.items() if rules["type"] == "list"
+    ]
+
+    # The point-in-polygon class of a worker process, inherited from the parent process by fork
+    worker_pip = None
+
+    def __init__(self):
+        """
+        A columnar batch of trips. The numbers (times, costs, coordinates) are kept in typed arrays,
+        and the strings (provider, vehicle type, ids) as codes of a list of unique values, so a file of
+        trips takes a small fraction of the memory of the decoded dictionaries. The route is reduced to its
+        first and last coordinates, the only ones needed to resolve the points. The trips that do not fit
+        the columns (wrong types or unknown fields) are kept as they are, so they are validated as before.
+        """
+        self.size = 0
+        self.numbers = {field: array("d") for field in self.number_fields}
+        self.kinds = {field: array("b") for field in self.number_fields}
+        self.codes = {field: array("i") for field in self.value_fields}
+        self.categories = {field: [] for field in self.value_fields}
+        self.index = {field: {} for field in self.value_fields}
+        self.has_route = array("b")
+        self.raw = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        """
+        Yields the trips as dictionaries, one at a time and in the same order they were added.
+        :return:
+        """
+        for pos in range(self.size):
+            yield self.get_trip(pos)
+
+    @classmethod
+    def from_trips(cls, trips):
+        """
+        Returns a new batch with the trips, they can be provided by a generator as they are parsed.
+        :param iterable trips: The trip dictionaries
+        :return MDSTripColumns:
+        """
+        columns = cls()
+        for trip in trips:
+            columns.add(trip)
+        return columns
+
+    @classmethod
+    def get_number(cls, value) -> (int, float):
+        """
+        Returns the kind of a number and its value as a float, or None if it can't be kept in a number column.
+        :param * value: The value
+        :return (int, float):
+        """
+        if value is None:
+            return cls.NULL, 0.0
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            if abs(value) > cls.MAX_EXACT_INTEGER:
+                return None
+            return cls.INTEGER, float(value)
+        if isinstance(value, float) and value == value:
+            return cls.FLOAT, value
+        return None
+
+    @staticmethod
+    def get_route_coordinates(route) -> list:
+        """
+        Returns the longitude and latitude of the first and last features of a route, or None if not found.
+        :param dict route: The route FeatureCollection
+        :return list:
+        """
+        try:
+            features = route["features"]
+            start_long, start_lat = features[0]["geometry"]["coordinates"][:2]
+            end_long, end_lat = features[-1]["geometry"]["coordinates"][:2]
+        except:
+            return None
+        return [start_long, start_lat, end_long, end_lat]
+
+    def get_row(self, trip) -> (dict, dict):
+        """
+        Returns the values of the number columns and of the value columns of a trip,
+        or None if the trip does not fit the columns.
+        :param dict trip: The trip dictionary
+        :return (dict, dict):
+        """
+        if not isinstance(trip, dict):
+            return None
+        for field in trip:
+            if field not in MDSTrip.validation_schema:
+                return None
+
+        coordinates = self.get_route_coordinates(trip.get("route", None))
+        if coordinates is None:
+            return None
+        numbers = {}
+        for field, value in zip(self.route_fields, coordinates):
+            numbers[field] = self.get_number(value)
+            if numbers[field] is None or numbers[field][0] == self.NULL:
+                return None
+        for field in self.number_fields:
+            if field in trip:
+                numbers[field] = self.get_number(trip[field])
+                if numbers[field] is None:
+                    return None
+
+        values = {}
+        for field in self.value_fields:
+            if field not in trip:
+                continue
+            value = trip[field]
+            if value is None:
+                values[field] = None
+            elif field in self.list_fields:
+                if not isinstance(value, list):
+                    return None
+                try:
+                    value = tuple(value)
+                    hash(value)
+                except TypeError:
+                    return None
+                values[field] = value
+            elif isinstance(value, str):
+                values[field] = value
+            else:
+                return None
+        return numbers, values
+
+    def get_code(self, field, value) -> int:
+        """
+        Returns the code of a value in a value column, the value is added to the column if it is new.
+        :param str field: The column
+        :param * value: The value
+        :return int:
+        """
+        if value is None:
+            return self.CODE_NULL
+        index = self.index[field]
+        code = index.get(value, None)
+        if code is None:
+            code = len(self.categories[field])
+            self.categories[field].append(value)
+            index[value] = code
+        return code
+
+    def add(self, trip):
+        """
+        Adds a trip at the end of the batch. Once added, the trip dictionary is not needed anymore.
+        :param dict trip: The trip dictionary
+        :return:
+        """
+        row = self.get_row(trip)
+        if row is None:
+            self.raw[self.size] = trip
+            numbers, values = {}, {}
+        else:
+            numbers, values = row
+        for field in self.number_fields:
+            kind, value = numbers.get(field, None) or (self.ABSENT, 0.0)
+            self.numbers[field].append(value)
+            self.kinds[field].append(kind)
+        for field in self.value_fields:
+            self.codes[field].append(
+                self.get_code(field, values[field]) if field in values else self.CODE_ABSENT
+            )
+        self.has_route.append(0 if row is None else 1)
+        self.size += 1
+
+    def get_number_value(self, field, pos):
+        """
+        Returns the value of a number column as it was added (int, float or None).
+        :param str field: The column
+        :param int pos: The position of the trip
+        :return:
+        """
+        kind = self.kinds[field][pos]
+        if kind == self.INTEGER:
+            return int(self.numbers[field][pos])
+        if kind == self.FLOAT:
+            return self.numbers[field][pos]
+        return None
+
+    def set_number_value(self, field, pos, value):
+        """
+        Sets the value of a number column, the value needs to be a number or None.
+        :param str field: The column
+        :param int pos: The position of the trip
+        :param * value: The value
+        :return:
+        """
+        number = self.get_number(value)
+        if number is None:
+            raise Exception(f"MDSTripColumns::set_number_value() {field} must be a number")
+        self.kinds[field][pos], self.numbers[field][pos] = number
+
+    def get_trip(self, pos) -> dict:
+        """
+        Returns a new dictionary with the trip in a position, the route has only its first and last points.
+        :param int pos: The position of the trip
+        :return dict:
+        """
+        if pos in self.raw:
+            return self.raw[pos]
+        trip = {}
+        for field in self.value_fields:
+            code = self.codes[field][pos]
+            if code == self.CODE_ABSENT:
+                continue
+            value = None if code == self.CODE_NULL else self.categories[field][code]
+            trip[field] = list(value) if field in self.list_fields and value is not None else value
+        for field in MDSTrip.validation_schema:
+            if field in self.numbers and self.kinds[field][pos] != self.ABSENT:
+                trip[field] = self.get_number_value(field, pos)
+        start_long, start_lat, end_long, end_lat = [
+            self.get_number_value(field, pos) for field in self.route_fields
+        ]
+        trip["route"] = {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "geometry": {"type": "Point", "coordinates": [start_long, start_lat]}},
+                {"type": "Feature", "geometry": {"type": "Point", "coordinates": [end_long, end_lat]}},
+            ],
+        }
+        return trip
+
+    def get_column(self, field) -> np.ndarray:
+        """
+        Returns a copy of a number column as a float array, the missing values are nan.
+        :param str field: The column
+        :return np.ndarray:
+        """
+        values = np.array(self.numbers[field], dtype=np.float64)
+        values[np.array(self.kinds[field], dtype=np.int8) < self.INTEGER] = np.nan
+        return values
+
+    def get_size(self) -> int:
+        """
+        Returns the approximate number of bytes used by the columns, not counting the trips kept as they are.
+        :return int:
+        """
+        size = self.has_route.itemsize * len(self.has_route)
+        for field in self.number_fields:
+            size += self.numbers[field].itemsize * len(self.numbers[field])
+            size += self.kinds[field].itemsize * len(self.kinds[field])
+        for field in self.value_fields:
+            size += self.codes[field].itemsize * len(self.codes[field])
+            size += sum(len(str(value)) + 49 for value in self.categories[field])
+        return size
+
+    def initialize_points(self, mds_pip, processes=1, chunk_size=20000) -> int:
+        """
+        Sets the coordinates, census tracts, council districts and hexagon ids of every trip, the same
+        as MDSTrip.initialize_points_batch. The coordinates are read straight from the columns, and
+        the chunks of points are resolved by a pool of processes if more than one is requested.
+        Returns the number of trips enriched.
+        :param MDSPointInPolygon mds_pip: The point-in-polygon class
+        :param int processes: (Optional) The maximum number of worker processes
+        :param int chunk_size: (Optional) The number of trips sent to a worker at a time
+        :return int:
+        """
+        total = 0
+        if len(self.raw) > 0:
+            total += MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=list(self.raw.values()))
+
+        positions = np.flatnonzero(np.array(self.has_route, dtype=np.int8))
+        if len(positions) == 0:
+            return total
+        start_long, start_lat, end_long, end_lat = [
+            self.get_column(field)[positions] for field in self.route_fields
+        ]
+        longitudes = np.concatenate((start_long, end_long))
+        latitudes = np.concatenate((start_lat, end_lat))
+        results = self.lookup_points(mds_pip, longitudes, latitudes, processes, chunk_size * 2)
+
+        count = len(positions)
+        for route_field, field in [
+            ("route_start_longitude", "start_longitude"),
+            ("route_start_latitude", "start_latitude"),
+            ("route_end_longitude", "end_longitude"),
+            ("route_end_latitude", "end_latitude"),
+        ]:
+            for pos in positions:
+                self.kinds[field][pos] = self.kinds[route_field][pos]
+                self.numbers[field][pos] = self.numbers[route_field][pos]
+        for key, start_field, end_field in [
+            ("census_tract_id", "census_geoid_start", "census_geoid_end"),
+            ("district_id", "council_district_start", "council_district_end"),
+            ("hex_id", "orig_cell_id", "dest_cell_id"),
+        ]:
+            ids = results[key]
+            for i, pos in enumerate(positions):
+                self.codes[start_field][pos] = self.get_code(start_field, ids[i])
+                self.codes[end_field][pos] = self.get_code(end_field, ids[count + i])
+        return total + count
+
+    @staticmethod
+    def lookup_points(mds_pip, longitudes, latitudes, processes=1, chunk_size=40000) -> dict:
+        """
+        Returns mds_pip.lookup_batch() of the points, the chunks of points are resolved by a pool of processes
+        if more than one is requested, there is more than one chunk and fork is available.
+        :param MDSPointInPolygon mds_pip: The point-in-polygon class
+        :param np.ndarray longitudes: The longitude (x) values
+        :param np.ndarray latitudes: The latitude (y) values
+        :param int processes: (Optional) The maximum number of worker processes
+        :param int chunk_size: (Optional) The number of points sent to a worker at a time
+        :return dict:
+        """
+        processes = min(int(processes or 1), os.cpu_count() or 1)
+        if processes <= 1 or len(longitudes) <= chunk_size:
+            return mds_pip.lookup_batch(longitudes=longitudes, latitudes=latitudes)
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            return mds_pip.lookup_batch(longitudes=longitudes, latitudes=latitudes)
+
+        # Everything must be loaded before the fork, or each worker would load it again
+        mds_pip.load_layers()
+        chunks = [
+            (longitudes[pos:pos + chunk_size], latitudes[pos:pos + chunk_size])
+            for pos in range(0, len(longitudes), chunk_size)
+        ]
+        try:
+            with context.Pool(
+                processes=min(processes, len(chunks)),
+                initializer=MDSTripColumns.initialize_worker,
+                initargs=(mds_pip,),
+            ) as pool:
+                results = pool.map(MDSTripColumns.lookup_points_chunk, chunks)
+        except Exception as e:
+            logging.debug(f"MDSTripColumns::lookup_points() Pool failed, running in process: {e}")
+            return mds_pip.lookup_batch(longitudes=longitudes, latitudes=latitudes)
+        return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+    @staticmethod
+    def initialize_worker(mds_pip):
+        """
+        Initializes a worker process of lookup_points. With the fork start method,
+        the point-in-polygon class is not copied: the worker shares the layers loaded by the parent.
+        :param MDSPointInPolygon mds_pip: The point-in-polygon class
+        :return:
+        """
+        MDSTripColumns.worker_pip = mds_pip
+
+    @staticmethod
+    def lookup_points_chunk(chunk) -> dict:
+        """
+        Runs lookup_batch on a chunk of points in a worker process of lookup_points.
+        :param tuple chunk: The longitudes and latitudes
+        :return dict:
+        """
+        longitudes, latitudes = chunk
+        return MDSTripColumns.worker_pip.lookup_batch(longitudes=longitudes, latitudes=latitudes)
@@ -153,7 +153,9 @@ def run(**kwargs):
         mds_aws.save(
             upload_path,
             json_document=json.dumps(data),
-            encrypted=(True, False)[plain_text]
+            encrypted=(True, False)[plain_text],
+            # The configuration is read at startup by every deployed version of the ETL
+            stream_encrypted=False
         )
         print(f"Done saving file to '{upload_path}'")
 
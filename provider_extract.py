@@ -27,7 +27,8 @@ mds_aws = MDSAWS(
 # The CLI class will need an http-graphql client
 mds_gql = MDSGraphQLRequest(
     endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
-    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None)
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    pool_size=mds_config.ATD_MDS_MAX_THREADS,
 )
 
 
@@ -13,14 +13,14 @@ The application requires the requests, sodapy and atd-mds-client libraries:
 """
 
 import click
-import requests
-import json
 import logging
 import time
 
 from mds import *
 from MDSConfig import MDSConfig
+from MDSGraphQLRequest import MDSGraphQLRequest
 from sodapy import Socrata
+from datetime import datetime
 from dateutil import parser, tz
 
 logging.disable(logging.DEBUG)
@@ -28,6 +28,195 @@ logging.disable(logging.DEBUG)
 # Let's initialize our configuration class
 mds_config = MDSConfig()
 
+# The trips are read in pages ordered by (end_time, id), the filters are provided in the $where variable
+query = """
+    query getTrips($where: api_trips_bool_exp!, $limit: Int) {
+      api_trips(
+            where: $where,
+            order_by: [{ end_time: asc }, { id: asc }],
+            limit: $limit
+      ) {
+        trip_id: id
+        device_id: device { id }
+        vehicle_type
+        trip_duration
+        trip_distance
+        start_time
+        end_time
+        modified_date
+        council_district_start
+        council_district_end
+        census_geoid_start
+        census_geoid_end
+      }
+    }
+"""
+
+
+# The time zone of the exported timestamps, loaded once
+CST = tz.gettz("CST")
+
+
+def parse_datetime(timestamp) -> datetime:
+    """
+    Returns a datetime from a PostgreSQL timestamp, the ISO format is parsed natively
+    and any other format is left to dateutil.
+    :param str timestamp: The timestamp
+    :return datetime:
+    """
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return parser.parse(timestamp)
+
+
+def datetime_to_cst(timestamp) -> str:
+    """
+    Returns a datetime in CST timezone
+    :param timestamp:
+    :return:
+    """
+    try:
+        return parse_datetime(timestamp).astimezone(CST)
+    except:
+        return timestamp
+
+
+def parse_datetimes(data) -> dict:
+    """
+    Parses the PostgreSQL datetime with timezone into an insertable
+    socrata timestamp in CST time. It also adds necessary fields,
+    such as year, month, hour and day of the week.
+    :param data:
+    :return:
+    """
+    fmt = "%Y-%m-%dT%H:%M:%S"
+    end_time = datetime_to_cst(data["end_time"])
+    data["start_time"] = datetime_to_cst(data["start_time"]).strftime(fmt)
+    data["end_time"] = end_time.strftime(fmt)
+    data["modified_date"] = datetime_to_cst(data["modified_date"]).strftime(
+        fmt
+    )
+    data["year"] = end_time.year
+    data["month"] = end_time.month
+    data["hour"] = end_time.hour
+    data["day_of_week"] = end_time.weekday()
+    return data
+
+
+def clean_trip(trip) -> dict:
+    """
+    Transforms the device_id field from a dictionary into a string value
+    :param dict trip: The trip dictionary being transformed
+    :return dict:
+    """
+    trip["device_id"] = trip["device_id"]["id"]
+    trip = parse_datetimes(trip)
+    return trip
+
+
+def get_where(time_min, time_max, cursor=None) -> dict:
+    """
+    Returns the filter of a page of trips, the trips after the cursor in the time range.
+    :param str time_min: The minimum time where the trip ended
+    :param str time_max: The maximum time where the trip ended
+    :param tuple cursor: (Optional) The end_time and id of the last trip of the previous page
+    :return dict:
+    """
+    where = {"end_time": {"_gte": time_min, "_lt": time_max}}
+    if cursor is not None:
+        end_time, trip_id = cursor
+        where["_or"] = [
+            {"end_time": {"_gt": end_time}},
+            {"end_time": {"_eq": end_time}, "id": {"_gt": trip_id}},
+        ]
+    return where
+
+
+def get_trip_pages(mds_gql, time_min, time_max, page_size):
+    """
+    Yields the trips of the time range one page at a time, with a keyset cursor on (end_time, id),
+    so every page is an index range scan no matter how deep it is. All the trips are read in a single
+    page if page_size is 0.
+    :param MDSGraphQLRequest mds_gql: The http graphql class
+    :param str time_min: The minimum time where the trip ended
+    :param str time_max: The maximum time where the trip ended
+    :param int page_size: The number of trips per page
+    :return:
+    """
+    cursor = None
+    while True:
+        response = mds_gql.request(
+            query,
+            variables={
+                "where": get_where(time_min, time_max, cursor),
+                "limit": page_size if page_size > 0 else None,
+            }
+        )
+        if "errors" in response:
+            raise Exception(f"get_trip_pages() Error reading trips: {response['errors']}")
+        trips = response["data"]["api_trips"]
+        # Keep the cursor before the trips are handed over, they may be transformed in place
+        last_page = page_size <= 0 or len(trips) < page_size
+        if not last_page:
+            cursor = (trips[-1]["end_time"], trips[-1]["trip_id"])
+        if len(trips) > 0:
+            yield trips
+        if last_page:
+            return
+
+
+def get_trips(mds_gql, time_min, time_max, page_size):
+    """
+    Yields the clean trips of the time range, as the pages arrive.
+    :param MDSGraphQLRequest mds_gql: The http graphql class
+    :param str time_min: The minimum time where the trip ended
+    :param str time_max: The maximum time where the trip ended
+    :param int page_size: The number of trips per page
+    :return:
+    """
+    for trips in get_trip_pages(mds_gql, time_min, time_max, page_size):
+        for trip in trips:
+            yield clean_trip(trip)
+
+
+def get_chunks(trips, chunk_size):
+    """
+    Yields lists of up to chunk_size trips.
+    :param iterable trips: The trips
+    :param int chunk_size: The maximum number of trips per chunk
+    :return:
+    """
+    chunk = []
+    for trip in trips:
+        chunk.append(trip)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def upsert_chunk(client, dataset, chunk, attempts=3) -> dict:
+    """
+    Upserts a chunk of trips into Socrata, trying again after a pause if it fails.
+    Returns the response of Socrata, or None if every attempt failed.
+    :param Socrata client: The Socrata client
+    :param str dataset: The dataset identifier
+    :param list chunk: The trips to be upserted
+    :param int attempts: (Optional) The number of attempts
+    :return dict:
+    """
+    for attempt in range(attempts):
+        try:
+            return client.upsert(dataset, chunk)
+        except Exception as e:
+            print(f"Upsert attempt {attempt + 1} of {attempts} failed: {e}")
+            if attempt + 1 < attempts:
+                time.sleep(2 ** attempt * 5)
+    return None
+
+
 @click.command()
 @click.option(
     "--time-min",
@@ -39,6 +228,18 @@ mds_config = MDSConfig()
     default=None,
     help="The maximum time where the trip ended in format: 'yyyy-mm-dd-hh'",
 )
+@click.option(
+    "--page-size",
+    default=10000,
+    type=int,
+    help="The number of trips read from Hasura per request, 0 reads all of them at once (default: 10000)",
+)
+@click.option(
+    "--chunk-size",
+    default=5000,
+    type=int,
+    help="The number of trips upserted into Socrata per request (default: 5000)",
+)
 def run(**kwargs):
     """
     Runs the program based on the above flags, the values will be passed to kwargs as a dictionary
@@ -54,110 +255,17 @@ def run(**kwargs):
     SOCRATA_KEY_ID = mds_config.get_setting("SOCRATA_KEY_ID", None)
     SOCRATA_KEY_SECRET = mds_config.get_setting("SOCRATA_KEY_SECRET", None)
 
-    HASURA_ENDPOINT = mds_config.get_setting("HASURA_ENDPOINT", None)
-    # Prep Hasura query
-    HASURA_HEADERS = {
-        "Content-Type": "application/json",
-        "X-Hasura-Admin-Secret": mds_config.get_setting("HASURA_ADMIN_KEY", None)
-    }
+    # Prep Hasura client, the response is compressed and can take a while
+    mds_gql = MDSGraphQLRequest(
+        endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
+        http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+        timeout=(10, 3600),
+    )
 
     time_min = kwargs.get("time_min", None)
     time_max = kwargs.get("time_max", None)
-
-
-    query = """
-        query getTrips($timeMin: timestamptz!, $timeMax: timestamptz!) {
-          api_trips(
-                where: {
-                  end_time: { _gte: $timeMin }
-                  _and: { 
-                    end_time: { _lt: $timeMax }
-                  },
-                }
-          ) {
-            trip_id: id
-            device_id: device { id }
-            vehicle_type
-            trip_duration
-            trip_distance
-            start_time
-            end_time
-            modified_date
-            council_district_start
-            council_district_end
-            census_geoid_start
-            census_geoid_end
-          }
-        }
-    """
-
-    response = requests.post(
-        HASURA_ENDPOINT,
-        data=json.dumps({
-            "query": query,
-            "variables": {
-                "timeMin": time_min,
-                "timeMax": time_max,
-            }
-        }),
-        headers=HASURA_HEADERS
-    )
-
-    def datetime_to_cst(timestamp) -> str:
-        """
-        Returns a datetime in CST timezone
-        :param timestamp:
-        :return:
-        """
-        try:
-            return parser.parse(timestamp).astimezone(tz.gettz("CST"))
-        except:
-            return timestamp
-
-    def parse_datetimes(data) -> dict:
-        """
-        Parses the PostgreSQL datetime with timezone into an insertable
-        socrata timestamp in CST time. It also adds necessary fields,
-        such as year, month, hour and day of the week.
-        :param data:
-        :return:
-        """
-        fmt = "%Y-%m-%dT%H:%M:%S"
-        end_time = datetime_to_cst(data["end_time"])
-        data["start_time"] = datetime_to_cst(data["start_time"]).strftime(fmt)
-        data["end_time"] = end_time.strftime(fmt)
-        data["modified_date"] = datetime_to_cst(data["modified_date"]).strftime(
-            fmt
-        )
-        data["year"] = end_time.year
-        data["month"] = end_time.month
-        data["hour"] = end_time.hour
-        data["day_of_week"] = end_time.weekday()
-        return data
-
-    def clean_trip(trip) -> dict:
-        """
-        Transforms the device_id field from a dictionary into a string value
-        :param dict trip: The trip dictionary being transformed
-        :return dict:
-        """
-        trip["device_id"] = trip["device_id"]["id"]
-        trip = parse_datetimes(trip)
-        return trip
-
-    #
-    # Generate the
-    #
-    try:
-        trips = list(map(clean_trip, response.json()["data"]["api_trips"]))
-    except:
-        trips = []
-
-    if len(trips) == 0:
-        print("Nothing to do here, exiting.")
-        exit(0)
-    else:
-        print(f"Total trips to process: {len(trips)}")
+    page_size = max(kwargs.get("page_size", 10000), 0)
+    chunk_size = max(kwargs.get("chunk_size", 5000), 1)
 
     print("Connecting to Socrata")
 
@@ -167,11 +275,28 @@ def run(**kwargs):
         SOCRATA_APP_TOKEN,
         username=SOCRATA_KEY_ID,
         password=SOCRATA_KEY_SECRET,
-        timeout=7200,
+        timeout=600,
     )
 
-    print("Making upsert... this can take a while but not more than 2 hours. Please wait.")
-    client.upsert(SOCRATA_DATASET, trips)
+    print(f"Streaming trips in pages of {page_size} and upserting them in chunks of {chunk_size}...")
+    total_trips = 0
+    failed_trips = 0
+    failed_chunks = []
+    for chunk in get_chunks(get_trips(mds_gql, time_min, time_max, page_size), chunk_size):
+        first, last = chunk[0]["trip_id"], chunk[-1]["trip_id"]
+        response = upsert_chunk(client, SOCRATA_DATASET, chunk)
+        total_trips += len(chunk)
+        if response is None:
+            # Only this chunk is lost, the trips are upserted again in the next run
+            failed_trips += len(chunk)
+            failed_chunks.append(f"{first} ... {last}")
+        print(f"Processed trips: {total_trips}, failed: {failed_trips}")
+
+    client.close()
+
+    if total_trips == 0:
+        print("Nothing to do here, exiting.")
+        exit(0)
 
     # Stop timer and print duration
     end = time.time()
@@ -179,6 +304,10 @@ def run(**kwargs):
     minutes, seconds = divmod(rem, 60)
     print("Finished in: {:0>2}:{:0>2}:{:05.2f}".format(int(hours), int(minutes), seconds))
 
+    if len(failed_chunks) > 0:
+        print(f"The upsert failed for {len(failed_chunks)} chunks, trip ids: {failed_chunks}")
+        exit(1)
+
 
 if __name__ == "__main__":
     run()
@@ -31,6 +31,7 @@ mds_pip = MDSPointInPolygon(mds_config=mds_config)
 mds_gql = MDSGraphQLRequest(
     endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
     http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    pool_size=mds_config.ATD_MDS_MAX_THREADS,
 )
 
 ATD_MDS_DOCKER_IMAGE = "atddocker/atd-mds-etl:local"
@@ -59,6 +60,11 @@ ATD_MDS_DOCKER_IMAGE = "atddocker/atd-mds-etl:local"
     is_flag=True,
     help="Changes the query to process incomplete schedule blocks only.",
 )
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only publishes to socrata the trips modified since the last successful sync, enabled with --incomplete-only.",
+)
 @click.option(
     "--docker-mode",
     is_flag=True,
@@ -116,6 +122,8 @@ def run(**kwargs):
 
     incomplete_only = kwargs.get("incomplete_only", False)
     force = kwargs.get("force", False)
+    # A forced run publishes every trip again
+    incremental = (kwargs.get("incremental", False) or incomplete_only) and not force
     env_file = kwargs.get("env_file", None)
     docker_mode = kwargs.get("docker_mode", False)
     docker_args = kwargs.get("docker_args", "")
@@ -144,6 +152,7 @@ def run(**kwargs):
 
     print(f"Settings: {str(mds_cli.get_config())}")
     print(f"Force: {str(force)}")
+    print(f"Incremental: {str(incremental)}")
     print(f"Parsed Time Start: {mds_cli.parsed_date_time_min}")
     print(f"Parsed Time End: {mds_cli.parsed_date_time_max}")
     print(f"Parsed Interval: {mds_cli.parsed_interval}")
@@ -194,12 +203,13 @@ def run(**kwargs):
             error_log = f"{mds_cli.provider}/{mds_cli.provider}-{block}-{process}-error.log"
             logs_command = (f">> ./logs/{log} 2> ./logs/{error_log}", "")[no_logs]
 
-            command = f'{docker_cmd}./provider_{process}.py --provider "{mds_cli.provider}" ' \
-                f'--time-max "{block}" --interval 1 {force_enabled} {logs_command}'
-
             # Socrata Sync does not support need the --force flag
+            process_flags = force_enabled
             if process == "sync_socrata":
-                command = command.replace("--force", "")
+                process_flags = ("", "--incremental")[incremental]
+
+            command = f'{docker_cmd}./provider_{process}.py --provider "{mds_cli.provider}" ' \
+                f'--time-max "{block}" --interval 1 {process_flags} {logs_command}'
 
             # Check if this is a dry-run
             if dry_run is False:
@@ -7,11 +7,14 @@ from datetime import datetime
 
 from mds import *
 from MDSTrip import MDSTrip
+from MDSTripBatch import MDSTripBatch
+from MDSTripColumns import MDSTripColumns
 from MDSCli import MDSCli
 from MDSConfig import MDSConfig
 from MDSAWS import MDSAWS
 from MDSPointInPolygon import MDSPointInPolygon
 from MDSGraphQLRequest import MDSGraphQLRequest
+from AsyncMDSGraphQLRequest import AsyncMDSGraphQLRequest
 
 logging.disable(logging.DEBUG)
 
@@ -32,10 +35,87 @@ mds_pip = MDSPointInPolygon(
 # Both the CLI and Trips classes will need an http-graphql client
 mds_gql = MDSGraphQLRequest(
     endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
-    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None)
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    pool_size=mds_config.ATD_MDS_MAX_THREADS,
+)
+# The trip upserts are sent with an async client, to keep several requests in flight
+mds_async_gql = AsyncMDSGraphQLRequest(
+    endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    concurrency=mds_config.ATD_MDS_MAX_THREADS,
 )
 
 
+def set_final_status(
+    mds_schedule, schedule_item, trips_count, total_trips, trips_valid, trips_success, trips_error, error_payload
+) -> dict:
+    """
+    Determines the final status of a schedule block and saves it along with the report of the run.
+    :param MDSSchedule mds_schedule: The schedule class instance
+    :param dict schedule_item: The schedule block
+    :param int trips_count: The number of trips in the MDS payload
+    :param int total_trips: The number of trips processed
+    :param int trips_valid: The number of valid trips
+    :param int trips_success: The number of trips inserted
+    :param int trips_error: The number of trips that failed
+    :param dict error_payload: The errors of the failed trips
+    :return dict: The report of the run
+    """
+    trips_report = {
+        "message": "Final Report",
+        "total_trips": total_trips,
+        "trips_valid": trips_valid,
+        "trips_success": trips_success,
+        "trips_error": trips_error,
+    }
+    """
+    Status Types:
+        5,Data insertion succeeded
+        -5,Data insertion failed
+        6,Data insertion completed with errors
+        -6,Data insertion contained all errors
+    """
+    final_status = 0
+    if total_trips == trips_success and trips_error == 0:
+        trips_report["message"] = "Completed without errors"
+        final_status = 5
+
+    if trips_success > 0 and trips_error > 0:
+        trips_report["message"] = "Completed with some errors"
+        final_status = 6
+
+    if total_trips == trips_error:
+        trips_report["message"] = "Completed, but only with errors"
+        final_status = -6
+
+    # If no errors, change trips message and mark for no rerun.
+    if final_status == 5:
+        trips_report["message"] = "The process finished without errors."
+        error_payload["error_count"] = 0
+        rerun_flag = False
+
+    # If we do have errors, mark for rerun
+    else:
+        trips_report["message"] = f"The process finished with error_count: {trips_error}"
+        error_payload["error_count"] = trips_error
+        rerun_flag = True
+
+    print("Updating schedule status...")
+    mds_schedule.set_schedule_status(
+        schedule_id=schedule_item["schedule_id"],
+        status_id=final_status,
+        message=json.dumps(json.dumps(trips_report)),
+        records_processed=trips_success,
+        records_total=total_trips,
+        payload_trips_count=trips_count,
+        records_error_count=trips_error,
+        error_payload=json.dumps(json.dumps(error_payload)),
+        rerun_flag=rerun_flag
+    )
+
+    return trips_report
+
+
 @click.command()
 @click.option(
     "--provider", default=None, help="The provider's name",
@@ -136,10 +216,10 @@ def run(**kwargs):
         )
         # Determine final file path
         s3_trips_file = data_path + "trips.json"
-        # Load the file from S3 into a dictionary called 'trips'
-        trips = mds_aws.load(s3_trips_file)
+        # Stream the trips from S3 into columns, one trip is decoded at a time
+        trip_columns = MDSTripColumns.from_trips(mds_aws.load_items(s3_trips_file))
 
-        trips_count = len(trips["data"]["trips"])
+        trips_count = len(trip_columns)
         print(f"File loaded with trips_count: {trips_count}")
 
         if trips_count == 0:
@@ -165,13 +245,28 @@ def run(**kwargs):
             "errors": [],
         }
 
+        # Resolve the polygons for every start and end point in the file, in parallel
+        print("Resolving trip points...")
+        trip_columns.initialize_points(
+            mds_pip=mds_pip,
+            processes=mds_config.ATD_MDS_MAX_THREADS,
+        )
+
+        # The trips are inserted in batches, the failed ones are still reported one by one
+        mds_trip_batch = MDSTripBatch(
+            mds_gql=mds_gql,
+            batch_size=mds_config.get_setting("HASURA_BATCH_SIZE", 100),
+            mds_async_gql=mds_async_gql,
+        )
+
         # For each trip, we need to build a trip object
-        for trip in trips["data"]["trips"]:
+        for trip in trip_columns:
             mds_trip = MDSTrip(
                 mds_config=mds_config,  # We pass the configuration class
                 mds_pip=mds_pip,  # We pass the point-in-polygon class
                 mds_gql=mds_gql,  # We pass the HTTP GraphQL class
-                trip_data=trip  # We provide this individual trip data
+                trip_data=trip,  # We provide this individual trip data
+                enrich_points=False  # The points were already resolved in batch
             )
 
             # VeoRide isn't fully MDS compliant, so we need to fix its data
@@ -200,70 +295,34 @@ def run(**kwargs):
             # Count if trip is valid
             trips_valid += 1 if valid_trip else 0
 
-            # Try to save it
-            if mds_trip.save():
-                print(f'Processed trip ({total_trips}/{trips_count}): {trip["trip_id"]}')
-                trips_success += 1
-            else:
-                print(f'Error Inserting trip: {trip["trip_id"]}')
-                error_payload["errors"].append({
-                    "description": f'Error Processing trip: {trip["trip_id"]}',
-                    "graphql": mds_trip.generate_gql_insert(),
-                    "response": mds_trip.response
-                })
-                error_payload["error_trip_ids"].append(trip["trip_id"])
-                trips_error += 1
-
-        trips_report = {
-            "message": "Final Report",
-            "total_trips": total_trips,
-            "trips_valid": trips_valid,
-            "trips_success": trips_success,
-            "trips_error": trips_error,
-        }
-        """
-        Status Types:
-            5,Data insertion succeeded
-            -5,Data insertion failed
-            6,Data insertion completed with errors
-            -6,Data insertion contained all errors
-        """
-        final_status = 0
-        if total_trips == trips_success and trips_error == 0:
-            trips_report["message"] = "Completed without errors"
-            final_status = 5
-
-        if trips_success > 0 and trips_error > 0:
-            trips_report["message"] = "Completed with some errors"
-            final_status = 6
-
-        if total_trips == trips_error:
-            trips_report["message"] = "Completed, but only with errors"
-            final_status = -6
-
-        # If no errors, change trips message and mark for no rerun.
-        if final_status == 5:
-            trips_report["message"] = "The process finished without errors."
-            error_payload["error_count"] = 0
-            rerun_flag = False
-
-        # If we do have errors, mark for rerun
-        else:
-            trips_report["message"] = f"The process finished with error_count: {trips_error}"
-            error_payload["error_count"] = trips_error
-            rerun_flag = True
-
-        print("Updating schedule status...")
-        mds_schedule.set_schedule_status(
-            schedule_id=schedule_item["schedule_id"],
-            status_id=final_status,
-            message=json.dumps(json.dumps(trips_report)),
-            records_processed=trips_success,
-            records_total=total_trips,
-            payload_trips_count=len(trips["data"]["trips"]),
-            records_error_count=trips_error,
-            error_payload=json.dumps(json.dumps(error_payload)),
-            rerun_flag=rerun_flag
+            # Queue it, full batches are saved together (invalid trips are recorded as errors)
+            if mds_trip_batch.add(mds_trip) and len(mds_trip_batch.pending) + len(mds_trip_batch.ready) == 0:
+                print(f"Processed trips ({len(mds_trip_batch.get_saved_trip_ids())}/{trips_count})")
+
+        # Save the last batch
+        mds_trip_batch.flush()
+        print(f"Processed trips ({len(mds_trip_batch.get_saved_trip_ids())}/{trips_count})")
+
+        trips_success = len(mds_trip_batch.get_saved_trip_ids())
+        for error in mds_trip_batch.get_errors():
+            print(f'Error Inserting trip: {error["trip_id"]}')
+            error_payload["errors"].append({
+                "description": error["description"],
+                "graphql": error["graphql"],
+                "response": error["response"],
+            })
+            error_payload["error_trip_ids"].append(error["trip_id"])
+            trips_error += 1
+
+        trips_report = set_final_status(
+            mds_schedule=mds_schedule,
+            schedule_item=schedule_item,
+            trips_count=trips_count,
+            total_trips=total_trips,
+            trips_valid=trips_valid,
+            trips_success=trips_success,
+            trips_error=trips_error,
+            error_payload=error_payload,
         )
 
         print("As of this run: ")
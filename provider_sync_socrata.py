@@ -40,7 +40,8 @@ mds_aws = MDSAWS(
 # Both the CLI and Trips classes will need an http-graphql client
 mds_gql = MDSGraphQLRequest(
     endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
-    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None)
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    pool_size=mds_config.ATD_MDS_MAX_THREADS,
 )
 
 
@@ -64,6 +65,12 @@ mds_gql = MDSGraphQLRequest(
     default=None,
     help="The maximum time where the trip ended in format: 'yyyy-mm-dd-hh'",
 )
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only publishes the trips modified since the last successful sync of each schedule block.",
+)
 def run(**kwargs):
     """
         Runs the program based on the above flags, the values will be passed to kwargs as a dictionary
@@ -90,6 +97,9 @@ def run(**kwargs):
     print(f"Parsed Time Min: {mds_cli.parsed_date_time_min}")
     print(f"Parsed Interval: {mds_cli.parsed_interval}")
 
+    incremental = kwargs.get("incremental", False)
+    print(f"Incremental: {incremental}")
+
     # Retrieve the Schedule Class instance
     mds_schedule = mds_cli.initialize_schedule(
         # Default status, it does not matter
@@ -128,11 +138,20 @@ def run(**kwargs):
             mds_gql=mds_gql
         )
 
+        # The latest modified_date published by the last successful sync of this block,
+        # it is kept even if this sync is not incremental
+        watermark = mds_socrata.get_watermark(schedule_item.get("socrata_status", None))
+        if incremental:
+            print(f"Trips modified since: {watermark}")
+
         trips = mds_socrata.get_data(
             time_min=str(tz_time.get_time_start(utc=False)),
-            time_max=str(tz_time.get_time_end(utc=False))
+            time_max=str(tz_time.get_time_end(utc=False)),
+            modified_since=watermark if incremental else None,
         )
 
+        # It needs to be read before the trips are transformed by save()
+        max_modified_date = mds_socrata.get_max_modified_date(trips["data"]["api_trips"])
         saved = mds_socrata.save(data=trips["data"]["api_trips"])
 
         total_errors = saved.get("Errors", -1)
@@ -144,6 +163,13 @@ def run(**kwargs):
         else:
             print("Socrata updates failed: %s" % str(saved))
 
+        # The watermark only moves forward after a successful sync
+        saved[MDSSocrata.WATERMARK_KEY] = mds_socrata.get_next_watermark(
+            watermark=watermark,
+            max_modified_date=max_modified_date,
+            success=total_errors == 0,
+        )
+
         print("Updating schedule status...")
         mds_schedule.set_schedule_status(
             schedule_id=schedule_item["schedule_id"],
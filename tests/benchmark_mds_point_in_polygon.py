@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+"""
+Benchmarks the lookup strategies of MDSPointInPolygon with a seeded set of synthetic
+points in Austin. Each strategy runs in its own process, so that the startup time and the
+peak memory (RSS) are measured in isolation. Usage:
+
+    $ python tests/benchmark_mds_point_in_polygon.py --points 20000 --seed 1
+    $ python tests/benchmark_mds_point_in_polygon.py --strategy batch --strategy raster_batch
+"""
+
+# Basic libraries
+import json
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from parent_directory import *
+
+import click
+import numpy as np
+from shapely.geometry import shape
+
+from MDSConfig import MDSConfig
+from MDSPointInPolygon import MDSPointInPolygon
+from MDSTrip import MDSTrip
+
+logging.disable(logging.DEBUG)
+
+DISTRICTS_FILE = "data/council_districts_simplified.json"
+
+
+class BenchmarkConfig:
+    """
+    The point-in-polygon class only needs the geojson file paths and a few settings,
+    this stands in for MDSConfig so the benchmark runs without AWS credentials.
+    """
+
+    __slots__ = [
+        "ATD_MDS_CENSUS_GEOJSON",
+        "ATD_MDS_DISTRICTS_GEOJSON",
+        "ATD_MDS_HEX_GEOJSON",
+        "ATD_MDS_PIP_CACHE",
+        "settings",
+    ]
+
+    def __init__(self, pip_cache=None, settings=None):
+        self.ATD_MDS_CENSUS_GEOJSON = os.getenv(
+            "ATD_MDS_CENSUS_GEOJSON", "data/census_tracts_2010_simplified_20pct.json"
+        )
+        self.ATD_MDS_DISTRICTS_GEOJSON = os.getenv("ATD_MDS_DISTRICTS_GEOJSON", DISTRICTS_FILE)
+        self.ATD_MDS_HEX_GEOJSON = os.getenv("ATD_MDS_HEX_GEOJSON", "data/hex1000.json")
+        self.ATD_MDS_PIP_CACHE = pip_cache
+        self.settings = settings or {}
+
+    read_json = staticmethod(MDSConfig.read_json)
+
+    def get_setting(self, setting, default):
+        return self.settings.get(setting, default)
+
+
+def generate_points(count, seed=1, outliers=0.05, hubs=200, hub_share=0.7) -> (np.ndarray, np.ndarray):
+    """
+    Returns a seeded set of realistic points: most of them inside the council districts, clustered
+    around a number of hubs (docks, campuses, corridors) with a spread of about 150 m, the rest uniformly
+    distributed, and a share of outliers outside every district, some of them far from Austin.
+    :param int count: The number of points
+    :param int seed: The random seed
+    :param float outliers: The share of points outside the districts
+    :param int hubs: The number of hubs
+    :param float hub_share: The share of the points (inside the districts) around a hub
+    :return (np.ndarray, np.ndarray):
+    """
+    rng = np.random.default_rng(seed)
+    with open(DISTRICTS_FILE) as fin:
+        districts = [shape(feature["geometry"]) for feature in json.load(fin)["features"]]
+    prepared = MDSPointInPolygon.initialize_prepared(districts)
+    bounds = np.array([district.bounds for district in districts])
+    min_x, min_y = bounds[:, 0].min(), bounds[:, 1].min()
+    max_x, max_y = bounds[:, 2].max(), bounds[:, 3].max()
+
+    def inside(longitudes, latitudes) -> np.ndarray:
+        mask = np.zeros(len(longitudes), dtype=bool)
+        for prepared_district in prepared:
+            mask |= MDSPointInPolygon.contains_points(prepared_district, longitudes, latitudes)
+        return mask
+
+    def uniform(total, keep_inside) -> (np.ndarray, np.ndarray):
+        longitudes, latitudes = np.empty(0), np.empty(0)
+        while len(longitudes) < total:
+            x = rng.uniform(min_x, max_x, total * 2)
+            y = rng.uniform(min_y, max_y, total * 2)
+            mask = inside(x, y)
+            mask = mask if keep_inside else ~mask
+            longitudes = np.concatenate((longitudes, x[mask]))
+            latitudes = np.concatenate((latitudes, y[mask]))
+        return longitudes[:total], latitudes[:total]
+
+    total_outliers = int(round(count * outliers))
+    total_inside = count - total_outliers
+    total_hub = int(round(total_inside * hub_share))
+
+    # Hubs are inside the districts, the points around them may spill over a boundary
+    hub_x, hub_y = uniform(hubs, True)
+    picks = rng.integers(0, hubs, total_hub)
+    spread = 150 / 111320
+    around_x = hub_x[picks] + rng.normal(0, spread / math.cos(math.radians(30.3)), total_hub)
+    around_y = hub_y[picks] + rng.normal(0, spread, total_hub)
+    spread_x, spread_y = uniform(total_inside - total_hub, True)
+
+    # Half of the outliers close to the city, the other half anywhere in Texas
+    near_x, near_y = uniform(total_outliers - total_outliers // 2, False)
+    far_x = rng.uniform(-106.6, -93.5, total_outliers // 2)
+    far_y = rng.uniform(25.8, 36.5, total_outliers // 2)
+
+    longitudes = np.round(np.concatenate((around_x, spread_x, near_x, far_x)), 6)
+    latitudes = np.round(np.concatenate((around_y, spread_y, near_y, far_y)), 6)
+    order = rng.permutation(count)
+    return longitudes[order], latitudes[order]
+
+
+def generate_trips(longitudes, latitudes) -> list:
+    """
+    Returns minimal MDS trip dictionaries, using consecutive points as the start and end of each trip.
+    :param np.ndarray longitudes: The longitude (x) values
+    :param np.ndarray latitudes: The latitude (y) values
+    :return list:
+    """
+    coordinates = list(zip(longitudes.tolist(), latitudes.tolist()))
+    return [
+        {
+            "trip_id": str(pos),
+            "route": {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": list(point)}}
+                    for point in coordinates[pos:pos + 2]
+                ],
+            },
+        }
+        for pos in range(0, len(coordinates) - 1, 2)
+    ]
+
+
+def lookup_scalar(mds_pip, longitudes, latitudes) -> list:
+    points = [mds_pip.create_point(x, y) for x, y in zip(longitudes.tolist(), latitudes.tolist())]
+    latencies = []
+    for p in points:
+        start = time.perf_counter_ns()
+        mds_pip.get_census_tract_id(mds_point=p)
+        mds_pip.get_district_id(mds_point=p)
+        mds_pip.get_hex_id(mds_point=p)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def lookup_resolve(mds_pip, longitudes, latitudes) -> list:
+    points = [mds_pip.create_point(x, y) for x, y in zip(longitudes.tolist(), latitudes.tolist())]
+    latencies = []
+    for p in points:
+        start = time.perf_counter_ns()
+        mds_pip.resolve(mds_point=p)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def lookup_batch(mds_pip, longitudes, latitudes, batch_size=1000) -> list:
+    # The latency of a point in a batch is the time of its batch, divided by the size of the batch
+    latencies = []
+    for pos in range(0, len(longitudes), batch_size):
+        start = time.perf_counter_ns()
+        mds_pip.lookup_batch(longitudes[pos:pos + batch_size], latitudes[pos:pos + batch_size])
+        elapsed = time.perf_counter_ns() - start
+        size = min(batch_size, len(longitudes) - pos)
+        latencies.extend([elapsed / size] * size)
+    return latencies
+
+
+def enrich_trips(mds_pip, longitudes, latitudes) -> list:
+    trips = generate_trips(longitudes, latitudes)
+    latencies = []
+    for trip in trips:
+        start = time.perf_counter_ns()
+        MDSTrip(mds_config=None, mds_pip=mds_pip, mds_gql=None, trip_data=trip)
+        elapsed = time.perf_counter_ns() - start
+        # Two points per trip
+        latencies.extend([elapsed / 2, elapsed / 2])
+    return latencies
+
+
+def enrich_trips_batch(mds_pip, longitudes, latitudes) -> list:
+    trips = generate_trips(longitudes, latitudes)
+    start = time.perf_counter_ns()
+    MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=trips)
+    elapsed = time.perf_counter_ns() - start
+    return [elapsed / (len(trips) * 2)] * (len(trips) * 2)
+
+
+# Each strategy: the lookup function, and the arguments of the point-in-polygon class
+STRATEGIES = {
+    "scalar": (lookup_scalar, {}),
+    "scalar_lru": (lookup_scalar, {"lookup_cache_size": 100000}),
+    "resolve": (lookup_resolve, {}),
+    "raster_resolve": (lookup_resolve, {"raster_cell_size": 20}),
+    "batch": (lookup_batch, {}),
+    "raster_batch": (lookup_batch, {"raster_cell_size": 20}),
+    "trip": (enrich_trips, {}),
+    "trip_batch": (enrich_trips_batch, {}),
+}
+
+
+def run_strategy(name, count, seed, pip_cache) -> dict:
+    """
+    Runs a single strategy, this is called in a new process.
+    :param str name: The name of the strategy
+    :param int count: The number of points
+    :param int seed: The random seed
+    :param str pip_cache: The directory of the compiled cache, or None
+    :return dict:
+    """
+    lookup, arguments = STRATEGIES[name]
+    longitudes, latitudes = generate_points(count=count, seed=seed)
+
+    start = time.perf_counter()
+    mds_pip = MDSPointInPolygon(mds_config=BenchmarkConfig(pip_cache=pip_cache), **arguments)
+    mds_pip.load_layers()
+    if name == "resolve" or name == "raster_resolve":
+        mds_pip.get_nesting()
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = np.asarray(lookup(mds_pip, longitudes, latitudes), dtype=np.float64)
+    elapsed = time.perf_counter() - start
+    return {
+        "strategy": name,
+        "points": len(latencies),
+        "points_per_second": len(latencies) / elapsed,
+        "p50_us": float(np.percentile(latencies, 50)) / 1000,
+        "p99_us": float(np.percentile(latencies, 99)) / 1000,
+        "startup_s": startup,
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+@click.command()
+@click.option("--points", default=20000, help="The number of points to look up")
+@click.option("--seed", default=1, help="The random seed of the point generator")
+@click.option(
+    "--strategy",
+    multiple=True,
+    type=click.Choice(list(STRATEGIES.keys())),
+    help="Runs only these strategies, can be repeated (default: all)",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Warms up a compiled cache first, so the startup time is measured with it",
+)
+@click.option("--output", default=None, help="Saves the results to a json file")
+def run(**kwargs):
+    """
+    Runs every strategy in its own process, and prints a report.
+    :param dict kwargs: The values specified by click decorators.
+    :return:
+    """
+    strategies = list(kwargs["strategy"]) or list(STRATEGIES.keys())
+    pip_cache = tempfile.mkdtemp(prefix="atd-mds-pip-benchmark-") if kwargs["cache"] else None
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        if pip_cache:
+            print("Compiling the cache...")
+            with context.Pool(1) as pool:
+                pool.apply(run_strategy, ("raster_batch", 1000, kwargs["seed"], pip_cache))
+
+        for name in strategies:
+            with context.Pool(1) as pool:
+                results.append(
+                    pool.apply(run_strategy, (name, kwargs["points"], kwargs["seed"], pip_cache))
+                )
+            print(
+                "{strategy:<16} {points_per_second:>12,.0f} pts/s   p50 {p50_us:>9.1f} us   "
+                "p99 {p99_us:>9.1f} us   startup {startup_s:>6.2f} s   peak RSS {peak_rss_mb:>7.1f} MB".format(
+                    **results[-1]
+                )
+            )
+    finally:
+        if pip_cache:
+            shutil.rmtree(pip_cache, ignore_errors=True)
+
+    if kwargs["output"]:
+        with open(kwargs["output"], "w") as fout:
+            json.dump(results, fout, indent=2)
+
+
+if __name__ == "__main__":
+    run()
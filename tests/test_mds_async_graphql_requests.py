@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from parent_directory import *
+
+from MDSConfig import MDSConfig
+from AsyncMDSGraphQLRequest import AsyncMDSGraphQLRequest
+
+# Assume the config will work as expected
+mds_config = MDSConfig()
+
+gql_request = AsyncMDSGraphQLRequest(
+    endpoint=mds_config.get_setting("HASURA_ENDPOINT", "n/a"),
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", "n/a"),
+    concurrency=4,
+)
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.encoding = None
+
+
+class FakeSession:
+    """
+    Answers every request offline with the variables it was sent, and keeps
+    the largest number of requests in flight at once.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def post(self, endpoint, params=None, data=None, headers=None, timeout=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        return FakeResponse(json.dumps({"data": json.loads(data)["variables"]}).encode())
+
+    def close(self):
+        pass
+
+
+def get_offline_request(concurrency) -> AsyncMDSGraphQLRequest:
+    mds_gql = AsyncMDSGraphQLRequest(
+        endpoint="http://localhost:1/v1/graphql", http_auth_token="n/a", concurrency=concurrency
+    )
+    mds_gql.mds_http_graphql.session = FakeSession()
+    return mds_gql
+
+
+class TestAsyncMDSGraphQLRequests:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestAsyncMDSGraphQLRequests")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestAsyncMDSGraphQLRequests")
+
+    def test_constructor(self):
+        assert isinstance(gql_request, AsyncMDSGraphQLRequest)
+
+    def test_configuration_settings(self):
+        config = gql_request.get_config()
+        assert isinstance(config, dict) \
+            and config["concurrency"] == 4 \
+            and config["pool_size"] == 4
+
+    def test_run_requests_sync_success_t1(self):
+        responses = gql_request.run_requests_sync(
+            [("query { __typename }", None)] * 8
+        )
+        assert len(responses) == 8 \
+            and all("errors" not in response for response in responses)
+
+    def test_run_requests_sync_fail_t1(self):
+        mds_gql = AsyncMDSGraphQLRequest(
+            endpoint="http://localhost:1/v1/graphql",
+            http_auth_token="n/a",
+            concurrency=2,
+            timeout=1,
+        )
+        responses = mds_gql.run_requests_sync(
+            [("query { __typename }", None)] * 3, return_exceptions=True
+        )
+        mds_gql.close()
+        assert len(responses) == 3 \
+            and all(isinstance(response, Exception) for response in responses)
+
+    def test_run_requests_sync_offline_t1(self):
+        mds_gql = get_offline_request(concurrency=2)
+        responses = mds_gql.run_requests_sync(
+            [("query { __typename }", {"pos": pos}) for pos in range(6)]
+        )
+        max_in_flight = mds_gql.mds_http_graphql.session.max_in_flight
+        mds_gql.close()
+        # The responses are in the order of the requests, at most concurrency in flight
+        assert [response["data"]["pos"] for response in responses] == list(range(6)) \
+            and 1 <= max_in_flight <= 2
+
+    def test_gather_requests_offline_t1(self):
+        mds_gql = get_offline_request(concurrency=2)
+
+        async def run():
+            # From a running event loop, the requests are awaited
+            return await mds_gql.gather_requests([("query { __typename }", {"pos": pos}) for pos in range(3)])
+
+        responses = asyncio.run(run())
+        mds_gql.close()
+        assert [response["data"]["pos"] for response in responses] == [0, 1, 2]
+
+    def test_run_requests_sync_running_loop_fail_t1(self):
+        mds_gql = get_offline_request(concurrency=2)
+
+        async def run():
+            return mds_gql.run_requests_sync([("query { __typename }", None)])
+
+        try:
+            asyncio.run(run())
+            assert False
+        except Exception as e:
+            assert "await gather_requests()" in str(e)
+        finally:
+            mds_gql.close()
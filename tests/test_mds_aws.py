@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import pytest
+import io
 import json
 
 import botocore
@@ -282,3 +283,103 @@ class TestMDSAWS:
         assert json.dumps(json.loads(initial_file_content)) == (
             json.dumps(file_content_decrytpted)
         )
+
+    def test_save_encrypted_legacy_success_t1(self):
+        file_path = "tests/json_save_test_encrypted_legacy.json"
+        document = json.dumps({"data": {"trips": [{"trip_id": "a"}]}})
+        mds_aws.save(file_path=file_path, json_document=document, encrypted=True, stream_encrypted=False)
+        body = mds_aws.client.get_object(Bucket=mds_aws.bucket_name, Key=file_path)["Body"].read().decode()
+        loaded = mds_aws.load(file_path=file_path)
+        mds_aws.delete_file(file_name=file_path)
+        # A single fernet token, as the readers older than the chunked encryption expect
+        assert mds_aws.is_encrypted(body) \
+               and mds_aws.decrypt(body) == document \
+               and loaded == json.loads(document)
+
+    def test_stream_json_items_success_t1(self):
+        document = json.dumps({
+            "version": "0.3.0",
+            "data": {"trips": [{"trip_id": "a", "trip_distance": -2.5e10}, {"trip_id": "b"}, 123]},
+            "links": {"next": None},
+        })
+        # Any chunk size yields the same items
+        for size in [1, 2, 7, 1000]:
+            chunks = [document[pos:pos + size] for pos in range(0, len(document), size)]
+            items = list(mds_aws.stream_json_items(chunks))
+            assert items == [{"trip_id": "a", "trip_distance": -2.5e10}, {"trip_id": "b"}, 123]
+
+    def test_stream_json_items_success_t2(self):
+        items = list(mds_aws.stream_json_items(['{"data": {"trips": []}}']))
+        assert items == []
+
+    def test_stream_json_items_fail_t1(self):
+        with pytest.raises(Exception):
+            list(mds_aws.stream_json_items(['{"data": {"other": []}}']))
+
+    def test_stream_json_items_fail_t2(self):
+        with pytest.raises(Exception):
+            list(mds_aws.stream_json_items(['{"data": {"trips": [{"trip_id": "a"']))
+
+    def test_read_text_chunks_success_t1(self):
+        text = "é€😀" * 100
+        chunks = list(mds_aws.read_text_chunks(io.BytesIO(text.encode("utf-8")), chunk_size=5))
+        assert "".join(chunks) == text
+
+    def test_load_items_success_t1(self):
+        file_path = "tests/json_save_test_items.json"
+        document = json.dumps({"data": {"trips": [{"trip_id": "a"}, {"trip_id": "b"}]}})
+        mds_aws.save(file_path=file_path, json_document=document, encrypted=True)
+        items = list(mds_aws.load_items(file_path=file_path))
+        mds_aws.delete_file(file_name=file_path)
+        assert items == [{"trip_id": "a"}, {"trip_id": "b"}]
+
+    def test_encrypt_stream_success_t1(self):
+        chunks = [b'{"data": {"trips": [', b'{"trip_id": "a"}', b"]}}"]
+        encrypted = b"".join(mds_aws.encrypt_stream(chunks))
+        # It can be decrypted in chunks of any size
+        decrypted = b"".join(
+            mds_aws.decrypt_stream([encrypted[pos:pos + 5] for pos in range(0, len(encrypted), 5)])
+        )
+        assert mds_aws.is_stream_encrypted(encrypted) \
+               and decrypted == b"".join(chunks)
+
+    def test_encrypt_stream_success_t2(self):
+        encrypted = b"".join(mds_aws.encrypt_stream([]))
+        assert b"".join(mds_aws.decrypt_stream([encrypted])) == b""
+
+    def test_decrypt_stream_fail_t1(self):
+        encrypted = bytearray(b"".join(mds_aws.encrypt_stream([b"first chunk", b"second chunk"])))
+        encrypted[-1] ^= 1
+        with pytest.raises(Exception):
+            b"".join(mds_aws.decrypt_stream([bytes(encrypted)]))
+
+    def test_decrypt_stream_fail_t2(self):
+        encrypted = b"".join(mds_aws.encrypt_stream([b"first chunk", b"second chunk"]))
+        # The last frame is dropped
+        truncated = encrypted[:len(encrypted) - (4 + len(b"second chunk") + 16)]
+        with pytest.raises(Exception):
+            b"".join(mds_aws.decrypt_stream([truncated]))
+
+    def test_is_stream_encrypted_fail_t1(self):
+        assert mds_aws.is_stream_encrypted(b'{"data": {}}') is False \
+               and mds_aws.is_stream_encrypted(mds_aws.encrypt("legacy").encode()) is False \
+               and mds_aws.is_stream_encrypted(None) is False
+
+    def test_encrypt_stream_compression_success_t1(self):
+        document = b'{"data": {"trips": [' + b", ".join([b'{"trip_id": "a"}'] * 1000) + b"]}}"
+        encrypted = b"".join(mds_aws.encrypt_stream([document], compression="gzip"))
+        # The codec is recorded in the header, after the version
+        assert encrypted[len(MDSAWS.ENCRYPTION_MAGIC) + 1] == MDSAWS.COMPRESSION_CODECS["gzip"] \
+               and len(encrypted) < len(document) / 10 \
+               and b"".join(mds_aws.decrypt_stream([encrypted])) == document
+
+    def test_encrypt_stream_compression_fail_t1(self):
+        with pytest.raises(Exception):
+            list(mds_aws.encrypt_stream([b"{}"], compression="unknown"))
+
+    def test_decrypt_stream_compression_fail_t1(self):
+        encrypted = bytearray(b"".join(mds_aws.encrypt_stream([b"first chunk"], compression="gzip")))
+        # The codec is authenticated
+        encrypted[len(MDSAWS.ENCRYPTION_MAGIC) + 1] = MDSAWS.COMPRESSION_CODECS[None]
+        with pytest.raises(Exception):
+            b"".join(mds_aws.decrypt_stream([bytes(encrypted)]))
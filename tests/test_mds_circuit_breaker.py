@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import time
+
+from parent_directory import *
+
+from MDSCircuitBreaker import MDSCircuitBreaker
+
+
+class TestMDSCircuitBreaker:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSCircuitBreaker")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSCircuitBreaker")
+
+    def test_constructor_success_t1(self):
+        circuit_breaker = MDSCircuitBreaker(threshold=2, cooldown=1)
+        assert isinstance(circuit_breaker, MDSCircuitBreaker) and circuit_breaker.is_open() is False
+
+    def test_constructor_fail_t1(self):
+        try:
+            MDSCircuitBreaker(threshold=0)
+            assert False
+        except:
+            assert True
+
+    def test_open_success_t1(self):
+        circuit_breaker = MDSCircuitBreaker(threshold=2, cooldown=60)
+        circuit_breaker.record_failure()
+        closed = circuit_breaker.is_open() is False
+        circuit_breaker.record_failure()
+        stats = circuit_breaker.get_stats()
+        assert closed and stats["open"] and stats["trips"] == 1 and stats["failures"] == 2
+
+    def test_close_success_t1(self):
+        circuit_breaker = MDSCircuitBreaker(threshold=1, cooldown=60)
+        circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        assert circuit_breaker.is_open() is False and circuit_breaker.get_stats()["failures"] == 0
+
+    def test_wait_success_t1(self):
+        circuit_breaker = MDSCircuitBreaker(threshold=1, cooldown=0.2)
+        circuit_breaker.record_failure()
+        start = time.monotonic()
+        circuit_breaker.wait()
+        assert time.monotonic() - start >= 0.15 and circuit_breaker.is_open() is False
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import gzip
 import pytest
 
 from parent_directory import *
@@ -31,3 +32,67 @@ class TestMDSGraphQLRequests:
     def test_configuration_settings(self):
         config = gql_request.get_config()
         assert isinstance(config, dict)
+
+    def test_session_success_t1(self):
+        adapter = gql_request.session.get_adapter("https://")
+        assert gql_request.session is not None \
+            and adapter._pool_maxsize == gql_request.pool_size \
+            and gql_request.session.headers["x-hasura-admin-secret"] == gql_request.http_auth_token
+
+    def test_pool_size_success_t1(self):
+        mds_gql = MDSGraphQLRequest(
+            endpoint="http://localhost/v1/graphql",
+            http_auth_token="n/a",
+            pool_size="4",
+            timeout=5,
+        )
+        config = mds_gql.get_config()
+        mds_gql.close()
+        assert config["pool_size"] == 4 and config["timeout"] == 5
+
+    def test_get_backoff_success_t1(self):
+        mds_gql = MDSGraphQLRequest(
+            endpoint="http://localhost/v1/graphql",
+            http_auth_token="n/a",
+            backoff=1,
+            backoff_max=4,
+        )
+        delays = [mds_gql.get_backoff(attempt) for attempt in range(10) for _ in range(10)]
+        mds_gql.close()
+        assert min(delays) >= 0 and max(delays) <= 4
+
+    def test_request_retry_fail_t1(self):
+        mds_gql = MDSGraphQLRequest(
+            endpoint="http://localhost:1/v1/graphql",
+            http_auth_token="n/a",
+            retries=2,
+            backoff=0.01,
+            breaker_threshold=1,
+            breaker_cooldown=0.1,
+            timeout=1,
+        )
+        try:
+            mds_gql.request("query { __typename }")
+            assert False
+        except Exception as e:
+            stats = mds_gql.circuit_breaker.get_stats()
+            mds_gql.close()
+            assert "after 3 attempts" in str(e) and stats["trips"] == 1
+
+    def test_get_body_success_t1(self):
+        payload = {"query": "query { __typename }", "variables": {"objects": [{"trip_id": "a"}] * 100}}
+        body, headers = gql_request.get_body(payload)
+        assert headers is None and MDSGraphQLRequest.loads(body) == payload
+
+    def test_get_body_compressed_success_t1(self):
+        mds_gql = MDSGraphQLRequest(
+            endpoint="http://localhost/v1/graphql",
+            http_auth_token="n/a",
+            compress_threshold=1024,
+        )
+        payload = {"query": "query { __typename }", "variables": {"objects": [{"trip_id": "a"}] * 100}}
+        body, headers = mds_gql.get_body(payload)
+        mds_gql.close()
+        assert headers == {"Content-Encoding": "gzip"} \
+            and len(body) < len(MDSGraphQLRequest.dumps(payload)) \
+            and MDSGraphQLRequest.loads(gzip.decompress(body)) == payload
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Basic libraries
+import json
+
+from parent_directory import *
+
+from MDSHexGrid import MDSHexGrid
+
+with open("data/hex1000.json") as f:
+    hex_geojson = json.load(f)
+
+hex_grid = MDSHexGrid(hex_geojson, label="id")
+
+# Test Locations
+
+loc_airport = {"longitude_x": -97.667019, "latitude_y": 30.202756}
+
+loc_san_antonio_commerce_alamo = {"longitude_x": -98.487268, "latitude_y": 29.423622}
+
+
+class TestMDSHexGrid:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSHexGrid")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSHexGrid")
+
+    def test_constructor_success_t1(self):
+        assert hex_grid.flat_top and len(hex_grid.ids) == len(hex_geojson["features"])
+
+    def test_constructor_fail_t1(self):
+        try:
+            with open("data/council_districts_simplified.json") as f:
+                MDSHexGrid(json.load(f))
+            assert False
+        except:
+            assert True
+
+    def test_constructor_fail_t2(self):
+        # Moving one hexagon off the grid
+        feature = json.loads(json.dumps(hex_geojson["features"][0]))
+        feature["geometry"]["coordinates"][0] = [
+            [x + 0.001, y] for x, y in feature["geometry"]["coordinates"][0]
+        ]
+        try:
+            MDSHexGrid({"features": hex_geojson["features"][1:] + [feature]})
+            assert False
+        except:
+            assert True
+
+    def test_get_position_center_success_t1(self):
+        success = True
+        for pos in [0, 100, 2500, len(hex_geojson["features"]) - 1]:
+            ring = hex_geojson["features"][pos]["geometry"]["coordinates"][0][:6]
+            center_x = sum(x for x, y in ring) / 6
+            center_y = sum(y for x, y in ring) / 6
+            success = success and hex_grid.get_position(center_x, center_y) == pos
+        assert success
+
+    def test_get_position_success_t1(self):
+        position = hex_grid.get_position(
+            loc_airport["longitude_x"], loc_airport["latitude_y"]
+        )
+        assert position >= 0 and hex_grid.ids[position] == "003237"
+
+    def test_get_position_vertex_near_edge_t1(self):
+        x, y = hex_geojson["features"][100]["geometry"]["coordinates"][0][0]
+        assert hex_grid.get_position(x, y) == MDSHexGrid.NEAR_EDGE
+
+    def test_get_position_outside_t1(self):
+        position = hex_grid.get_position(
+            loc_san_antonio_commerce_alamo["longitude_x"],
+            loc_san_antonio_commerce_alamo["latitude_y"],
+        )
+        assert position == MDSHexGrid.OUTSIDE
+
+    def test_get_positions_success_t1(self):
+        longitudes = [loc_airport["longitude_x"], loc_san_antonio_commerce_alamo["longitude_x"]]
+        latitudes = [loc_airport["latitude_y"], loc_san_antonio_commerce_alamo["latitude_y"]]
+        positions = hex_grid.get_positions(longitudes, latitudes)
+        assert list(positions) == [
+            hex_grid.get_position(x, y) for x, y in zip(longitudes, latitudes)
+        ]
+
+    def test_from_state_success_t1(self):
+        restored = MDSHexGrid.from_state(
+            state=json.loads(json.dumps(hex_grid.get_state())), ids=list(hex_grid.ids)
+        )
+        longitudes = [loc_airport["longitude_x"], loc_san_antonio_commerce_alamo["longitude_x"]]
+        latitudes = [loc_airport["latitude_y"], loc_san_antonio_commerce_alamo["latitude_y"]]
+        assert list(restored.get_positions(longitudes, latitudes)) == list(
+            hex_grid.get_positions(longitudes, latitudes)
+        )
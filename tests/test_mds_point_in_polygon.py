@@ -2,6 +2,8 @@
 
 # Basic libraries
 import json
+import shutil
+import tempfile
 from datetime import datetime
 
 # Import MDS Library for the TimeZone class
@@ -9,6 +11,7 @@ from parent_directory import *
 
 from MDSConfig import MDSConfig
 from MDSPointInPolygon import MDSPointInPolygon
+from MDSPolygonCache import MDSPolygonCache
 
 # Assumes MDSConfig and MDSGraphQLRequest work as expected
 mds_config = MDSConfig()
@@ -174,3 +177,266 @@ class TestMDSPointInPolygon:
         hex_id = mds_pip_preloaded.get_hex_id(mds_point=p)
         print(hex_id)
         assert hex_id is None
+
+    def test_prepared_geometries_loaded_success_t1(self):
+        success = (
+            1 == 1
+            and len(mds_pip_preloaded.CENSUS_TRACTS_PREPARED)
+            == len(mds_pip_preloaded.CENSUS_TRACTS_GEOJSON["features"])
+            and len(mds_pip_preloaded.DISTRICTS_PREPARED)
+            == len(mds_pip_preloaded.DISTRICTS_GEOJSON["features"])
+            and len(mds_pip_preloaded.HEX_PREPARED)
+            == len(mds_pip_preloaded.HEX_GEOJSON["features"])
+        )
+        assert success
+
+    def test_point_in_poly_prepared_success_t1(self):
+        p = mds_pip_preloaded.create_point(
+            longitude_x=loc_airport["longitude_x"], latitude_y=loc_airport["latitude_y"]
+        )  # Airport
+        poly_prepared = mds_pip_preloaded.point_in_poly(
+            pt=p,
+            idx=mds_pip_preloaded.HEX_INDEX,
+            polys=mds_pip_preloaded.HEX_GEOJSON,
+            geom_key="geometry",
+            prepared=mds_pip_preloaded.HEX_PREPARED,
+        )
+        poly_plain = mds_pip_preloaded.point_in_poly(
+            pt=p,
+            idx=mds_pip_preloaded.HEX_INDEX,
+            polys=mds_pip_preloaded.HEX_GEOJSON,
+            geom_key="geometry",
+        )
+        assert poly_prepared != {} and poly_prepared == poly_plain
+
+    def test_lookup_batch_success_t1(self):
+        locations = [loc_6th_and_congress, loc_airport, loc_san_antonio_commerce_alamo]
+        results = mds_pip_preloaded.lookup_batch(
+            longitudes=[loc["longitude_x"] for loc in locations],
+            latitudes=[loc["latitude_y"] for loc in locations],
+        )
+        success = 1 == 1
+        for pos, loc in enumerate(locations):
+            p = mds_pip_preloaded.create_point(**loc)
+            success = (
+                success
+                and results["census_tract_id"][pos] == mds_pip_preloaded.get_census_tract_id(mds_point=p)
+                and results["district_id"][pos] == mds_pip_preloaded.get_district_id(mds_point=p)
+                and results["hex_id"][pos] == mds_pip_preloaded.get_hex_id(mds_point=p)
+            )
+        assert success and list(results["district_id"]) == ["9", "2", None]
+
+    def test_lookup_batch_fail_t1(self):
+        try:
+            mds_pip_preloaded.lookup_batch(longitudes=[-97.742803], latitudes=[])
+            assert False
+        except:
+            assert True
+
+    def test_hex_grid_loaded_success_t1(self):
+        assert mds_pip_preloaded.HEX_GRID is not None
+
+    def test_pip_hex_id_grid_matches_index_t1(self):
+        p = mds_pip_preloaded.create_point(
+            longitude_x=loc_airport["longitude_x"], latitude_y=loc_airport["latitude_y"]
+        )  # Airport
+        poly = mds_pip_preloaded.point_in_poly(
+            pt=p,
+            idx=mds_pip_preloaded.HEX_INDEX,
+            polys=mds_pip_preloaded.HEX_GEOJSON,
+            geom_key="geometry",
+            prepared=mds_pip_preloaded.HEX_PREPARED,
+        )
+        assert mds_pip_preloaded.get_hex_id(mds_point=p) == poly["properties"]["id"]
+
+    def test_lazy_loading_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config)
+        ready_before = [mds_pip.is_layer_ready(name) for name in mds_pip.get_layer_names()]
+        p = mds_pip.create_point(**loc_6th_and_congress)
+        district_id = mds_pip.get_district_id(mds_point=p)
+        success = (
+            1 == 1
+            and not any(ready_before)
+            and district_id == "9"
+            and mds_pip.is_layer_ready("districts")
+            and mds_pip.is_layer_ready("census_tracts") is False
+            and mds_pip.is_layer_ready("hexagons") is False
+        )
+        assert success
+
+    def test_lazy_loading_fail_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config, autoload=False)
+        try:
+            mds_pip.get_district_id(mds_point=mds_pip.create_point(**loc_airport))
+            assert False
+        except:
+            assert True
+
+    def test_register_layer_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config)
+        mds_pip.register_layer(
+            name="council_districts",
+            file_path=mds_config.ATD_MDS_DISTRICTS_GEOJSON,
+            label="district_n",
+        )
+        p = mds_pip.create_point(**loc_airport)
+        assert mds_pip.get_layer_id(name="council_districts", mds_point=p) == "2"
+
+    def test_register_layer_raster_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config, raster_cell_size=200)
+        mds_pip.register_layer(
+            name="council_districts",
+            file_path=mds_config.ATD_MDS_DISTRICTS_GEOJSON,
+            label="district_n",
+        )
+        p = mds_pip.create_point(**loc_airport)
+        district_ids = mds_pip.get_layer_ids_batch(
+            name="council_districts", longitudes=[p.x], latitudes=[p.y]
+        )
+        # A layer that is not in the raster does not load the raster, or the default layers
+        success = (
+            1 == 1
+            and mds_pip.get_layer_id(name="council_districts", mds_point=p) == "2"
+            and list(district_ids) == ["2"]
+            and mds_pip.RASTER is None
+            and mds_pip.is_layer_ready("districts") is False
+            and mds_pip.is_layer_ready("census_tracts") is False
+        )
+        assert success
+
+    def test_get_layer_fail_t1(self):
+        try:
+            mds_pip_preloaded.get_layer(name="not_a_layer")
+            assert False
+        except:
+            assert True
+
+    def test_lookup_cache_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config, lookup_cache_size=100)
+        p = mds_pip.create_point(**loc_6th_and_congress)
+        # The cell is cached the second time it is seen, then answered from the cache
+        district_ids = [mds_pip.get_district_id(mds_point=p) for i in range(4)]
+        stats = mds_pip.get_lookup_cache_stats()
+        success = (
+            1 == 1
+            and district_ids == ["9", "9", "9", "9"]
+            and stats["misses"] == 2
+            and stats["hits"] == 2
+            and stats["size"] == 1
+        )
+        assert success
+
+    def test_lookup_cache_boundary_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config, lookup_cache_size=100)
+        # A vertex of a district lies on the boundary, it must never be answered from the cache
+        x, y = mds_pip.DISTRICTS_PREPARED[0].context.boundary.geoms[0].coords[0]
+        p = mds_pip.create_point(longitude_x=x, latitude_y=y)
+        district_ids = [mds_pip.get_district_id(mds_point=p) for i in range(3)]
+        stats = mds_pip.get_lookup_cache_stats()
+        success = (
+            1 == 1
+            and len(set(district_ids)) == 1
+            and district_ids[0] == mds_pip_preloaded.get_district_id(mds_point=p)
+            and stats["hits"] == 0
+            and stats["boundary_hits"] == 1
+        )
+        assert success
+
+    def test_lookup_cache_fail_t1(self):
+        try:
+            MDSPointInPolygon(
+                mds_config=mds_config, lookup_cache_size=100, lookup_cache_precision=-1
+            )
+            assert False
+        except:
+            assert True
+
+    def test_raster_success_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config, raster_cell_size=200)
+        locations = [loc_6th_and_congress, loc_airport, loc_san_antonio_commerce_alamo]
+        longitudes = [loc["longitude_x"] for loc in locations]
+        latitudes = [loc["latitude_y"] for loc in locations]
+        results = mds_pip.lookup_batch(longitudes, latitudes)
+        expected = mds_pip_preloaded.lookup_batch(longitudes, latitudes)
+        p = mds_pip.create_point(**loc_6th_and_congress)
+        success = (
+            1 == 1
+            and mds_pip.get_raster() is not None
+            and mds_pip.get_district_id(mds_point=p) == "9"
+            and all(results[key].tolist() == expected[key].tolist() for key in expected)
+        )
+        assert success
+
+    def test_raster_disabled_t1(self):
+        mds_pip = MDSPointInPolygon(mds_config=mds_config)
+        assert mds_pip.get_raster() is None
+
+    def test_resolve_success_t1(self):
+        success = 1 == 1
+        for loc in [loc_6th_and_congress, loc_airport, loc_san_antonio_commerce_alamo]:
+            p = mds_pip_preloaded.create_point(**loc)
+            success = success and mds_pip_preloaded.resolve(mds_point=p) == {
+                "census_tract_id": mds_pip_preloaded.get_census_tract_id(mds_point=p),
+                "district_id": mds_pip_preloaded.get_district_id(mds_point=p),
+                "hex_id": mds_pip_preloaded.get_hex_id(mds_point=p),
+            }
+        assert success
+
+    def test_resolve_nesting_success_t1(self):
+        nesting = mds_pip_preloaded.get_nesting()
+        hex_count = len(mds_pip_preloaded.HEX_GEOJSON["features"])
+        success = (
+            1 == 1
+            and sorted(nesting.keys()) == ["census_tracts", "districts"]
+            and all(len(entries) == hex_count for entries in nesting.values())
+        )
+        assert success
+
+    def test_resolve_many_success_t1(self):
+        locations = [loc_6th_and_congress, loc_airport, loc_san_antonio_commerce_alamo]
+        points = [mds_pip_preloaded.create_point(**loc) for loc in locations]
+        results = mds_pip_preloaded.resolve_many(points=points)
+        success = (
+            1 == 1
+            and results == [mds_pip_preloaded.resolve(mds_point=p) for p in points]
+            and [result["district_id"] for result in results] == ["9", "2", None]
+            and mds_pip_preloaded.resolve_many(points=[]) == []
+        )
+        assert success
+
+    def test_resolve_fail_t1(self):
+        try:
+            mds_pip_preloaded.resolve(mds_point=None)
+            assert False
+        except:
+            assert True
+
+    def test_polygon_cache_geojson_success_t1(self):
+        cache_dir = tempfile.mkdtemp(prefix="atd-mds-pip-cache-")
+        try:
+            # The first instance compiles the layer, the second one loads it from the cache
+            mds_pip = MDSPointInPolygon(mds_config=mds_config)
+            mds_pip.POLYGON_CACHE = MDSPolygonCache(cache_dir=cache_dir)
+            mds_pip.get_layer(name="districts")
+            mds_pip_cached = MDSPointInPolygon(mds_config=mds_config)
+            mds_pip_cached.POLYGON_CACHE = MDSPolygonCache(cache_dir=cache_dir)
+            p = mds_pip_cached.create_point(**loc_6th_and_congress)
+            district_id = mds_pip_cached.get_district_id(mds_point=p)
+            # The geometries are still returned after a cache hit
+            districts_geojson = mds_pip_cached.get_districts_geojson()
+            poly = mds_pip_cached.point_in_poly(
+                pt=p,
+                idx=mds_pip_cached.DISTRICTS_INDEX,
+                polys=districts_geojson,
+                geom_key="geometry",
+            )
+            success = (
+                1 == 1
+                and district_id == "9"
+                and districts_geojson == mds_config.read_json(file_path=mds_config.ATD_MDS_DISTRICTS_GEOJSON)
+                and all(feature["geometry"] is not None for feature in districts_geojson["features"])
+                and mds_pip_cached.get_polygon_property(poly=poly, label="district_n") == "9"
+            )
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        assert success
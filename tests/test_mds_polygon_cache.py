@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Basic libraries
+import json
+import shutil
+import tempfile
+
+from parent_directory import *
+
+from shapely.geometry import shape
+from MDSPolygonCache import MDSPolygonCache
+
+districts_file = "data/council_districts_simplified.json"
+with open(districts_file) as f:
+    districts_geojson = json.load(f)
+districts_geometries = [shape(feature["geometry"]) for feature in districts_geojson["features"]]
+
+cache_dir = tempfile.mkdtemp(prefix="atd-mds-pip-cache-")
+mds_cache = MDSPolygonCache(cache_dir=cache_dir)
+
+
+class TestMDSPolygonCache:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSPolygonCache")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSPolygonCache")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_constructor_fail_t1(self):
+        try:
+            MDSPolygonCache(cache_dir=None)
+            assert False
+        except:
+            assert True
+
+    def test_load_missing_t1(self):
+        assert mds_cache.load(name="missing", file_path=districts_file) is None
+
+    def test_save_load_success_t1(self):
+        mds_cache.save(
+            name="districts",
+            file_path=districts_file,
+            polygons=districts_geojson,
+            geometries=districts_geometries,
+            metadata={"sample": 1},
+        )
+        layer = mds_cache.load(name="districts", file_path=districts_file)
+        success = (
+            1 == 1
+            and layer is not None
+            and layer["metadata"] == {"sample": 1}
+            and len(layer["geometries"]) == len(districts_geometries)
+            and all(
+                cached.equals(original)
+                for cached, original in zip(layer["geometries"], districts_geometries)
+            )
+            and [f["properties"] for f in layer["geojson"]["features"]]
+            == [f["properties"] for f in districts_geojson["features"]]
+        )
+        assert success
+
+    def test_load_index_success_t1(self):
+        layer = mds_cache.load(name="districts", file_path=districts_file)
+        # 6th and Congress, District 9
+        positions = list(layer["index"].intersection((-97.742803, 30.268048)))
+        districts = [
+            layer["geojson"]["features"][pos]["properties"]["district_n"]
+            for pos in positions
+            if layer["geometries"][pos].intersects(shape({"type": "Point", "coordinates": [-97.742803, 30.268048]}))
+        ]
+        assert districts == ["9"]
+
+    def test_file_hash_success_t1(self):
+        assert mds_cache.get_file_hash(districts_file) == mds_cache.get_file_hash(districts_file)
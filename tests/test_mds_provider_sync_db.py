@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+from parent_directory import *
+
+from provider_sync_db import set_final_status
+
+
+class FakeSchedule:
+    """
+    Keeps the status of the schedule blocks instead of saving it to Hasura
+    """
+    def __init__(self):
+        self.statuses = []
+
+    def set_schedule_status(self, **kwargs):
+        self.statuses.append(kwargs)
+
+
+def get_error_payload() -> dict:
+    return {"error_count": 0, "error_trip_ids": [], "errors": []}
+
+
+class TestProviderSyncDb:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestProviderSyncDb")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestProviderSyncDb")
+
+    def test_set_final_status_success_t1(self):
+        mds_schedule = FakeSchedule()
+        set_final_status(
+            mds_schedule=mds_schedule,
+            schedule_item={"schedule_id": 1},
+            trips_count=3,
+            total_trips=3,
+            trips_valid=3,
+            trips_success=3,
+            trips_error=0,
+            error_payload=get_error_payload(),
+        )
+        status = mds_schedule.statuses[0]
+        assert len(mds_schedule.statuses) == 1 \
+               and status["schedule_id"] == 1 \
+               and status["status_id"] == 5 \
+               and status["payload_trips_count"] == 3 \
+               and status["rerun_flag"] is False
+
+    def test_set_final_status_success_t2(self):
+        mds_schedule = FakeSchedule()
+        trips_report = set_final_status(
+            mds_schedule=mds_schedule,
+            schedule_item={"schedule_id": 1},
+            trips_count=3,
+            total_trips=3,
+            trips_valid=2,
+            trips_success=2,
+            trips_error=1,
+            error_payload=get_error_payload(),
+        )
+        status = mds_schedule.statuses[0]
+        assert status["status_id"] == 6 \
+               and status["records_error_count"] == 1 \
+               and status["rerun_flag"] is True \
+               and trips_report["trips_error"] == 1
+
+    def test_set_final_status_success_t3(self):
+        mds_schedule = FakeSchedule()
+        set_final_status(
+            mds_schedule=mds_schedule,
+            schedule_item={"schedule_id": 1},
+            trips_count=2,
+            total_trips=2,
+            trips_valid=0,
+            trips_success=0,
+            trips_error=2,
+            error_payload=get_error_payload(),
+        )
+        assert mds_schedule.statuses[0]["status_id"] == -6
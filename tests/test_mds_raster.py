@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Basic libraries
+import shutil
+import tempfile
+
+from parent_directory import *
+
+import numpy as np
+from shapely.geometry import box
+from MDSRaster import MDSRaster
+
+# Two squares sharing an edge, and a third one overlapping the second
+squares = [box(-97.75, 30.25, -97.74, 30.26), box(-97.74, 30.25, -97.73, 30.26)]
+overlapping = [box(-97.735, 30.25, -97.725, 30.26)]
+
+mds_raster = MDSRaster.build(layers={"squares": squares, "overlapping": overlapping}, cell_size=50)
+raster_dir = tempfile.mkdtemp(prefix="atd-mds-raster-")
+
+
+class TestMDSRaster:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSRaster")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSRaster")
+        shutil.rmtree(raster_dir, ignore_errors=True)
+
+    def test_build_fail_t1(self):
+        try:
+            MDSRaster.build(layers={"empty": []}, cell_size=50)
+            assert False
+        except:
+            assert True
+
+    def test_get_position_success_t1(self):
+        success = (
+            1 == 1
+            and mds_raster.get_position(0, -97.745, 30.255) == 0
+            and mds_raster.get_position(0, -97.735, 30.255) == 1
+            and mds_raster.get_position(1, -97.745, 30.255) == MDSRaster.OUTSIDE
+        )
+        assert success
+
+    def test_get_position_outside_t1(self):
+        success = (
+            1 == 1
+            and mds_raster.get_position(0, -97.9, 30.255) == MDSRaster.OUTSIDE
+            and mds_raster.get_position(0, -97.745, 30.9) == MDSRaster.OUTSIDE
+        )
+        assert success
+
+    def test_get_position_boundary_t1(self):
+        # On the shared edge, and just next to it
+        success = (
+            1 == 1
+            and mds_raster.get_position(0, -97.74, 30.255) == MDSRaster.BOUNDARY
+            and mds_raster.get_position(0, -97.74001, 30.255) == MDSRaster.BOUNDARY
+            and mds_raster.get_position(0, -97.75, 30.255) == MDSRaster.BOUNDARY
+        )
+        assert success
+
+    def test_get_positions_success_t1(self):
+        longitudes = np.array([-97.745, -97.735, -97.74, -97.9])
+        latitudes = np.array([30.255, 30.255, 30.255, 30.255])
+        positions = mds_raster.get_positions(0, longitudes, latitudes)
+        assert positions.tolist() == [
+            mds_raster.get_position(0, x, y) for x, y in zip(longitudes, latitudes)
+        ]
+
+    def test_save_load_success_t1(self):
+        base_path = f"{raster_dir}/raster"
+        mds_raster.save(base_path)
+        loaded = MDSRaster.load(base_path)
+        success = (
+            1 == 1
+            and isinstance(loaded.values, np.memmap)
+            and loaded.layers == ["squares", "overlapping"]
+            and np.array_equal(loaded.values, mds_raster.values)
+            and loaded.get_band("overlapping") == 1
+        )
+        assert success
+
+    def test_load_missing_t1(self):
+        assert MDSRaster.load(f"{raster_dir}/missing") is None
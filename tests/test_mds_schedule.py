@@ -231,6 +231,25 @@ class TestMDSSchedule:
         print("Update Mutation Query: " + query)
         assert isinstance(gql(query), str)
 
+    def test_update_status_variables_success_t1(self):
+        variables = mds_schedule_tester.get_schedule_update_status_variables(
+            schedule_id=-1,
+            status_id=-1,
+            payload="https://bucket.s3.aws.com/payload.json",
+            message='{"message":"Success"}',
+            quoted='"Already quoted"',
+            encoded=json.dumps(json.dumps({"message": "Line\\nbreak"})),
+        )
+        print("Update Mutation Variables: " + str(variables))
+        assert variables["where"] == {"schedule_id": {"_eq": -1}} \
+               and variables["values"] == {
+                   "status_id": -1,
+                   "payload": "https://bucket.s3.aws.com/payload.json",
+                   "message": '{"message":"Success"}',
+                   "quoted": "Already quoted",
+                   "encoded": '{"message": "Line\\nbreak"}',
+               }
+
     def test_update_status_success_t1(self):
         updated = mds_schedule_tester.set_schedule_status(schedule_id=-1, status_id=-1)
         assert updated == 1
@@ -286,9 +305,10 @@ class TestMDSSchedule:
         )
 
         query = mds_schedule.get_query()
-        print("My good sir, query: " + query)
+        variables = mds_schedule.get_variables()
+        print("My good sir, variables: " + str(variables))
         assert isinstance(gql(query), str) \
-               and "status_id: {_lt: 8}" in gql(query)
+               and variables["where"]["status_id"] == {"_lt": 8}
 
     def test_status_operator_success_t2(self):
         time_min = MDSTimeZone(
@@ -313,9 +333,10 @@ class TestMDSSchedule:
         )
 
         query = mds_schedule.get_query()
-        print("My good sir, query: " + query)
+        variables = mds_schedule.get_variables()
+        print("My good sir, variables: " + str(variables))
         assert isinstance(gql(query), str) \
-               and "status_id: {_eq: 8}" in gql(query)
+               and variables["where"]["status_id"] == {"_eq": 8}
 
     def test_status_operator_success_t3(self):
         time_min = MDSTimeZone(
@@ -339,6 +360,7 @@ class TestMDSSchedule:
         )
 
         query = mds_schedule.get_query()
-        print("My good sir, query: " + query)
+        variables = mds_schedule.get_variables()
+        print("My good sir, variables: " + str(variables))
         assert isinstance(gql(query), str) \
-               and "status_id: {_eq: 0}" in gql(query)
+               and variables["where"]["status_id"] == {"_eq": 0}
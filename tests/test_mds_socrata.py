@@ -63,52 +63,143 @@ class TestMDSSocrata:
         assert isinstance(config, dict)
 
     def test_get_query_success_t1(self):
-        query = mds_socrata.get_query(
+        variables = mds_socrata.get_variables(
             time_min='2020-01-01 00:00:00',
             time_max='2020-02-01 00:00:00'
         )
-        assert 'provider: { provider_name: { _eq: "sample_co" }}' in query \
-               and 'end_time: { _gte: "2020-01-01 00:00:00" }' in query \
-               and '_and: { end_time: { _lt: "2020-02-01 00:00:00" }}' in query
+        assert variables["providerName"] == "sample_co" \
+               and variables["timeMin"] == "2020-01-01 00:00:00" \
+               and variables["timeMax"] == "2020-02-01 00:00:00"
 
     def test_get_query_fail_t1(self):
         try:
-            mds_socrata.get_query(time_min=None, time_max=None)
+            mds_socrata.get_variables(time_min=None, time_max=None)
             assert False
         except:
             assert True
 
     def test_get_query_fail_t2(self):
         try:
-            mds_socrata.get_query(time_min=10, time_max=20)
+            mds_socrata.get_variables(time_min=10, time_max=20)
             assert False
         except:
             assert True
 
     def test_valid_query_success_t1(self):
-        query = mds_socrata.get_query(
-            time_min='2020-01-01 00:00:00',
-            time_max='2020-02-01 00:00:00'
-        )
+        query = mds_socrata.get_query()
         print("GQL: ")
         print(query)
         assert isinstance(gql(query), str)
 
     def test_valid_query_success_t2(self):
-        query = mds_socrata.get_query(
+        query = mds_socrata.get_query()
+        variables = mds_socrata.get_variables(
             time_min='1999-01-01 00:00:00',
             time_max='2999-02-01 00:00:00'
         )
         print("GQL: ")
         print(query)
-        assert isinstance(gql(query), str)
+        assert query == mds_socrata.graphql_query and len(variables) == 3
 
     def test_valid_query_fail_t1(self):
         try:
-            mds_socrata.get_query(
+            mds_socrata.get_variables(
                 time_min=None,
                 time_max=None
             )
             assert False
         except:
             assert True
+
+    def test_merge_results_success_t1(self):
+        merged = MDSSocrata.merge_results([
+            {"Errors": 0, "Rows Created": 10, "Rows Updated": 2, "Rows Deleted": 0, "By SID": 0},
+            {"Errors": 1, "Rows Created": 5, "Rows Updated": 0, "Rows Deleted": 0, "By SID": 0},
+            None,
+        ])
+        assert merged["Errors"] == 1 \
+               and merged["Rows Created"] == 15 \
+               and merged["Rows Updated"] == 2
+
+    def test_chunk_settings_success_t1(self):
+        assert mds_socrata.chunk_size >= 1 \
+               and mds_socrata.max_workers >= 1 \
+               and mds_socrata.attempts >= 1
+
+    def test_transform_success_t1(self):
+        trips = list(mds_socrata.transform([{
+            "trip_id": "t1",
+            "device_id": {"id": "d1"},
+            "start_time": "2020-03-08T07:59:00.123456+00:00",
+            "end_time": "2020-03-08T08:01:00Z",
+            "modified_date": "2020-04-01 10:00:00+00",
+            "council_district_start": None,
+            "council_district_end": "None",
+            "census_geoid_start": "48453",
+            "census_geoid_end": 3,
+        }]))
+        trip = trips[0]
+        assert len(trips) == 1 \
+               and trip["device_id"] == "d1" \
+               and trip["start_time"] == "2020-03-08T07:59:00" \
+               and trip["start_time_us_central"] == "2020-03-08T01:59:00" \
+               and trip["end_time_us_central"] == "2020-03-08T03:01:00" \
+               and trip["modified_date"] == "2020-04-01T10:00:00" \
+               and trip["day_of_week"] == 6 \
+               and trip["council_district_start"] == 0 \
+               and trip["council_district_end"] == 0 \
+               and trip["census_geoid_start"] == "48453"
+
+    def test_parse_datetime_success_t1(self):
+        assert MDSSocrata.parse_datetime("2020-01-01T00:00:00+00:00") \
+               == MDSSocrata.parse_datetime("2020-01-01T00:00:00Z")
+
+    def test_modified_since_query_success_t1(self):
+        query = mds_socrata.get_query(modified_since="2020-01-01T00:00:00+00:00")
+        variables = mds_socrata.get_variables(
+            time_min="2020-01-01 00:00:00",
+            time_max="2020-01-01 01:00:00",
+            modified_since="2020-01-01T00:00:00+00:00",
+        )
+        assert query == mds_socrata.graphql_query_modified_since \
+               and variables["modifiedSince"] == "2020-01-01T00:00:00+00:00"
+
+    def test_modified_since_query_fail_t1(self):
+        try:
+            mds_socrata.get_variables(
+                time_min="2020-01-01 00:00:00",
+                time_max="2020-01-01 01:00:00",
+                modified_since=10,
+            )
+            assert False
+        except:
+            assert True
+
+    def test_get_watermark_success_t1(self):
+        status = json.dumps({"Errors": 0, MDSSocrata.WATERMARK_KEY: "2020-01-01T00:00:00+00:00"})
+        assert MDSSocrata.get_watermark(status) == "2020-01-01T00:00:00+00:00" \
+               and MDSSocrata.get_watermark(json.dumps(status)) == "2020-01-01T00:00:00+00:00" \
+               and MDSSocrata.get_watermark(None) is None \
+               and MDSSocrata.get_watermark("not json") is None
+
+    def test_get_max_modified_date_success_t1(self):
+        assert mds_socrata.get_max_modified_date([
+            {"modified_date": "2020-01-01T10:00:00+00:00"},
+            {"modified_date": "2020-01-01T06:00:00-05:00"},
+            {"modified_date": "2020-01-01T09:00:00+00:00"},
+        ]) == "2020-01-01T06:00:00-05:00" \
+               and mds_socrata.get_max_modified_date([]) is None
+
+    def test_get_next_watermark_success_t1(self):
+        watermark = "2020-01-01T00:00:00+00:00"
+        later = "2020-01-02T00:00:00+00:00"
+        assert MDSSocrata.get_next_watermark(watermark, later, success=True) == later \
+               and MDSSocrata.get_next_watermark(None, later, success=True) == later \
+               and MDSSocrata.get_next_watermark(later, watermark, success=True) == later
+
+    def test_get_next_watermark_fail_t1(self):
+        watermark = "2020-01-01T00:00:00+00:00"
+        # A failed sync, or one that published nothing, keeps the last watermark
+        assert MDSSocrata.get_next_watermark(watermark, "2020-01-02T00:00:00+00:00", success=False) == watermark \
+               and MDSSocrata.get_next_watermark(watermark, None, success=True) == watermark \
+               and MDSSocrata.get_next_watermark(None, None, success=False) is None
@@ -92,6 +92,30 @@ class TestMDSTrip:
         # If the trip is marked as valid, then the test failed.
         assert mds_trip.is_valid() is False
 
+    def test_validator_fail_t2(self):
+        with open("tests/trip_sample_data_valid.json") as f:
+            trip_data = json.load(f)
+        mds_trip = MDSTrip(
+            mds_config=mds_config, mds_pip=mds_pip, mds_gql=mds_gql, trip_data=trip_data
+        )
+        assert mds_trip.is_valid()
+        # The result is kept until the trip is changed
+        mds_trip.set_trip_value("trip_duration", "not a number")
+        assert mds_trip.is_valid() is False \
+               and "trip_duration" in mds_trip.get_validation_errors()
+
+    def test_validator_fast_success_t1(self):
+        with open("tests/trip_sample_data_valid.json") as f:
+            trip_data = json.load(f)
+        mds_trip = MDSTrip(
+            mds_config=mds_config, mds_pip=mds_pip, mds_gql=mds_gql, trip_data=trip_data
+        )
+        # The fast validation agrees with cerberus
+        validator = MDSTrip.get_validator()
+        assert MDSTrip.is_valid_fast(mds_trip.trip_data) == validator.validate(mds_trip.trip_data) \
+               and MDSTrip.is_valid_fast({"trip_id": "a"}) is False \
+               and MDSTrip.get_validator() is validator
+
     def test_generate_gql_insert_success_t1(self):
         with open("tests/trip_sample_data_valid.json") as f:
             trip_data = json.load(f)
@@ -104,6 +128,20 @@ class TestMDSTrip:
         print(query)
         assert isinstance(gql(query), str)
 
+    def test_generate_gql_insert_variables_success_t1(self):
+        with open("tests/trip_sample_data_valid.json") as f:
+            trip_data = json.load(f)
+
+        mds_trip = MDSTrip(
+            mds_config=mds_config, mds_pip=mds_pip, mds_gql=mds_gql, trip_data=trip_data
+        )
+        variables = mds_trip.generate_gql_insert_variables()
+        print("Variables: ")
+        print(json.dumps(variables))
+        assert len(variables["objects"]) == 1 \
+            and variables["objects"][0]["trip_id"] == trip_data["trip_id"] \
+            and isinstance(variables["objects"][0]["start_latitude"], float)
+
     def test_search_success_t1(self):
         with open("tests/trip_sample_data_valid.json") as f:
             trip_data = json.load(f)
@@ -192,6 +230,25 @@ class TestMDSTrip:
         )
         assert success
 
+    def test_initialize_points_batch_success_t1(self):
+        trips = []
+        for file_name in ["valid", "valid_long", "valid_short"]:
+            with open(f"tests/trip_sample_data_{file_name}.json") as f:
+                trips.append(json.load(f))
+
+        expected = [
+            MDSTrip(
+                mds_config=mds_config, mds_pip=mds_pip, mds_gql=mds_gql, trip_data=json.loads(json.dumps(trip))
+            ).trip_data
+            for trip in trips
+        ]
+        enriched = MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=trips)
+        assert enriched == 3 and trips == expected
+
+    def test_initialize_points_batch_fail_t1(self):
+        trips = [{"trip": "data"}, None]
+        assert MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=trips) == 0
+
     def test_get_trip_by_id_success_t1(self):
         trip_id = "b3ca5c86-7f45-4544-bf58-111111111111"
         trips = MDSTrip.get_trip_by_id(mds_gql=mds_gql, trip_id=trip_id)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# Basic libraries
+import json
+import uuid
+
+from parent_directory import *
+
+from MDSConfig import MDSConfig
+from MDSTrip import MDSTrip
+from MDSTripBatch import MDSTripBatch
+from MDSPointInPolygon import MDSPointInPolygon
+from MDSGraphQLRequest import MDSGraphQLRequest
+from AsyncMDSGraphQLRequest import AsyncMDSGraphQLRequest
+
+# Assumes MDSConfig works as expected
+mds_config = MDSConfig()
+mds_pip = MDSPointInPolygon(mds_config=mds_config, autoload=True)
+mds_gql = MDSGraphQLRequest(
+    endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+)
+mds_async_gql = AsyncMDSGraphQLRequest(
+    endpoint=mds_config.get_setting("HASURA_ENDPOINT", None),
+    http_auth_token=mds_config.get_setting("HASURA_ADMIN_KEY", None),
+    concurrency=2,
+)
+
+
+def load_trip(file_name) -> MDSTrip:
+    with open(f"tests/trip_sample_data_{file_name}.json") as f:
+        trip_data = json.load(f)
+    return MDSTrip(mds_config=mds_config, mds_pip=mds_pip, mds_gql=mds_gql, trip_data=trip_data)
+
+
+def load_trips(total, file_name="valid") -> list:
+    """
+    Returns valid trips, each one with a different trip_id
+    """
+    trips = []
+    for i in range(total):
+        mds_trip = load_trip(file_name)
+        mds_trip.set_trip_value("trip_id", str(uuid.UUID(int=i + 1)))
+        trips.append(mds_trip)
+    return trips
+
+
+class FakeGraphQLRequest:
+    """
+    Answers the insert mutations offline: a batch fails if it contains one of the failing
+    trip ids, and every request raises if transport_error is True.
+    """
+    def __init__(self, failing_trip_ids=None, transport_error=False):
+        self.failing_trip_ids = set(failing_trip_ids or [])
+        self.transport_error = transport_error
+        self.batches = []
+
+    def request(self, query, variables=None):
+        trip_ids = [insert_object["trip_id"] for insert_object in variables["objects"]]
+        self.batches.append(trip_ids)
+        if self.transport_error:
+            raise Exception("Connection refused")
+        if self.failing_trip_ids.intersection(trip_ids):
+            return {"errors": [{"message": "Invalid trip", "extensions": {"code": "data-exception"}}]}
+        return {"data": {"insert_api_trips": {"affected_rows": len(trip_ids)}}}
+
+
+class TestMDSTripBatch:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSTripBatch")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSTripBatch")
+
+    def test_constructor_success_t1(self):
+        mds_trip_batch = MDSTripBatch(mds_gql=mds_gql, batch_size=10)
+        assert isinstance(mds_trip_batch, MDSTripBatch) and mds_trip_batch.batch_size == 10
+
+    def test_constructor_fail_t1(self):
+        try:
+            MDSTripBatch(mds_gql=mds_gql, batch_size=0)
+            assert False
+        except:
+            assert True
+
+    def test_flush_empty_t1(self):
+        mds_trip_batch = MDSTripBatch(mds_gql=mds_gql)
+        assert mds_trip_batch.flush() == 0 and mds_trip_batch.requests == 0
+
+    def test_get_insert_object_success_t1(self):
+        insert_object = load_trip("valid").get_insert_object()
+        success = (
+            1 == 1
+            and sorted(insert_object.keys())
+            == sorted(MDSTrip.insert_quoted_fields + MDSTrip.insert_number_fields)
+            and insert_object["trip_distance"] == "1879"
+            and insert_object["start_latitude"] == 30.2667
+            and insert_object["council_district_start"] == "9"
+        )
+        assert success
+
+    def test_add_invalid_t1(self):
+        mds_trip_batch = MDSTripBatch(mds_gql=mds_gql)
+        added = mds_trip_batch.add(load_trip("not_valid"))
+        errors = mds_trip_batch.get_errors()
+        success = (
+            1 == 1
+            and added is False
+            and len(errors) == 1
+            and mds_trip_batch.requests == 0
+            and len(mds_trip_batch.pending) == 0
+        )
+        assert success
+
+    def test_save_success_t1(self):
+        # The sample trips share the same trip_id, so each one is sent in its own batch
+        mds_trip_batch = MDSTripBatch(mds_gql=mds_gql, batch_size=2)
+        for file_name in ["valid", "valid_long", "valid_short"]:
+            mds_trip_batch.add(load_trip(file_name))
+        mds_trip_batch.flush()
+        success = (
+            1 == 1
+            and len(mds_trip_batch.get_saved_trip_ids()) == 3
+            and len(mds_trip_batch.get_errors()) == 0
+            and mds_trip_batch.requests == 3
+        )
+        assert success
+
+    def test_get_concurrency_success_t1(self):
+        assert MDSTripBatch(mds_gql=mds_gql).get_concurrency() == 1 \
+            and MDSTripBatch(mds_gql=mds_gql, mds_async_gql=mds_async_gql).get_concurrency() == 2
+
+    def test_save_async_success_t1(self):
+        mds_trip_batch = MDSTripBatch(mds_gql=mds_gql, batch_size=1, mds_async_gql=mds_async_gql)
+        for file_name in ["valid", "valid_long", "valid_short"]:
+            mds_trip_batch.add(load_trip(file_name))
+        mds_trip_batch.flush()
+        success = (
+            1 == 1
+            and len(mds_trip_batch.get_saved_trip_ids()) == 3
+            and len(mds_trip_batch.get_errors()) == 0
+            and len(mds_trip_batch.ready) == 0
+        )
+        assert success
+
+    def test_save_bisect_success_t1(self):
+        mds_trips = load_trips(8)
+        failing_trip_ids = [mds_trips[2].get_trip_value("trip_id"), mds_trips[5].get_trip_value("trip_id")]
+        fake_gql = FakeGraphQLRequest(failing_trip_ids=failing_trip_ids)
+        mds_trip_batch = MDSTripBatch(mds_gql=fake_gql, batch_size=8)
+        for mds_trip in mds_trips:
+            mds_trip_batch.add(mds_trip)
+        mds_trip_batch.flush()
+        # The batch is split until only the failing trips are left
+        success = (
+            1 == 1
+            and sorted(error["trip_id"] for error in mds_trip_batch.get_errors()) == sorted(failing_trip_ids)
+            and len(mds_trip_batch.get_saved_trip_ids()) == 6
+            and not set(failing_trip_ids).intersection(mds_trip_batch.get_saved_trip_ids())
+            and fake_gql.batches[0] == [mds_trip.get_trip_value("trip_id") for mds_trip in mds_trips]
+            and all([failing_trip_id] in fake_gql.batches for failing_trip_id in failing_trip_ids)
+        )
+        assert success
+
+    def test_save_transport_error_t1(self):
+        fake_gql = FakeGraphQLRequest(transport_error=True)
+        mds_trip_batch = MDSTripBatch(mds_gql=fake_gql, batch_size=4)
+        for mds_trip in load_trips(4):
+            mds_trip_batch.add(mds_trip)
+        mds_trip_batch.flush()
+        errors = mds_trip_batch.get_errors()
+        # The batch is not split if the database could not be reached
+        success = (
+            1 == 1
+            and len(fake_gql.batches) == 1
+            and len(errors) == 4
+            and len(mds_trip_batch.get_saved_trip_ids()) == 0
+            and all(MDSTripBatch.is_transport_error(error["response"]) for error in errors)
+        )
+        assert success
+
+    def test_add_duplicate_trip_id_t1(self):
+        fake_gql = FakeGraphQLRequest()
+        mds_trip_batch = MDSTripBatch(mds_gql=fake_gql, batch_size=10)
+        mds_trips = load_trips(3)
+        # The same trip_id as the first trip, the pending trips are sent before it is added
+        mds_trips.append(load_trips(1)[0])
+        for mds_trip in mds_trips:
+            mds_trip_batch.add(mds_trip)
+        batches_before_flush = len(fake_gql.batches)
+        mds_trip_batch.flush()
+        trip_ids = [mds_trip.get_trip_value("trip_id") for mds_trip in mds_trips]
+        success = (
+            1 == 1
+            and batches_before_flush == 1
+            and fake_gql.batches == [trip_ids[:3], trip_ids[3:]]
+            and mds_trip_batch.get_saved_trip_ids() == trip_ids
+        )
+        assert success
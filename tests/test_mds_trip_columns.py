@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Basic libraries
+import json
+import math
+
+from parent_directory import *
+
+from MDSConfig import MDSConfig
+from MDSTrip import MDSTrip
+from MDSTripColumns import MDSTripColumns
+from MDSPointInPolygon import MDSPointInPolygon
+
+# Assumes MDSConfig works as expected
+mds_config = MDSConfig()
+mds_pip = MDSPointInPolygon(mds_config=mds_config, autoload=True)
+
+
+def load_trip_data(file_name) -> dict:
+    with open(f"tests/trip_sample_data_{file_name}.json") as f:
+        return json.load(f)
+
+
+class TestMDSTripColumns:
+    @classmethod
+    def setup_class(cls):
+        print("Beginning tests for: TestMDSTripColumns")
+
+    @classmethod
+    def teardown_class(cls):
+        print("All tests finished for: TestMDSTripColumns")
+
+    def test_from_trips_success_t1(self):
+        trip_columns = MDSTripColumns.from_trips(
+            [load_trip_data("valid"), load_trip_data("valid_long"), load_trip_data("valid_short")]
+        )
+        assert len(trip_columns) == 3 \
+               and len(list(trip_columns)) == 3 \
+               and len(trip_columns.raw) == 0
+
+    def test_get_trip_success_t1(self):
+        trip_data = load_trip_data("valid")
+        trip_columns = MDSTripColumns.from_trips([json.loads(json.dumps(trip_data))])
+        trip = trip_columns.get_trip(0)
+        features = trip_data["route"]["features"]
+        # Every field is the same, the route only keeps its first and last points
+        assert all(trip[field] == trip_data[field] for field in trip_data if field != "route") \
+               and len(trip["route"]["features"]) == 2 \
+               and trip["route"]["features"][0]["geometry"]["coordinates"] == features[0]["geometry"]["coordinates"][:2] \
+               and trip["route"]["features"][1]["geometry"]["coordinates"] == features[-1]["geometry"]["coordinates"][:2]
+
+    def test_get_trip_success_t2(self):
+        trip_data = load_trip_data("valid")
+        trip_data["trip_duration"] = 15
+        trip_data["trip_distance"] = 20.5
+        trip_data["standard_cost"] = None
+        trip = MDSTripColumns.from_trips([trip_data]).get_trip(0)
+        # The numbers keep their type
+        assert isinstance(trip["trip_duration"], int) \
+               and isinstance(trip["trip_distance"], float) \
+               and trip["standard_cost"] is None
+
+    def test_get_trip_fail_t1(self):
+        trip_data = load_trip_data("valid")
+        trip_data["trip_duration"] = "not a number"
+        trip_columns = MDSTripColumns.from_trips([load_trip_data("valid"), trip_data])
+        # The trips that do not fit the columns are kept as they are
+        assert len(trip_columns.raw) == 1 \
+               and trip_columns.get_trip(1) is trip_data
+
+    def test_get_column_success_t1(self):
+        trip_data = load_trip_data("valid")
+        trip_data["standard_cost"] = None
+        trip_columns = MDSTripColumns.from_trips([load_trip_data("valid"), trip_data])
+        column = trip_columns.get_column("standard_cost")
+        assert len(column) == 2 and math.isnan(column[1])
+
+    def test_initialize_points_success_t1(self):
+        trip_columns = MDSTripColumns.from_trips([load_trip_data("valid"), load_trip_data("valid_long")])
+        enriched = trip_columns.initialize_points(mds_pip=mds_pip)
+        trips = list(trip_columns)
+        assert enriched == 2 \
+               and all(MDSTrip(
+                   mds_config=mds_config, mds_pip=mds_pip, mds_gql=None, trip_data=trip, enrich_points=False
+               ).is_valid() for trip in trips)
+
+    def test_initialize_points_success_t2(self):
+        trip_data = [load_trip_data("valid"), load_trip_data("valid_long")]
+        trip_columns = MDSTripColumns.from_trips(json.loads(json.dumps(trip_data)))
+        trip_columns.initialize_points(mds_pip=mds_pip)
+        MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=trip_data)
+        # The same values as the trip dictionaries
+        assert all(
+            trip[field] == original[field]
+            for trip, original in zip(trip_columns, trip_data)
+            for field in MDSTrip.enriched_fields
+        )
+
+    def test_initialize_points_success_t3(self):
+        trip_data = [load_trip_data(file_name) for file_name in ["valid", "valid_long", "valid_short"] * 3]
+        trip_columns = MDSTripColumns.from_trips(json.loads(json.dumps(trip_data)))
+        # Several chunks of points, resolved by a pool of processes if there is more than one cpu
+        enriched = trip_columns.initialize_points(mds_pip=mds_pip, processes=2, chunk_size=2)
+        expected = MDSTrip.initialize_points_batch(mds_pip=mds_pip, trips=trip_data)
+        assert enriched == expected \
+               and all(
+                   trip[field] == original[field]
+                   for trip, original in zip(trip_columns, trip_data)
+                   for field in MDSTrip.enriched_fields
+               )
+
+    def test_get_size_success_t1(self):
+        trip_columns = MDSTripColumns.from_trips([load_trip_data("valid") for i in range(10)])
+        assert 0 < trip_columns.get_size() < len(json.dumps(load_trip_data("valid"))) * 10